@@ -0,0 +1,615 @@
+# allocation.py - Vectorized vote allocation engine
+import secrets
+import time
+import tracemalloc
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import BooleanField, Count, DateTimeField, F, FloatField, Func, IntegerField, Sum, Value
+from django.utils import timezone
+
+from .models import PollingUnit, VoteAllocation, AllocatedResult, AllocationJob, AllocationSummary, AllocationRollup
+from .locks import acquire_lock, new_lock_owner, release_lock
+
+# Party codes in column order; each has a <code>_percentage field on
+# VoteAllocation and a <code>_votes field on AllocatedResult
+PARTY_CODES = [
+    'aa', 'ad', 'adc', 'apc', 'lp', 'pdp', 'nrm', 'nnpp', 'prp', 'sdp',
+    'ypp', 'yp', 'zlp', 'a', 'aac', 'adp', 'apm', 'apga', 'app', 'bp',
+]
+VOTE_FIELDS = [f'{code}_votes' for code in PARTY_CODES]
+
+DEFAULT_RESULT_BATCH_SIZE = 5000
+
+# Held by the one request storing a summary on first read; concurrent first
+# reads sum the results without storing them rather than race its writes
+SUMMARY_LOCK = 'summary'
+
+# Realistic variation: turnout range applied to PVCs collected, the +/- swing
+# applied to each party's share, and how many consecutive unit ids share one
+# random stream (so a unit's draws depend only on the seed and its id)
+TURNOUT_RANGE = (0.75, 0.95)
+VARIATION_RANGE = 0.10
+RANDOM_BLOCK_SIZE = 1024
+
+
+def get_result_batch_size():
+    """Rows written per batch when saving results, configurable via RESULT_BATCH_SIZE"""
+    return getattr(settings, 'RESULT_BATCH_SIZE', DEFAULT_RESULT_BATCH_SIZE)
+
+
+def percentage_vector(allocation):
+    """The allocation's 20 party percentages as a float64 array in PARTY_CODES order"""
+    return np.array([getattr(allocation, f'{code}_percentage') for code in PARTY_CODES], dtype=np.float64)
+
+
+SEED_LIMIT = 2 ** 31  # seeds are stored in an IntegerField
+
+
+def new_seed():
+    """A fresh seed for the realistic variation method"""
+    return secrets.randbelow(SEED_LIMIT)
+
+
+def parse_seed(value):
+    """A seed from user input as an int, or None when blank; ValueError when out of range"""
+    if value in (None, ''):
+        return None
+    seed = int(value)
+    if not 0 <= seed < SEED_LIMIT:
+        raise ValueError(f'Seed must be a whole number between 0 and {SEED_LIMIT - 1}')
+    return seed
+
+
+def base_field(allocation):
+    """PollingUnit field an allocation's votes are computed from"""
+    if allocation.method == VoteAllocation.METHOD_REALISTIC:
+        return 'pvc_collected'
+    return 'pvc_45_percent'
+
+
+def load_base_votes(field='pvc_45_percent'):
+    """
+    Load the ids and base votes (pvc_45_percent unless another field is
+    given) of every polling unit that has votes, as two aligned arrays.
+    """
+    rows = PollingUnit.objects.filter(**{f'{field}__gt': 0}).order_by('id').values_list('id', field)
+    data = np.array(list(rows), dtype=np.float64).reshape(-1, 2)
+    return data[:, 0].astype(np.int64), data[:, 1]
+
+
+def compute_truncated_votes(base_votes, percentages):
+    """
+    Units x parties vote matrix using the original rule
+    int(base_votes * (percentage / 100)) for every cell. The multiplication
+    order matches the Python loop exactly so results are bit-identical.
+    Percentages may also be a units x parties matrix, one row per unit.
+    """
+    shares = np.asarray(percentages, dtype=np.float64) / 100
+    return np.trunc(np.asarray(base_votes, dtype=np.float64)[:, None] * shares)
+
+
+def compute_largest_remainder_votes(base_votes, percentages):
+    """
+    Units x parties vote matrix using largest-remainder (Hamilton)
+    apportionment, so every row sums to its rounded base exactly. Each party
+    gets the floor of its quota, then the votes left over go one each to the
+    parties with the largest fractional parts (ties go to the earlier party
+    in PARTY_CODES). Percentages are scaled by their own total, so the row
+    totals stay exact even when an allocation does not add up to 100.
+    Percentages may also be a units x parties matrix, one row per unit.
+    """
+    base = np.rint(np.asarray(base_votes, dtype=np.float64))
+    percentages = np.asarray(percentages, dtype=np.float64)
+    totals = percentages.sum(axis=-1, keepdims=True)
+    has_share = (totals > 0).reshape(-1)
+
+    quotas = base[:, None] * (percentages / np.where(totals > 0, totals, 1))
+    votes = np.floor(quotas)
+    # Parties with no share never get a leftover vote
+    remainders = np.where(percentages <= 0, -1.0, quotas - votes)
+    leftover = np.where(has_share, np.clip(base - votes.sum(axis=1), 0, None), 0)
+
+    # Rank each row's remainders, largest first, and top up the first `leftover` parties
+    order = np.argsort(-remainders, axis=1, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.broadcast_to(np.arange(votes.shape[1]), order.shape), axis=1)
+    votes += ranks < leftover[:, None]
+    return votes
+
+
+def variation_draws(seed, unit_ids, parties):
+    """
+    Turnout rates and per-party variation for the given (sorted) unit ids.
+    Ids are split into blocks of RANDOM_BLOCK_SIZE and every block has its
+    own generator seeded with (seed, block), so a unit gets the same draws
+    however the units are chunked, filtered or sharded. The seed may be a
+    tuple such as (seed, draw) for repeated independent draws.
+    """
+    seed = [int(value) for value in np.atleast_1d(seed)]
+    unit_ids = np.asarray(unit_ids, dtype=np.int64)
+    turnout = np.empty(len(unit_ids))
+    variation = np.empty((len(unit_ids), parties))
+    if not len(unit_ids):
+        return turnout, variation
+    blocks = unit_ids // RANDOM_BLOCK_SIZE
+    edges = np.flatnonzero(np.diff(blocks)) + 1
+    for start, stop in zip(np.r_[0, edges], np.r_[edges, len(unit_ids)]):
+        rng = np.random.default_rng([*seed, int(blocks[start])])
+        block_turnout = rng.uniform(*TURNOUT_RANGE, RANDOM_BLOCK_SIZE)
+        block_variation = rng.uniform(-VARIATION_RANGE, VARIATION_RANGE, (RANDOM_BLOCK_SIZE, parties))
+        offsets = unit_ids[start:stop] % RANDOM_BLOCK_SIZE
+        turnout[start:stop] = block_turnout[offsets]
+        variation[start:stop] = block_variation[offsets]
+    return turnout, variation
+
+
+def compute_realistic_votes(base_votes, percentages, turnout, variation):
+    """
+    Units x parties vote matrix with simulated turnout and per-party swing,
+    the vectorized form of the old per-unit random loop: turnout is taken
+    from the base, each non-zero target is varied and rounded, the
+    difference to the turnout goes to each unit's leading party, and
+    negative counts are clipped to zero.
+    """
+    actual = np.trunc(np.asarray(base_votes, dtype=np.float64) * turnout)
+    targets = actual[:, None] * (np.asarray(percentages, dtype=np.float64) / 100)[None, :]
+    votes = np.where(targets == 0, 0.0, np.maximum(0.0, np.round(targets * (1 + variation))))
+    leading = votes.argmax(axis=1)
+    rows = np.arange(len(votes))
+    votes[rows, leading] += actual - votes.sum(axis=1)
+    return np.maximum(votes, 0.0)
+
+
+# Vote matrix function for each deterministic VoteAllocation.method
+ALLOCATION_METHODS = {
+    VoteAllocation.METHOD_TRUNCATE: compute_truncated_votes,
+    VoteAllocation.METHOD_LARGEST_REMAINDER: compute_largest_remainder_votes,
+}
+
+
+def make_vote_function(method, percentages, seed=None):
+    """
+    Function (unit_ids, base_votes) -> vote matrix for a method, built from
+    plain values so worker processes can recreate it.
+    """
+    percentages = np.asarray(percentages, dtype=np.float64)
+    if method == VoteAllocation.METHOD_REALISTIC:
+        def compute_votes(unit_ids, base_votes):
+            turnout, variation = variation_draws(seed, unit_ids, len(percentages))
+            return compute_realistic_votes(base_votes, percentages, turnout, variation)
+        return compute_votes
+
+    compute = ALLOCATION_METHODS.get(method, compute_truncated_votes)
+    return lambda unit_ids, base_votes: compute(base_votes, percentages)
+
+
+def ensure_seed(allocation):
+    """Give a realistic allocation a seed the first time it is computed"""
+    if allocation.method == VoteAllocation.METHOD_REALISTIC and allocation.seed is None:
+        allocation.seed = new_seed()
+        allocation.save(update_fields=['seed'])
+    return allocation.seed
+
+
+def vote_function(allocation):
+    """
+    Function (unit_ids, base_votes) -> vote matrix for the allocation's
+    method. Seeds realistic allocations that do not have a seed yet.
+    """
+    ensure_seed(allocation)
+    return make_vote_function(allocation.method, percentage_vector(allocation), allocation.seed)
+
+
+class ResultWriter:
+    """
+    Save AllocatedResult rows from any iterable in fixed-size batches inside
+    one transaction, so only one batch of model instances is alive at a time.
+    Set trace_memory to record the Python heap peak while writing (tracing
+    slows allocation-heavy code down, so it is off by default).
+    """
+
+    def __init__(self, batch_size=None, trace_memory=False):
+        self.batch_size = batch_size or get_result_batch_size()
+        self.trace_memory = trace_memory
+        self.rows_written = 0
+        self.batches = 0
+        self.elapsed = 0.0
+        self.peak_memory = None  # bytes, only when trace_memory is set
+
+    @property
+    def rows_per_second(self):
+        if self.elapsed <= 0:
+            return 0.0
+        return self.rows_written / self.elapsed
+
+    def write(self, results):
+        started = time.perf_counter()
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        try:
+            results = iter(results)
+            with transaction.atomic():
+                while True:
+                    batch = list(islice(results, self.batch_size))
+                    if not batch:
+                        break
+                    AllocatedResult.objects.bulk_create(batch)
+                    self.rows_written += len(batch)
+                    self.batches += 1
+            if self.trace_memory:
+                self.peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            if tracing:
+                tracemalloc.stop()
+            self.elapsed += time.perf_counter() - started
+        return self.rows_written
+
+
+def result_rows(allocation, unit_ids, votes):
+    """Yield unsaved AllocatedResult rows for aligned unit ids and a vote matrix"""
+    totals = votes.sum(axis=1).tolist()
+    for unit_id, party_votes, total in zip(unit_ids.tolist(), votes.tolist(), totals):
+        yield AllocatedResult(
+            polling_unit_id=unit_id,
+            vote_allocation=allocation,
+            total_votes=total,
+            **dict(zip(VOTE_FIELDS, party_votes)),
+        )
+
+
+def iter_results(allocation, unit_ids, base_votes, compute_votes, chunk_size):
+    """
+    Yield unsaved AllocatedResult rows, computing the vote matrix one chunk
+    of units at a time so it never has to exist for the whole dataset.
+    """
+    for offset in range(0, len(unit_ids), chunk_size):
+        votes = compute_votes(unit_ids[offset:offset + chunk_size], base_votes[offset:offset + chunk_size])
+        yield from result_rows(allocation, unit_ids[offset:offset + chunk_size], votes)
+
+
+def allocate_votes(allocation, batch_size=None, trace_memory=False, in_database=None):
+    """
+    Compute and store results for every polling unit with votes using the
+    allocation's method. Truncated allocations are written with one
+    INSERT ... SELECT unless in_database is False. Returns the ResultWriter
+    with counts and timings.
+    """
+    writer = ResultWriter(batch_size, trace_memory)
+    if in_database is None:
+        in_database = allocation.method == VoteAllocation.METHOD_TRUNCATE
+    with transaction.atomic():
+        if in_database:
+            started = time.perf_counter()
+            writer.rows_written = insert_truncated_results(allocation)
+            writer.batches = 1
+            writer.elapsed = time.perf_counter() - started
+        else:
+            compute_votes = vote_function(allocation)
+            unit_ids, base_votes = load_base_votes(base_field(allocation))
+            writer.write(iter_results(allocation, unit_ids, base_votes, compute_votes, writer.batch_size))
+        refresh_summary(allocation)
+    return writer
+
+
+
+def _units_by_id(unit_ids, batch_size):
+    """{id: (pvc_45_percent, pvc_collected)} for the given unit ids"""
+    units = {}
+    unit_ids = sorted(set(unit_ids))
+    for offset in range(0, len(unit_ids), batch_size):
+        rows = PollingUnit.objects.filter(id__in=unit_ids[offset:offset + batch_size]).values_list(
+            'id', 'pvc_45_percent', 'pvc_collected'
+        )
+        units.update((unit_id, (pvc_45_percent, pvc_collected)) for unit_id, pvc_45_percent, pvc_collected in rows)
+    return units
+
+
+def recompute_results(allocations=None, batch_size=None):
+    """
+    Refresh stored results that are out of date instead of rebuilding whole
+    allocations. Dirty rows (needs_recompute) and qualifying units that have
+    no row yet are gathered across all stored allocations, or only the given
+    ones. They are then computed in one pass per method: truncation and
+    largest remainder take a pairs x parties percentage matrix, and
+    realistic variation runs once per allocation so its draws stay keyed to
+    the allocation's seed and unit ids. Rows whose unit no longer has votes
+    are removed. Returns counts and the seconds taken.
+    """
+    started = time.perf_counter()
+    batch_size = batch_size or get_result_batch_size()
+    stored = VoteAllocation.objects.filter(virtual=False)
+    if allocations is not None:
+        stored = stored.filter(id__in=[allocation.id for allocation in allocations])
+    stored = {allocation.id: allocation for allocation in stored}
+    stats = {'refreshed': 0, 'created': 0, 'removed': 0}
+
+    with transaction.atomic():
+        dirty = AllocatedResult.objects.filter(needs_recompute=True, vote_allocation_id__in=list(stored))
+        # (allocation id, unit id, was dirty), sorted so each allocation's units are in id order
+        pairs = [(allocation_id, unit_id, True)
+                 for unit_id, allocation_id in dirty.values_list('polling_unit_id', 'vote_allocation_id')]
+        for allocation in stored.values():
+            field = base_field(allocation)
+            missing = PollingUnit.objects.filter(**{f'{field}__gt': 0}).exclude(allocatedresult__vote_allocation=allocation)
+            pairs.extend((allocation.id, unit_id, False) for unit_id in missing.values_list('id', flat=True))
+        if not pairs:
+            return {**stats, 'elapsed': time.perf_counter() - started}
+        dirty.delete()
+        pairs.sort()
+
+        units = _units_by_id([unit_id for _, unit_id, _ in pairs], batch_size)
+        allocation_ids = np.array([pair[0] for pair in pairs], dtype=np.int64)
+        unit_ids = np.array([pair[1] for pair in pairs], dtype=np.int64)
+        was_dirty = np.array([pair[2] for pair in pairs], dtype=bool)
+        bases = np.array([units.get(pair[1], (0.0, 0.0)) for pair in pairs], dtype=np.float64).reshape(-1, 2)
+
+        allocation_index = {allocation_id: index for index, allocation_id in enumerate(stored)}
+        percentages = np.array([percentage_vector(allocation) for allocation in stored.values()])[
+            [allocation_index[allocation_id] for allocation_id in allocation_ids.tolist()]
+        ]
+        methods = np.array([stored[allocation_id].method for allocation_id in allocation_ids.tolist()])
+        # Columns of bases are pvc_45_percent and pvc_collected, see base_field()
+        base_votes = np.where(methods == VoteAllocation.METHOD_REALISTIC, bases[:, 1], bases[:, 0])
+
+        votes = np.zeros((len(pairs), len(PARTY_CODES)))
+        for method, compute in ALLOCATION_METHODS.items():
+            mask = methods == method
+            if mask.any():
+                votes[mask] = compute(base_votes[mask], percentages[mask])
+        for allocation_id in np.unique(allocation_ids[methods == VoteAllocation.METHOD_REALISTIC]).tolist():
+            mask = allocation_ids == allocation_id
+            votes[mask] = vote_function(stored[allocation_id])(unit_ids[mask], base_votes[mask])
+
+        keep = base_votes > 0
+        stats['refreshed'] = int((was_dirty & keep).sum())
+        stats['removed'] = int((was_dirty & ~keep).sum())
+        stats['created'] = int((~was_dirty & keep).sum())
+        writer = ResultWriter(batch_size)
+        totals = votes.sum(axis=1)
+        writer.write(
+            AllocatedResult(
+                polling_unit_id=unit_id,
+                vote_allocation_id=allocation_id,
+                total_votes=total,
+                **dict(zip(VOTE_FIELDS, party_votes)),
+            )
+            for unit_id, allocation_id, party_votes, total in zip(
+                unit_ids[keep].tolist(), allocation_ids[keep].tolist(), votes[keep].tolist(), totals[keep].tolist()
+            )
+        )
+        for allocation_id in np.unique(allocation_ids).tolist():
+            refresh_summary(stored[allocation_id])
+    return {**stats, 'elapsed': time.perf_counter() - started}
+
+class TruncateVotes(Func):
+    """
+    A non-negative vote count truncated to a whole number, like np.trunc.
+    SQLite uses a native CAST rather than the FLOOR() Django registers as a
+    Python function there; other backends use FLOOR().
+    """
+    function = 'FLOOR'
+    output_field = FloatField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='CAST(%(expressions)s AS INTEGER)', **extra_context)
+
+
+def virtual_vote_expressions(allocation):
+    """
+    SQL expressions for each <code>_votes value and total_votes of a virtual
+    allocation, computed from pvc_45_percent with the truncation rule.
+    Parties with no share are a constant 0 rather than a FLOOR() per row.
+    """
+    expressions = {}
+    for code, percentage in zip(PARTY_CODES, percentage_vector(allocation).tolist()):
+        if percentage > 0:
+            # Same multiplication as compute_truncated_votes so results match exactly
+            expressions[f'{code}_votes'] = TruncateVotes(F('pvc_45_percent') * Value(percentage / 100))
+        else:
+            expressions[f'{code}_votes'] = Value(0.0, output_field=FloatField())
+    total = None
+    for expression in expressions.values():
+        total = expression if total is None else total + expression
+    expressions['total_votes'] = total
+    return expressions
+
+
+def virtual_results(allocation):
+    """
+    Polling units with votes, annotated with the allocation's computed
+    <code>_votes and total_votes, so they can be filtered and aggregated
+    exactly like stored AllocatedResult rows.
+    """
+    return PollingUnit.objects.filter(pvc_45_percent__gt=0).annotate(
+        **virtual_vote_expressions(allocation)
+    ).order_by('sno')
+
+
+def insert_truncated_results(allocation):
+    """
+    Store a truncated allocation's results with a single INSERT ... SELECT
+    from the polling units, so no row passes through Python. The SELECT is
+    the virtual_results query, which Django compiles for the current backend.
+    Returns the number of rows inserted.
+    """
+    columns = {
+        'polling_unit_id': F('id'),
+        'vote_allocation_id': Value(allocation.id, output_field=IntegerField()),
+        **virtual_vote_expressions(allocation),
+        'needs_recompute': Value(False, output_field=BooleanField()),
+        'created_at': Value(timezone.now(), output_field=DateTimeField()),
+    }
+    # Annotation names must not clash with PollingUnit fields such as created_at
+    aliases = {f'result_{name}': expression for name, expression in columns.items()}
+    query = PollingUnit.objects.filter(pvc_45_percent__gt=0).order_by().annotate(**aliases).values(*aliases).query
+    select_sql, params = query.sql_with_params()
+    # Column order follows the compiled SELECT, not the dict
+    names = [name[len('result_'):] for name in query.annotation_select]
+    fields = {field.attname: field.column for field in AllocatedResult._meta.concrete_fields}
+    sql = 'INSERT INTO {} ({}) {}'.format(
+        connection.ops.quote_name(AllocatedResult._meta.db_table),
+        ', '.join(connection.ops.quote_name(fields[name]) for name in names),
+        select_sql,
+    )
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+
+
+def allocation_results(allocation):
+    """Result rows for an allocation, stored or computed on read"""
+    if allocation.virtual:
+        return virtual_results(allocation)
+    return AllocatedResult.objects.filter(vote_allocation=allocation).select_related('polling_unit')
+
+
+def aggregate_totals(allocation, results):
+    """
+    Party totals (total_<code>), grand_total, base_total and unit_count of
+    allocation_results rows, or of a filtered subset of them
+    """
+    totals = results.aggregate(
+        **{f'total_{code}': Sum(field) for code, field in zip(PARTY_CODES, VOTE_FIELDS)},
+        grand_total=Sum('total_votes'),
+        base_total=Sum(unit_lookup(allocation, base_field(allocation))),
+        unit_count=Count('pk'),
+    )
+    return {key: value or 0 for key, value in totals.items()}
+
+
+# Rollup levels from the finest up, with the unit fields each one groups by
+ROLLUP_LEVELS = [
+    (AllocationRollup.LEVEL_RA, ['state', 'lga', 'ra']),
+    (AllocationRollup.LEVEL_LGA, ['state', 'lga']),
+    (AllocationRollup.LEVEL_STATE, ['state']),
+    (AllocationRollup.LEVEL_NATIONAL, []),
+]
+ROLLUP_COLUMNS = VOTE_FIELDS + ['total_votes', 'base_votes', 'unit_count']
+
+
+def ra_totals(allocation):
+    """Vote, base and unit sums per state, LGA and RA from one GROUP BY over the allocation's results"""
+    keys = ['state', 'lga', 'ra']
+    rows = allocation_results(allocation).order_by().values_list(
+        *[unit_lookup(allocation, key) for key in keys]
+    ).annotate(
+        **{f'sum_{field}': Sum(field) for field in VOTE_FIELDS + ['total_votes']},
+        sum_base=Sum(unit_lookup(allocation, base_field(allocation))),
+        sum_units=Count('pk'),
+    )
+    return pd.DataFrame.from_records(list(rows), columns=keys + ROLLUP_COLUMNS).fillna(0)
+
+
+def refresh_summary(allocation):
+    """
+    Rebuild the allocation's AllocationRollup rows and AllocationSummary.
+    Results are grouped by RA once in the database; LGA, state and
+    national rows are summed from those in memory. Call it in the
+    transaction that wrote the results.
+    """
+    frame = ra_totals(allocation)
+    rollups = []
+    for level, keys in ROLLUP_LEVELS:
+        if keys:
+            grouped = frame.groupby(keys, sort=True)[ROLLUP_COLUMNS].sum().reset_index()
+        else:
+            grouped = frame[ROLLUP_COLUMNS].sum().to_frame().T
+        rollups.extend(
+            AllocationRollup(vote_allocation=allocation, level=level, **record)
+            for record in grouped.to_dict('records')
+        )
+    national = rollups[-1]
+    with transaction.atomic():
+        AllocationRollup.objects.filter(vote_allocation=allocation).delete()
+        AllocationRollup.objects.bulk_create(rollups, batch_size=get_result_batch_size())
+        summary, _ = AllocationSummary.objects.update_or_create(vote_allocation=allocation, defaults={
+            **{field: getattr(national, field) for field in ROLLUP_COLUMNS},
+            'invalid_votes': max(national.base_votes - national.total_votes, 0),
+        })
+    allocation.summary = summary
+    return summary
+
+
+def allocation_job_active(allocation):
+    """Whether a queued or running AllocationJob is still writing the allocation's results"""
+    return allocation.jobs.filter(status__in=AllocationJob.ACTIVE_STATUSES).exists()
+
+
+def allocation_totals(allocation):
+    """
+    The allocation's totals from its summary row, building the summary if
+    there is none yet. While a job is still writing results, or another
+    request is building a summary, they are summed without being stored.
+    """
+    try:
+        summary = allocation.summary
+    except AllocationSummary.DoesNotExist:
+        owner = new_lock_owner('summary')
+        if allocation_job_active(allocation) or not acquire_lock(SUMMARY_LOCK, owner):
+            totals = aggregate_totals(allocation, allocation_results(allocation))
+            totals['invalid_votes'] = max(totals['base_total'] - totals['grand_total'], 0)
+            return totals
+        try:
+            # Another request may have stored it since the first look
+            summary = AllocationSummary.objects.filter(vote_allocation=allocation).first()
+            summary = summary or refresh_summary(allocation)
+        finally:
+            release_lock(SUMMARY_LOCK, owner)
+    return summary.totals()
+
+
+def rollup_rows(allocation, state='', lga=''):
+    """
+    (parent, children) rollup rows for a drill-down step: the nation and
+    its states, a state and its LGAs, or an LGA and its RAs. Both are
+    lookups on the rollup's unique index; the rollup is built first if the
+    allocation has none. The parent is None while a job is still writing
+    the allocation's results or another request is building its rollup.
+    """
+    allocation_totals(allocation)
+    if lga:
+        parent_level, level = AllocationRollup.LEVEL_LGA, AllocationRollup.LEVEL_RA
+    elif state:
+        parent_level, level = AllocationRollup.LEVEL_STATE, AllocationRollup.LEVEL_LGA
+    else:
+        parent_level, level = AllocationRollup.LEVEL_NATIONAL, AllocationRollup.LEVEL_STATE
+    within = {key: value for key, value in (('state', state), ('lga', lga)) if value}
+    parent = allocation.rollups.filter(level=parent_level, state=state, lga=lga, ra='').first()
+    children = allocation.rollups.filter(level=level, **within)
+    return parent, children
+
+
+def unit_lookup(allocation, lookup):
+    """Queryset lookup for a PollingUnit field on allocation_results rows"""
+    return lookup if allocation.virtual else f'polling_unit__{lookup}'
+
+
+def result_sort_keys(allocation):
+    """Sort field and unique tie-breaker for paging through allocation_results rows by sno"""
+    if allocation.virtual:
+        return 'sno', 'id'
+    return 'polling_unit__sno', 'polling_unit_id'
+
+
+def as_results(allocation, rows):
+    """
+    Yield AllocatedResult instances for allocation_results rows, building
+    unsaved ones from annotated polling units for virtual allocations.
+    """
+    for row in rows:
+        if not allocation.virtual:
+            yield row
+            continue
+        yield AllocatedResult(
+            polling_unit=row,
+            vote_allocation=allocation,
+            total_votes=row.total_votes,
+            **{field: getattr(row, field) for field in VOTE_FIELDS},
+        )
@@ -0,0 +1,288 @@
+# importer.py - Bulk import of polling units from uploaded workbooks
+import logging
+import time
+
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import PollingUnit, AllocatedResult, AllocationSummary, AllocationRollup
+from .planner import update_planner_stats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMPORT_BATCH_SIZE = 2000
+
+IMPORT_MODE_REPLACE = 'replace'
+IMPORT_MODE_UPSERT = 'upsert'
+IMPORT_MODES = [
+    (IMPORT_MODE_REPLACE, 'Replace all data'),
+    (IMPORT_MODE_UPSERT, 'Update changed rows only'),
+]
+
+# PollingUnit fields compared when deciding whether an existing row changed
+COMPARED_FIELDS = [
+    'sno', 'state', 'lga', 'ra', 'delim', 'register_voter_2023',
+    'registered_voter_2024', 'pvc_collected', 'balance_uncollected', 'pvc_45_percent',
+]
+
+
+def get_import_batch_size():
+    """Batch size used for bulk inserts, configurable via IMPORT_BATCH_SIZE"""
+    return getattr(settings, 'IMPORT_BATCH_SIZE', DEFAULT_IMPORT_BATCH_SIZE)
+
+
+class ImportStats:
+    """Counters and timings collected while importing a workbook"""
+
+    def __init__(self):
+        self.created_count = 0
+        self.rows_processed = 0
+        self.errors = []
+        self.elapsed = 0.0
+        self.timings = {}
+
+        # Only filled in by upsert imports
+        self.unchanged_count = 0
+        self.changed_count = 0
+        self.removed_count = 0
+
+    @property
+    def rows_per_second(self):
+        if self.elapsed <= 0:
+            return 0.0
+        return self.rows_processed / self.elapsed
+
+
+def iter_polling_units(frame):
+    """Yield unsaved PollingUnit instances from a normalized upload frame"""
+    for record in frame.to_dict('records'):
+        yield PollingUnit(**record)
+
+
+def _in_batches(values, batch_size):
+    values = list(values)
+    for offset in range(0, len(values), batch_size):
+        yield values[offset:offset + batch_size]
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def delete_all_rows(model):
+    """
+    Delete every row of a table with one SQL statement. Unlike
+    QuerySet.delete() this never loads rows (or their cascades) into Python.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {_table(model)}")
+
+
+def delete_rows_by_column(model, column, values, batch_size):
+    """Delete rows whose column is in values, batched, without the ORM collector"""
+    with connection.cursor() as cursor:
+        for batch in _in_batches(values, batch_size):
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f"DELETE FROM {_table(model)} WHERE {connection.ops.quote_name(column)} IN ({placeholders})",
+                batch,
+            )
+
+
+def staging_table_name():
+    return connection.ops.quote_name(f"{PollingUnit._meta.db_table}_staging")
+
+
+def create_staging_table():
+    """Create an empty copy of the polling unit table to load new data into"""
+    staging = staging_table_name()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        cursor.execute(f"CREATE TABLE {staging} AS SELECT * FROM {_table(PollingUnit)} WHERE 1 = 0")
+
+
+def drop_staging_table():
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {staging_table_name()}")
+
+
+def load_staging_table(frame, batch_size, progress=None):
+    """Insert a normalized frame into the staging table in fixed-size batches"""
+    fields = [field for field in PollingUnit._meta.concrete_fields if not field.primary_key]
+    columns = [field.column for field in fields]
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    defaults = {
+        field.name: now if field.name in ('created_at', 'updated_at') else field.get_default()
+        for field in fields
+    }
+    sql = (f"INSERT INTO {staging_table_name()} "
+           f"({', '.join(connection.ops.quote_name(column) for column in columns)}) "
+           f"VALUES ({', '.join(['%s'] * len(columns))})")
+
+    loaded = 0
+    with connection.cursor() as cursor:
+        for offset in range(0, len(frame), batch_size):
+            records = frame.iloc[offset:offset + batch_size].to_dict('records')
+            # One short transaction per batch rather than one commit per row
+            with transaction.atomic():
+                cursor.executemany(sql, [
+                    tuple(record.get(field.name, defaults[field.name]) for field in fields)
+                    for record in records
+                ])
+            loaded += len(records)
+            logger.debug("Loaded %d of %d records", loaded, len(frame))
+            if progress:
+                progress(loaded, len(frame))
+    return columns
+
+
+def swap_in_staging_table(columns):
+    """
+    Replace the live polling units (and their now meaningless results) with
+    the staging table in one short transaction, so readers see either the
+    old dataset or the new one, never an empty or partial table.
+    """
+    column_list = ', '.join(connection.ops.quote_name(column) for column in columns)
+    with transaction.atomic():
+        delete_all_rows(AllocationSummary)
+        delete_all_rows(AllocationRollup)
+        delete_all_rows(AllocatedResult)
+        delete_all_rows(PollingUnit)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {_table(PollingUnit)} ({column_list}) "
+                           f"SELECT {column_list} FROM {staging_table_name()}")
+
+
+def bulk_import_polling_units(normalized, batch_size=None, progress=None):
+    """
+    Replace all polling units with the rows of a NormalizedUpload. Rows are
+    loaded in batches into a staging table, then swapped in atomically; rows
+    flagged in the upload's error mask are reported in stats.errors and skipped.
+    progress(rows_done, rows_total) is called after every batch.
+    """
+    batch_size = batch_size or get_import_batch_size()
+    stats = ImportStats()
+    stats.errors = list(normalized.row_errors)
+    started = time.perf_counter()
+
+    frame = normalized.frame
+    create_staging_table()
+    try:
+        columns = load_staging_table(frame, batch_size, progress)
+        stats.timings['load'] = round(time.perf_counter() - started, 3)
+
+        swap_started = time.perf_counter()
+        swap_in_staging_table(columns)
+        stats.timings['swap'] = round(time.perf_counter() - swap_started, 3)
+    finally:
+        drop_staging_table()
+    update_planner_stats()
+
+    stats.created_count = len(frame)
+    stats.rows_processed = stats.created_count
+    stats.elapsed = time.perf_counter() - started
+    logger.info("Imported %d records in %.2fs (%.0f rows/s, swap %.2fs)",
+                stats.created_count, stats.elapsed, stats.rows_per_second, stats.timings['swap'])
+    return stats
+
+
+def choose_identity_field(frame):
+    """
+    Pick the column identifying a polling unit across uploads: the 2023
+    register code when it is filled in and unique, otherwise S/NO.
+    """
+    codes = frame['register_voter_2023'].astype(str)
+    if len(codes) and (codes != '').all() and codes.is_unique:
+        return 'register_voter_2023'
+    return 'sno'
+
+
+def upsert_polling_units(normalized, batch_size=None, progress=None):
+    """
+    Apply a NormalizedUpload as a delta against the existing polling units.
+    Only added, changed and removed rows are written; allocation results of
+    changed units are flagged with needs_recompute instead of being wiped.
+    progress(rows_done, rows_total) is called as each kind of change is written.
+    """
+    batch_size = batch_size or get_import_batch_size()
+    stats = ImportStats()
+    stats.errors = list(normalized.row_errors)
+    started = time.perf_counter()
+
+    incoming = normalized.frame.copy()
+    for field in ('state', 'lga', 'ra'):
+        incoming[field] = incoming[field].astype(str)
+    key = choose_identity_field(incoming)
+    # Later rows win when the upload repeats a key
+    incoming = incoming.drop_duplicates(subset=key, keep='last')
+
+    with transaction.atomic():
+        existing = pd.DataFrame.from_records(
+            PollingUnit.objects.values_list('id', *COMPARED_FIELDS),
+            columns=['id'] + COMPARED_FIELDS,
+        )
+        if key == 'register_voter_2023':
+            existing[key] = existing[key].astype(str)
+        duplicate_ids = existing.loc[existing.duplicated(subset=key, keep='first'), 'id']
+        existing = existing.drop_duplicates(subset=key, keep='first')
+
+        merged = existing.merge(incoming, on=key, how='outer', suffixes=('_old', ''), indicator=True)
+        added = merged[merged['_merge'] == 'right_only']
+        removed_ids = [int(unit_id) for unit_id in merged.loc[merged['_merge'] == 'left_only', 'id']]
+        removed_ids += [int(unit_id) for unit_id in duplicate_ids]
+        matched = merged[merged['_merge'] == 'both']
+
+        changed_mask = pd.Series(False, index=matched.index)
+        for field in COMPARED_FIELDS:
+            if field == key:
+                continue
+            changed_mask |= matched[f'{field}_old'] != matched[field]
+        changed = matched[changed_mask]
+        moved = any((changed[f'{field}_old'] != changed[field]).any() for field in ('state', 'lga', 'ra') if field != key)
+
+        # Removed units take their results with them
+        delete_rows_by_column(AllocatedResult, 'polling_unit_id', removed_ids, batch_size)
+        delete_rows_by_column(PollingUnit, 'id', removed_ids, batch_size)
+
+        # The outer merge widens integer columns to float; restore upload dtypes
+        dtypes = incoming[COMPARED_FIELDS].dtypes.to_dict()
+        changed = changed[['id'] + COMPARED_FIELDS].astype({'id': 'int64', **dtypes})
+        added = added[COMPARED_FIELDS].astype(dtypes)
+
+        now = timezone.now()
+        changed_units = []
+        for record in changed.to_dict('records'):
+            changed_units.append(PollingUnit(updated_at=now, **record))
+        PollingUnit.objects.bulk_update(changed_units, COMPARED_FIELDS + ['updated_at'], batch_size=batch_size)
+
+        for ids in _in_batches((unit.id for unit in changed_units), batch_size):
+            AllocatedResult.objects.filter(polling_unit_id__in=ids).update(needs_recompute=True)
+
+        if progress:
+            progress(len(matched), len(incoming))
+
+        for offset in range(0, len(added), batch_size):
+            batch = list(iter_polling_units(added.iloc[offset:offset + batch_size]))
+            PollingUnit.objects.bulk_create(batch, batch_size=batch_size)
+            if progress:
+                progress(len(matched) + offset + len(batch), len(incoming))
+
+        # Removed or moved units change every allocation's totals or rollups; any change moves virtual ones
+        if removed_ids or moved:
+            AllocationSummary.invalidate()
+        elif len(changed) or len(added):
+            AllocationSummary.invalidate(virtual_only=True)
+    update_planner_stats()
+
+    stats.created_count = len(added)
+    stats.changed_count = len(changed)
+    stats.unchanged_count = len(matched) - len(changed)
+    stats.removed_count = len(removed_ids)
+    stats.rows_processed = len(incoming)
+    stats.elapsed = time.perf_counter() - started
+    logger.info("Upserted on %s: %d unchanged, %d changed, %d added, %d removed in %.2fs (%.0f rows/s)",
+                key, stats.unchanged_count, stats.changed_count, stats.created_count, stats.removed_count,
+                stats.elapsed, stats.rows_per_second)
+    return stats
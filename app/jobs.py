@@ -0,0 +1,250 @@
+# jobs.py - Background import, allocation and simulation jobs run in a local worker pool
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .allocation import recompute_results
+from .importer import bulk_import_polling_units, upsert_polling_units, IMPORT_MODE_UPSERT
+from .locks import DATA_LOCK, acquire_lock, hold_lock, lock_owner, refresh_lock, release_lock
+from .models import PollingUnit, UploadSession, AllocationJob, AllocationSimulation
+from .sharding import run_allocation
+from .simulation import run_simulation
+from .staging import load_or_parse, probe_upload
+from .utils import detect_vote_count_field, validate_vote_count_field, normalize_upload
+
+logger = logging.getLogger(__name__)
+
+# Imports, allocation jobs and simulations each get their own pool so a long
+# simulation never holds an upload in the queue: pool -> (setting, default workers)
+POOL_WORKERS = {
+    'import': ('IMPORT_WORKERS', 1),
+    'allocation': ('ALLOCATION_JOB_WORKERS', 1),
+    'simulation': ('SIMULATION_JOB_WORKERS', 1),
+}
+IMPORT_LOCK = 'import'  # held from queueing an upload until its import finishes
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+class ImportAlreadyRunning(Exception):
+    """Raised when an upload is started while another import is in progress"""
+
+
+def get_executor(pool='import'):
+    """The worker pool for one kind of job, created on first use"""
+    with _executors_lock:
+        if pool not in _executors:
+            setting, default = POOL_WORKERS[pool]
+            _executors[pool] = ThreadPoolExecutor(
+                max_workers=getattr(settings, setting, default),
+                thread_name_prefix=f'{pool}-job',
+            )
+        return _executors[pool]
+
+
+def progress_cache_key(session_id):
+    return f'upload-progress-{session_id}'
+
+
+def import_lock_owner(session_id):
+    return f'upload-{session_id}'
+
+
+def active_import():
+    """Return the import holding the import lock, queued or running, unless its worker went stale"""
+    owner = lock_owner(IMPORT_LOCK)
+    if not owner:
+        return None
+    return UploadSession.objects.filter(
+        id=int(owner.rsplit('-', 1)[1]), status__in=UploadSession.ACTIVE_STATUSES
+    ).first()
+
+
+def start_import(upload_session):
+    """
+    Queue an UploadSession for import. Raises ImportAlreadyRunning if another
+    import is still queued or running; the import lock decides, so two
+    processes can never both queue one.
+    """
+    with transaction.atomic():
+        upload_session.status = UploadSession.STATUS_QUEUED
+        upload_session.message = ''
+        upload_session.save()
+        if not acquire_lock(IMPORT_LOCK, import_lock_owner(upload_session.id)):
+            running = active_import()
+            # Leaving the block with the exception also rolls back a new session
+            raise ImportAlreadyRunning(
+                f'Upload {running.id if running else ""} is still being imported. Please wait for it to finish.'
+            )
+        # Only hand the job to the pool once the worker can see the row
+        transaction.on_commit(lambda: get_executor().submit(run_import_job, upload_session.id))
+    return upload_session
+
+
+def get_progress(upload_session):
+    """Progress snapshot for the status endpoint"""
+    progress = {
+        'id': upload_session.id,
+        'status': upload_session.status,
+        'phase': upload_session.phase,
+        'rows_processed': upload_session.rows_processed,
+        'total_rows': upload_session.total_records,
+        'error_count': upload_session.error_count,
+        'phase_timings': upload_session.phase_timings,
+        'message': upload_session.message,
+    }
+    if upload_session.status == UploadSession.STATUS_RUNNING:
+        # Row counts written inside the import transaction live in the cache
+        live = cache.get(progress_cache_key(upload_session.id))
+        if live:
+            progress.update(live)
+    return progress
+
+
+def run_import_job(session_id):
+    """
+    Parse, validate and import a staged upload, recording progress as it
+    goes. It waits for the data lock first, so units never change under a
+    running allocation job or recompute.
+    """
+    try:
+        with hold_lock(DATA_LOCK, import_lock_owner(session_id)):
+            upload_session = UploadSession.objects.get(id=session_id)
+            _run(upload_session)
+    finally:
+        release_lock(IMPORT_LOCK, import_lock_owner(session_id))
+        close_old_connections()
+
+
+def _refresh_locks(upload_session):
+    for name in (IMPORT_LOCK, DATA_LOCK):
+        refresh_lock(name, import_lock_owner(upload_session.id))
+
+
+def _set_phase(upload_session, phase):
+    _refresh_locks(upload_session)
+    upload_session.phase = phase
+    upload_session.save(update_fields=['phase', 'phase_timings', 'total_records', 'updated_at'])
+
+
+def _finish(upload_session, status, message):
+    upload_session.status = status
+    upload_session.message = message
+    upload_session.finished_at = timezone.now()
+    upload_session.save()
+    cache.delete(progress_cache_key(upload_session.id))
+    release_lock(IMPORT_LOCK, import_lock_owner(upload_session.id))
+
+
+def _run(upload_session):
+    upload_session.status = UploadSession.STATUS_RUNNING
+    upload_session.phase_timings = {}
+    upload_session.save()
+    timings = upload_session.phase_timings
+
+    try:
+        # Confirm the vote column from the header and a small sample first,
+        # so a file that needs manual field selection is never fully parsed
+        vote_count_field = upload_session.vote_count_field_name
+        if not vote_count_field:
+            _set_phase(upload_session, 'probe')
+            started = time.perf_counter()
+            sample = probe_upload(upload_session.upload_digest)
+            vote_count_field = detect_vote_count_field(sample.columns.tolist(), sample)
+            timings['probe'] = round(time.perf_counter() - started, 3)
+            if not vote_count_field:
+                _finish(upload_session, UploadSession.STATUS_NEEDS_FIELD, "No vote count field automatically detected")
+                return
+
+        _set_phase(upload_session, 'parse')
+        started = time.perf_counter()
+        df, from_cache = load_or_parse(upload_session.upload_digest)
+        timings['parse'] = round(time.perf_counter() - started, 3)
+
+        _set_phase(upload_session, 'validate')
+        started = time.perf_counter()
+        normalized = normalize_upload(df, vote_count_field)
+        is_valid, validation_msg = validate_vote_count_field(df, vote_count_field, normalized.vote_data)
+        timings['validate'] = round(time.perf_counter() - started, 3)
+        if not is_valid:
+            upload_session.vote_count_field_name = ''
+            _finish(upload_session, UploadSession.STATUS_NEEDS_FIELD, validation_msg)
+            return
+
+        upload_session.vote_count_field_name = vote_count_field
+        upload_session.total_records = len(normalized)
+        _set_phase(upload_session, 'import')
+
+        def report(rows_done, rows_total):
+            _refresh_locks(upload_session)
+            cache.set(progress_cache_key(upload_session.id),
+                      {'rows_processed': rows_done, 'total_rows': rows_total}, 60 * 60)
+
+        started = time.perf_counter()
+        if upload_session.import_mode == IMPORT_MODE_UPSERT:
+            stats = upsert_polling_units(normalized, progress=report)
+            upload_session.total_records = PollingUnit.objects.count()
+            # Bring stored allocations up to date for just the units that changed
+            recomputed = recompute_results()
+            stats.timings['recompute'] = round(recomputed['elapsed'], 3)
+            summary = (f'{stats.unchanged_count} unchanged, {stats.changed_count} changed, '
+                       f'{stats.created_count} added, {stats.removed_count} removed, '
+                       f"{recomputed['refreshed'] + recomputed['created']} results recomputed")
+        else:
+            stats = bulk_import_polling_units(normalized, progress=report)
+            upload_session.total_records = stats.created_count
+            summary = f'{stats.created_count} polling units imported'
+        timings['import'] = round(time.perf_counter() - started, 3)
+        timings.update(stats.timings)
+
+        upload_session.rows_processed = stats.rows_processed
+        upload_session.error_count = len(stats.errors)
+        upload_session.phase = 'done'
+        if stats.rows_processed == 0:
+            _finish(upload_session, UploadSession.STATUS_FAILED,
+                    'No valid data was imported. Please check your Excel file format.')
+            return
+        message = (f'{summary} using field "{vote_count_field}" in {stats.elapsed:.1f}s '
+                   f'({stats.rows_per_second:.0f} rows/s).')
+        if stats.errors:
+            message += f' Encountered {len(stats.errors)} errors during import.'
+        _finish(upload_session, UploadSession.STATUS_COMPLETED, message)
+
+    except Exception as e:
+        error_msg = f'Error importing data: {str(e)}'
+        logger.exception('Import of upload %s failed', upload_session.id)
+        _finish(upload_session, UploadSession.STATUS_FAILED, error_msg)
+
+
+def start_simulation(simulation):
+    """Queue an AllocationSimulation to run in the simulation pool"""
+    transaction.on_commit(lambda: get_executor('simulation').submit(run_simulation_job, simulation.id))
+    return simulation
+
+
+def run_simulation_job(simulation_id):
+    try:
+        run_simulation(AllocationSimulation.objects.select_related('vote_allocation').get(id=simulation_id))
+    finally:
+        close_old_connections()
+
+
+def start_allocation(allocation, shard_by='state'):
+    """Queue an AllocationJob that computes the allocation's results in the allocation pool"""
+    job = AllocationJob.objects.create(vote_allocation=allocation, shard_by=shard_by)
+    transaction.on_commit(lambda: get_executor('allocation').submit(run_allocation_job, job.id))
+    return job
+
+
+def run_allocation_job(job_id, workers=None):
+    try:
+        run_allocation(AllocationJob.objects.select_related('vote_allocation').get(id=job_id), workers)
+    finally:
+        close_old_connections()
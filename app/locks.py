@@ -0,0 +1,79 @@
+# locks.py - Named locks kept in the database so they hold across worker processes
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import JobLock
+
+DEFAULT_LOCK_STALE_AFTER = 30 * 60  # seconds without a refresh before a lock's holder is presumed dead
+DEFAULT_LOCK_POLL_INTERVAL = 2  # seconds between attempts while waiting for a lock
+
+# Held by whatever is writing polling units or stored results: an import, an
+# allocation job or a recompute. They would otherwise overwrite each other.
+DATA_LOCK = 'data'
+
+
+class LockBusy(Exception):
+    """Raised when a lock is still held by someone else after the wait allowed for it"""
+
+
+def get_lock_stale_after():
+    return getattr(settings, 'JOB_LOCK_STALE_AFTER', DEFAULT_LOCK_STALE_AFTER)
+
+
+def new_lock_owner(kind):
+    """An owner name for a one-off holder, such as a request, that has no row of its own"""
+    return f'{kind}-{uuid.uuid4().hex}'
+
+
+def acquire_lock(name, owner):
+    """
+    Take the named lock for owner and return whether owner now holds it.
+    The claim is one conditional UPDATE, so of several processes racing for
+    a free lock exactly one wins. A lock its holder stopped refreshing is
+    taken over.
+    """
+    JobLock.objects.get_or_create(name=name)
+    now = timezone.now()
+    free = Q(owner='') | Q(owner=owner) | Q(refreshed_at__lt=now - timedelta(seconds=get_lock_stale_after()))
+    return JobLock.objects.filter(free, name=name).update(owner=owner, refreshed_at=now) == 1
+
+
+def refresh_lock(name, owner):
+    """Show the holder is still alive so the lock does not go stale"""
+    JobLock.objects.filter(name=name, owner=owner).update(refreshed_at=timezone.now())
+
+
+def release_lock(name, owner):
+    JobLock.objects.filter(name=name, owner=owner).update(owner='', refreshed_at=None)
+
+
+def lock_owner(name):
+    """Current holder of the named lock, or None when it is free or stale"""
+    cutoff = timezone.now() - timedelta(seconds=get_lock_stale_after())
+    return JobLock.objects.filter(name=name, refreshed_at__gte=cutoff).exclude(owner='').values_list(
+        'owner', flat=True
+    ).first()
+
+
+@contextmanager
+def hold_lock(name, owner, timeout=None):
+    """
+    Hold the named lock for the block, waiting while someone else has it.
+    Raises LockBusy if it is not free within timeout seconds (0 tries once,
+    None waits for good). Holders of a long block must refresh_lock it.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not acquire_lock(name, owner):
+        if deadline is not None and time.monotonic() >= deadline:
+            raise LockBusy(f'{name} lock is held by {lock_owner(name) or "another job"}')
+        time.sleep(getattr(settings, 'JOB_LOCK_POLL_INTERVAL', DEFAULT_LOCK_POLL_INTERVAL))
+    try:
+        yield
+    finally:
+        release_lock(name, owner)
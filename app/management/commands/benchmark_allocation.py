@@ -0,0 +1,123 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+import numpy as np
+import time
+
+from app.allocation import (
+    PARTY_CODES, VOTE_FIELDS, allocate_votes, compute_truncated_votes, compute_largest_remainder_votes,
+)
+from app.models import PollingUnit, VoteAllocation, AllocatedResult
+
+# Example split used for every run (sums to 100)
+BENCHMARK_PERCENTAGES = [
+    1.5, 0.5, 3.0, 35.25, 24.75, 20.0, 0.5, 4.0, 0.5, 1.0,
+    0.5, 0.5, 0.5, 1.5, 0.5, 1.0, 0.5, 3.0, 0.5, 0.5,
+]
+
+
+def legacy_truncated_votes(base_votes, percentages):
+    """The per-unit Python loop create_allocation used before the vectorized engine"""
+    rows = []
+    for base in base_votes.tolist():
+        rows.append([int(base * (percentage / 100)) for percentage in percentages])
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the vectorized allocation engine against the per-unit Python loop and in-database allocation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Comma-separated numbers of polling units')
+        parser.add_argument('--skip-legacy', action='store_true',
+                            help='Only time the vectorized engine')
+        parser.add_argument('--database', action='store_true',
+                            help='Also time storing results with NumPy + bulk_create against INSERT ... SELECT '
+                                 '(uses synthetic polling units in a throwaway test database)')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        percentages = BENCHMARK_PERCENTAGES[:len(PARTY_CODES)]
+        rng = np.random.default_rng(0)
+
+        self.stdout.write(f"{'units':>10}{'legacy s':>12}{'numpy s':>12}{'speedup':>10}  identical"
+                          f"{'remainder s':>14}  exact totals")
+        for size in sizes:
+            base_votes = rng.integers(1, 900, size).astype(np.float64)
+
+            started = time.perf_counter()
+            votes = compute_truncated_votes(base_votes, percentages)
+            totals = votes.sum(axis=1)
+            numpy_time = time.perf_counter() - started
+
+            started = time.perf_counter()
+            exact = compute_largest_remainder_votes(base_votes, percentages)
+            remainder_time = time.perf_counter() - started
+            remainder_cols = (f'{remainder_time:>14.3f}  '
+                              f'{"yes" if np.array_equal(exact.sum(axis=1), base_votes) else "NO"}')
+
+            if options['skip_legacy']:
+                self.stdout.write(f'{size:>10}{"-":>12}{numpy_time:>12.3f}{"-":>10}  -        {remainder_cols}')
+                continue
+
+            started = time.perf_counter()
+            legacy = legacy_truncated_votes(base_votes, percentages)
+            legacy_totals = [sum(row) for row in legacy]
+            legacy_time = time.perf_counter() - started
+
+            identical = np.array_equal(votes, np.array(legacy, dtype=np.float64)) and \
+                np.array_equal(totals, np.array(legacy_totals, dtype=np.float64))
+            self.stdout.write(
+                f'{size:>10}{legacy_time:>12.3f}{numpy_time:>12.3f}'
+                f'{legacy_time / max(numpy_time, 1e-9):>9.0f}x  {"yes" if identical else "NO ":<9}'
+                f'{remainder_cols}'
+            )
+
+        if options['database']:
+            self.benchmark_database(sizes, percentages, rng)
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
+
+    def benchmark_database(self, sizes, percentages, rng):
+        """
+        Time both ways of storing a truncated allocation. It runs in a test
+        database created for the purpose, the way the test runner does, so
+        the live polling units and results are never read, locked or written.
+        """
+        live_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.time_database_writes(sizes, percentages, rng)
+        finally:
+            connection.creation.destroy_test_db(live_name, verbosity=0)
+
+    def time_database_writes(self, sizes, percentages, rng):
+        self.stdout.write(f"{'units':>10}{'python s':>12}{'sql s':>12}{'speedup':>10}  identical")
+        for size in sizes:
+            # Each size starts from the empty test database
+            with transaction.atomic():
+                base_votes = rng.integers(0, 900, size).astype(np.float64).tolist()
+                PollingUnit.objects.bulk_create(
+                    (PollingUnit(sno=sno, state='BENCH', lga='BENCH', ra='BENCH', delim=f'UNIT {sno}',
+                                 register_voter_2023=f'B-{sno}', registered_voter_2024=1000, pvc_collected=900,
+                                 balance_uncollected=100, pvc_45_percent=base)
+                     for sno, base in enumerate(base_votes, start=1)),
+                    batch_size=5000,
+                )
+                allocations = [
+                    VoteAllocation.objects.create(name=f'Benchmark {label}', **{
+                        f'{code}_percentage': percentage for code, percentage in zip(PARTY_CODES, percentages)
+                    })
+                    for label in ('python', 'sql')
+                ]
+                python_time = allocate_votes(allocations[0], in_database=False).elapsed
+                sql_time = allocate_votes(allocations[1], in_database=True).elapsed
+
+                fields = ['polling_unit_id'] + VOTE_FIELDS + ['total_votes']
+                rows = [
+                    list(AllocatedResult.objects.filter(vote_allocation=allocation).order_by('polling_unit_id').values_list(*fields))
+                    for allocation in allocations
+                ]
+                self.stdout.write(f'{size:>10}{python_time:>12.3f}{sql_time:>12.3f}'
+                                  f'{python_time / max(sql_time, 1e-9):>9.1f}x  {"yes" if rows[0] == rows[1] else "NO"}')
+                transaction.set_rollback(True)
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+import numpy as np
+import pandas as pd
+import os
+import tempfile
+import time
+
+from app.readers import read_tabular
+from app.utils import detect_vote_count_field, validate_vote_count_field, normalize_upload
+
+
+def make_benchmark_dataframe(rows, seed=0):
+    """Synthetic polling unit sheet with the same columns as a real upload"""
+    rng = np.random.default_rng(seed)
+    states = np.array(['ANAMBRA', 'LAGOS', 'KANO', 'RIVERS', 'OYO', 'KADUNA'])
+    lgas = np.array([f'LGA {i}' for i in range(40)])
+    registered = rng.integers(200, 2000, rows)
+    collected = (registered * rng.uniform(0.5, 0.95, rows)).astype(int)
+    return pd.DataFrame({
+        'S/NO': np.arange(1, rows + 1),
+        'STATE': states[rng.integers(0, len(states), rows)],
+        'LGA': lgas[rng.integers(0, len(lgas), rows)],
+        'RA': [f'RA {i % 500}' for i in range(rows)],
+        'DELIM': [f'POLLING UNIT {i}' for i in range(rows)],
+        'REGISTER VOTER AS AT 2023': [f'{i // 10000:02d}-{i // 100 % 100:02d}-{i % 100:02d}-{i:06d}' for i in range(rows)],
+        'REGISTERED VOTER AS AT 2024': registered,
+        'NO OF PVC COLLECTED ': collected,
+        'BALANCE OF UNCOLECTED PVCs': registered - collected,
+        '45% PVC COLLECTION': (collected * 0.45).round(1),
+    })
+
+
+class Command(BaseCommand):
+    help = 'Compare parse, detect and validate time for Excel, CSV, Parquet and Feather uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Number of polling units in the dataset')
+        parser.add_argument('--formats', default='xlsx,csv,parquet,feather',
+                            help='Comma-separated formats to benchmark')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        formats = [fmt.strip() for fmt in options['formats'].split(',') if fmt.strip()]
+        df = make_benchmark_dataframe(rows)
+        writers = {
+            'xlsx': lambda path: df.to_excel(path, index=False),
+            'csv': lambda path: df.to_csv(path, index=False),
+            'parquet': lambda path: df.to_parquet(path, index=False),
+            'feather': lambda path: df.to_feather(path),
+        }
+
+        self.stdout.write(f'Benchmarking {rows} rows')
+        self.stdout.write(f"{'format':<10}{'size MB':>10}{'parse s':>10}{'validate s':>12}{'total s':>10}{'rows/s':>12}")
+
+        with tempfile.TemporaryDirectory() as workdir:
+            for fmt in formats:
+                if fmt not in writers:
+                    self.stdout.write(self.style.WARNING(f'Skipping unknown format: {fmt}'))
+                    continue
+                path = os.path.join(workdir, f'units.{fmt}')
+                writers[fmt](path)
+
+                started = time.perf_counter()
+                parsed = read_tabular(path)
+                parse_time = time.perf_counter() - started
+
+                started = time.perf_counter()
+                field = detect_vote_count_field(parsed.columns.tolist())
+                normalized = normalize_upload(parsed, field)
+                is_valid, _ = validate_vote_count_field(parsed, field, normalized.vote_data)
+                validate_time = time.perf_counter() - started
+
+                total = parse_time + validate_time
+                size_mb = os.path.getsize(path) / (1024 * 1024)
+                self.stdout.write(
+                    f'{fmt:<10}{size_mb:>10.1f}{parse_time:>10.2f}{validate_time:>12.2f}'
+                    f'{total:>10.2f}{rows / total:>12.0f}'
+                    + ('' if is_valid else '  (validation failed)')
+                )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark complete'))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+import os
+
+from app.locks import DATA_LOCK, hold_lock, new_lock_owner
+from app.models import PollingUnit
+from app.scenarios import read_scenarios, build_scenarios, create_scenarios
+
+
+class Command(BaseCommand):
+    help = 'Create many vote allocations from a JSON, CSV or Excel file of percentage vectors'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='Scenario file (one scenario per row or JSON object)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Result rows per bulk insert (defaults to RESULT_BATCH_SIZE)')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the scenarios without saving them')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'File not found: {path}')
+
+        try:
+            records = read_scenarios(path, path)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        allocations, errors = build_scenarios(records)
+        if errors:
+            raise CommandError('Invalid scenarios:\n  ' + '\n  '.join(errors))
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run: {len(allocations)} valid scenarios'))
+            return
+        if not PollingUnit.objects.exists():
+            raise CommandError('No polling units found. Please import data first.')
+
+        # Waits for a running import or allocation job to finish first
+        with hold_lock(DATA_LOCK, new_lock_owner('scenarios')):
+            report = create_scenarios(allocations, batch_size=options['batch_size'])
+        self.stdout.write(f"{'id':>6}  {'name':<30}{'results':>10}{'seconds':>10}{'rows/s':>10}")
+        for scenario in report['scenarios']:
+            self.stdout.write(
+                f"{scenario['id']:>6}  {scenario['name'][:30]:<30}{scenario['results']:>10}"
+                f"{scenario['seconds']:>10.3f}{scenario['rows_per_second']:>10}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report['created']} allocations in {report['elapsed']:.2f}s "
+            f"(shared vote computation {report['compute_seconds']:.3f}s)"
+        ))
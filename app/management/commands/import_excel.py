@@ -1,54 +1,163 @@
 # management/commands/import_excel.py
-from django.core.management.base import BaseCommand
-from django.conf import settings
-import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from concurrent.futures import ProcessPoolExecutor
 import os
-from models import PollingUnit
+import time
+
+from app.allocation import recompute_results
+from app.importer import (
+    bulk_import_polling_units, upsert_polling_units, get_import_batch_size,
+    IMPORT_MODE_REPLACE, IMPORT_MODE_UPSERT,
+)
+from app.jobs import IMPORT_LOCK
+from app.locks import DATA_LOCK, LockBusy, acquire_lock, hold_lock, new_lock_owner, refresh_lock, release_lock
+from app.models import PollingUnit, UploadSession
+from app.readers import read_tabular, get_csv_chunk_size, SUPPORTED_EXTENSIONS
+from app.utils import detect_vote_count_field, validate_vote_count_field, normalize_upload, concat_normalized
+
+
+def parse_and_validate(path, vote_field, csv_chunk_size):
+    """
+    Parse one file and validate its vote field. Runs in a worker process, so
+    it only touches pandas, never the database.
+    Returns (path, normalized or None, vote field, message, parse s, validate s).
+    """
+    started = time.perf_counter()
+    df = read_tabular(path, csv_chunk_size=csv_chunk_size)
+    parse_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    field = vote_field or detect_vote_count_field(df.columns.tolist())
+    if not field:
+        return path, None, None, "No vote count field automatically detected", parse_time, 0.0
+    normalized = normalize_upload(df, field)
+    is_valid, message = validate_vote_count_field(df, field, normalized.vote_data)
+    validate_time = time.perf_counter() - started
+    return path, normalized if is_valid else None, field, message, parse_time, validate_time
+
 
 class Command(BaseCommand):
-    help = 'Import polling units from Excel file'
-    
+    help = 'Import polling units from one or more Excel, CSV or Parquet files (or a directory of them)'
+
     def add_arguments(self, parser):
-        parser.add_argument('file_path', type=str, help='Path to Excel file')
-    
-    def handle(self, *args, **options):
-        file_path = options['file_path']
-        
-        if not os.path.exists(file_path):
-            self.stdout.write(self.style.ERROR(f'File not found: {file_path}'))
-            return
-        
+        parser.add_argument('paths', nargs='+', type=str, help='Files or directories to import')
+        parser.add_argument('--vote-field', help='Column holding the vote count (auto-detected if omitted)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Rows per bulk insert (defaults to IMPORT_BATCH_SIZE)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Parser processes (defaults to one per file, up to the CPU count)')
+        parser.add_argument('--mode', choices=[IMPORT_MODE_REPLACE, IMPORT_MODE_UPSERT], default=IMPORT_MODE_REPLACE,
+                            help='Replace all polling units or apply only the changes')
+        parser.add_argument('--dry-run', action='store_true', help='Parse and validate without writing to the database')
+
+    def collect_files(self, paths):
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                        files.append(os.path.join(path, name))
+            elif os.path.exists(path):
+                files.append(path)
+            else:
+                raise CommandError(f'File not found: {path}')
+        if not files:
+            raise CommandError('No importable files found')
+        return files
+
+    def write(self, combined, mode, batch_size):
+        """
+        Import under the same locks as an upload. The import lock keeps a web
+        import, and its use of the staging table, out; the data lock is not
+        waited for, so the command stops while an allocation job or recompute
+        is writing results.
+        """
+        owner = new_lock_owner('import')
+        if not acquire_lock(IMPORT_LOCK, owner):
+            raise CommandError('Another import is queued or running. Please wait for it to finish.')
+
+        def report(rows_done, rows_total):
+            for name in (IMPORT_LOCK, DATA_LOCK):
+                refresh_lock(name, owner)
+
         try:
-            df = pd.read_excel(file_path)
-            
-            # Clear existing data
-            PollingUnit.objects.all().delete()
-            self.stdout.write(self.style.WARNING('Cleared existing polling units'))
-            
-            # Import data
-            for _, row in df.iterrows():
-                PollingUnit.objects.create(
-                    sno=row.get('S/NO', 0),
-                    state=str(row.get('STATE', '')),
-                    lga=str(row.get('LGA', '')),
-                    ra=str(row.get('RA', '')),
-                    delim=str(row.get('DELIM', '')),
-                    register_voter_2023=str(row.get('REGISTER VOTER AS AT 2023', '')),
-                    registered_voter_2024=int(row.get('REGISTERED VOTER AS AT 2024', 0)),
-                    pvc_collected=int(row.get('NO OF PVC COLLECTED ', 0)),
-                    balance_uncollected=int(row.get('BALANCE OF UNCOLECTED PVCs', 0)),
-                    pvc_45_percent=float(row.get('45% PVC COLLECTION', 0)),
-                    aa_original=float(row.get('AA', 0)),
-                    ad_original=float(row.get('AD', 0)),
-                    adc_original=float(row.get('ADC', 0)),
-                    apc_original=float(row.get('APC', 0)),
-                    lp_original=float(row.get('LP', 0)),
-                    pdp_original=float(row.get('PDP', 0)),
-                )
-            
-            self.stdout.write(
-                self.style.SUCCESS(f'Successfully imported {len(df)} polling units')
+            with hold_lock(DATA_LOCK, owner, timeout=0):
+                if mode == IMPORT_MODE_UPSERT:
+                    stats = upsert_polling_units(combined, batch_size=batch_size, progress=report)
+                    recomputed = recompute_results()
+                    stats.timings['recompute'] = round(recomputed['elapsed'], 3)
+                    summary = (f'{stats.unchanged_count} unchanged, {stats.changed_count} changed, '
+                               f'{stats.created_count} added, {stats.removed_count} removed, '
+                               f"{recomputed['refreshed'] + recomputed['created']} results recomputed")
+                    return stats, summary, PollingUnit.objects.count()
+                stats = bulk_import_polling_units(combined, batch_size=batch_size, progress=report)
+                return stats, f'imported {stats.created_count} polling units', stats.created_count
+        except LockBusy:
+            raise CommandError('An allocation job or recompute is writing results. '
+                               'Please import once it has finished.')
+        finally:
+            release_lock(IMPORT_LOCK, owner)
+
+    def handle(self, *args, **options):
+        files = self.collect_files(options['paths'])
+        batch_size = options['batch_size'] or get_import_batch_size()
+        workers = options['workers'] or min(len(files), os.cpu_count() or 1)
+        started = time.perf_counter()
+
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(parse_and_validate, path, options['vote_field'], get_csv_chunk_size())
+                for path in files
+            ]
+            for future in futures:
+                results.append(future.result())
+        parse_wall = time.perf_counter() - started
+
+        uploads, labels = [], []
+        parse_total = validate_total = 0.0
+        for path, normalized, field, message, parse_time, validate_time in results:
+            parse_total += parse_time
+            validate_total += validate_time
+            if normalized is None:
+                raise CommandError(f'{path}: {message}')
+            self.stdout.write(f'{path}: {len(normalized)} rows, vote field "{field}" '
+                              f'(parse {parse_time:.2f}s, validate {validate_time:.2f}s)')
+            uploads.append(normalized)
+            labels.append(os.path.basename(path))
+
+        combined = concat_normalized(uploads, labels)
+        for error in combined.row_errors:
+            self.stdout.write(self.style.WARNING(error))
+
+        insert_time = 0.0
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run: {len(combined)} valid rows would be imported'))
+        else:
+            stats, summary, total_records = self.write(combined, options['mode'], batch_size)
+            insert_time = stats.elapsed
+
+            UploadSession.objects.create(
+                vote_count_field_name=combined.vote_count_field[:100],
+                total_records=total_records,
+                status=UploadSession.STATUS_COMPLETED,
+                phase='done',
+                import_mode=options['mode'],
+                rows_processed=stats.rows_processed,
+                error_count=len(stats.errors),
+                phase_timings={'parse': round(parse_wall, 3), 'validate': round(validate_total, 3),
+                               'import': round(insert_time, 3), **stats.timings},
+                finished_at=timezone.now(),
             )
-            
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Error importing data: {str(e)}'))
\ No newline at end of file
+            self.stdout.write(self.style.SUCCESS(f'Successfully {summary} ({stats.rows_per_second:.0f} rows/s)'))
+
+        total = time.perf_counter() - started
+        self.stdout.write(f'Timing breakdown ({workers} parser processes):')
+        self.stdout.write(f'  parse     {parse_total:8.2f}s')
+        self.stdout.write(f'  validate  {validate_total:8.2f}s')
+        self.stdout.write(f'  (pool wall time for parse + validate: {parse_wall:.2f}s)')
+        self.stdout.write(f'  insert    {insert_time:8.2f}s')
+        if not options['dry_run'] and 'swap' in stats.timings:
+            self.stdout.write(f'    (of which atomic swap: {stats.timings["swap"]:.2f}s)')
+        self.stdout.write(f'  total     {total:8.2f}s')
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.allocation import recompute_results
+from app.locks import DATA_LOCK, hold_lock, new_lock_owner
+from app.models import VoteAllocation
+
+
+class Command(BaseCommand):
+    help = 'Recompute allocation results whose polling units changed, and add rows for new units'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--allocation', type=int, action='append', dest='allocations',
+                            help='Only this allocation id (may be repeated)')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='Result rows per bulk insert (defaults to RESULT_BATCH_SIZE)')
+
+    def handle(self, *args, **options):
+        allocations = None
+        if options['allocations']:
+            allocations = list(VoteAllocation.objects.filter(id__in=options['allocations']))
+            if len(allocations) != len(set(options['allocations'])):
+                raise CommandError('One or more allocations were not found')
+
+        # Waits for a running import or allocation job to finish first
+        with hold_lock(DATA_LOCK, new_lock_owner('recompute')):
+            stats = recompute_results(allocations, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed {stats['refreshed']}, added {stats['created']} and removed {stats['removed']} "
+            f"results in {stats['elapsed']:.2f}s"
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import VoteAllocation, AllocationSimulation
+from app.simulation import create_simulation, run_simulation, DEFAULT_SIMULATION_RUNS
+
+
+class Command(BaseCommand):
+    help = 'Run a Monte Carlo simulation of realistic variation for an allocation and store percentile bands'
+
+    def add_arguments(self, parser):
+        parser.add_argument('allocation_id', type=int)
+        parser.add_argument('--runs', type=int, default=DEFAULT_SIMULATION_RUNS, help='Number of draws')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (defaults to SIMULATION_WORKERS or the CPU count)')
+        parser.add_argument('--seed', type=int, default=None, help="Seed (defaults to the allocation's seed)")
+
+    def handle(self, *args, **options):
+        try:
+            allocation = VoteAllocation.objects.get(id=options['allocation_id'])
+        except VoteAllocation.DoesNotExist:
+            raise CommandError(f"Allocation {options['allocation_id']} not found")
+
+        try:
+            simulation = create_simulation(allocation, options['runs'], options['seed'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        simulation = run_simulation(simulation, options['workers'])
+        if simulation.status != AllocationSimulation.STATUS_COMPLETED:
+            raise CommandError(simulation.message)
+
+        self.stdout.write(f"{'party':<8}{'p5':>12}{'p50':>12}{'p95':>12}")
+        for party, p5, p50, p95 in simulation.national_rows():
+            self.stdout.write(f'{party:<8}{p5:>12}{p50:>12}{p95:>12}')
+        self.stdout.write(self.style.SUCCESS(f'{simulation.message} in {simulation.elapsed:.2f}s (simulation {simulation.id})'))
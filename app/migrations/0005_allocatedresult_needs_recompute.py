@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 18:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='allocatedresult',
+            name='needs_recompute',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.1.4 on 2026-10-17 18:52
+
+from django.db import migrations, models
+
+
+def mark_existing_completed(apps, schema_editor):
+    # Uploads recorded before background jobs were all finished imports
+    UploadSession = apps.get_model('app', 'UploadSession')
+    UploadSession.objects.update(status='completed', phase='done')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_allocatedresult_needs_recompute'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='error_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='finished_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='import_mode',
+            field=models.CharField(default='replace', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='message',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='phase',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='phase_timings',
+            field=models.JSONField(blank=True, default=dict, help_text='Seconds spent in each import phase'),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='rows_processed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('needs_field', 'Waiting for vote field'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='upload_digest',
+            field=models.CharField(blank=True, help_text='Content hash of the staged upload', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='uploadsession',
+            name='vote_count_field_name',
+            field=models.CharField(blank=True, help_text='The field name used for vote counts', max_length=100),
+        ),
+        migrations.RunPython(mark_existing_completed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_uploadsession_job_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voteallocation',
+            name='method',
+            field=models.CharField(choices=[('truncate', 'Truncate each share'), ('largest_remainder', 'Largest remainder (exact totals)')], default='truncate', help_text='How party shares are turned into whole votes', max_length=20),
+        ),
+    ]
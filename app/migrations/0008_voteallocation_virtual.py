@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_voteallocation_method'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voteallocation',
+            name='virtual',
+            field=models.BooleanField(default=False, help_text='Compute results from polling units on read instead of storing them'),
+        ),
+    ]
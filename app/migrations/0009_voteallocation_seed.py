@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_voteallocation_virtual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='voteallocation',
+            name='seed',
+            field=models.PositiveIntegerField(blank=True, help_text='Random seed used by the realistic variation method', null=True),
+        ),
+        migrations.AlterField(
+            model_name='voteallocation',
+            name='method',
+            field=models.CharField(choices=[('truncate', 'Truncate each share'), ('largest_remainder', 'Largest remainder (exact totals)'), ('realistic', 'Realistic variation (seeded)')], default='truncate', help_text='How party shares are turned into whole votes', max_length=20),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_voteallocation_seed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationSimulation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('runs', models.PositiveIntegerField(default=1000)),
+                ('seed', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('summary', models.JSONField(blank=True, default=dict)),
+                ('elapsed', models.FloatField(default=0)),
+                ('message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('vote_allocation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='simulations', to='app.voteallocation')),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_allocationsimulation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('phase', models.CharField(blank=True, max_length=20)),
+                ('shard_by', models.CharField(choices=[('state', 'State'), ('lga', 'LGA')], default='state', max_length=10)),
+                ('workers', models.PositiveIntegerField(default=1)),
+                ('shards', models.JSONField(blank=True, default=list)),
+                ('rows_written', models.IntegerField(default=0)),
+                ('elapsed', models.FloatField(default=0)),
+                ('message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('vote_allocation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='app.voteallocation')),
+            ],
+        ),
+    ]
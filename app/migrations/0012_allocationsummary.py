@@ -0,0 +1,46 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_allocationjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('aa_votes', models.FloatField(default=0)),
+                ('ad_votes', models.FloatField(default=0)),
+                ('adc_votes', models.FloatField(default=0)),
+                ('apc_votes', models.FloatField(default=0)),
+                ('lp_votes', models.FloatField(default=0)),
+                ('pdp_votes', models.FloatField(default=0)),
+                ('nrm_votes', models.FloatField(default=0)),
+                ('nnpp_votes', models.FloatField(default=0)),
+                ('prp_votes', models.FloatField(default=0)),
+                ('sdp_votes', models.FloatField(default=0)),
+                ('ypp_votes', models.FloatField(default=0)),
+                ('yp_votes', models.FloatField(default=0)),
+                ('zlp_votes', models.FloatField(default=0)),
+                ('a_votes', models.FloatField(default=0)),
+                ('aac_votes', models.FloatField(default=0)),
+                ('adp_votes', models.FloatField(default=0)),
+                ('apm_votes', models.FloatField(default=0)),
+                ('apga_votes', models.FloatField(default=0)),
+                ('app_votes', models.FloatField(default=0)),
+                ('bp_votes', models.FloatField(default=0)),
+                ('total_votes', models.FloatField(default=0)),
+                ('base_votes', models.FloatField(default=0)),
+                ('invalid_votes', models.FloatField(default=0)),
+                ('unit_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('vote_allocation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='app.voteallocation')),
+            ],
+        ),
+    ]
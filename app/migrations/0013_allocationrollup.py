@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_allocationsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('level', models.CharField(choices=[('national', 'National'), ('state', 'State'), ('lga', 'LGA'), ('ra', 'RA')], max_length=10)),
+                ('state', models.CharField(blank=True, max_length=100)),
+                ('lga', models.CharField(blank=True, max_length=100)),
+                ('ra', models.CharField(blank=True, max_length=100)),
+                ('aa_votes', models.FloatField(default=0)),
+                ('ad_votes', models.FloatField(default=0)),
+                ('adc_votes', models.FloatField(default=0)),
+                ('apc_votes', models.FloatField(default=0)),
+                ('lp_votes', models.FloatField(default=0)),
+                ('pdp_votes', models.FloatField(default=0)),
+                ('nrm_votes', models.FloatField(default=0)),
+                ('nnpp_votes', models.FloatField(default=0)),
+                ('prp_votes', models.FloatField(default=0)),
+                ('sdp_votes', models.FloatField(default=0)),
+                ('ypp_votes', models.FloatField(default=0)),
+                ('yp_votes', models.FloatField(default=0)),
+                ('zlp_votes', models.FloatField(default=0)),
+                ('a_votes', models.FloatField(default=0)),
+                ('aac_votes', models.FloatField(default=0)),
+                ('adp_votes', models.FloatField(default=0)),
+                ('apm_votes', models.FloatField(default=0)),
+                ('apga_votes', models.FloatField(default=0)),
+                ('app_votes', models.FloatField(default=0)),
+                ('bp_votes', models.FloatField(default=0)),
+                ('total_votes', models.FloatField(default=0)),
+                ('base_votes', models.FloatField(default=0)),
+                ('unit_count', models.IntegerField(default=0)),
+                ('vote_allocation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='app.voteallocation')),
+            ],
+            options={
+                'ordering': ['state', 'lga', 'ra'],
+                'unique_together': {('vote_allocation', 'level', 'state', 'lga', 'ra')},
+            },
+        ),
+    ]
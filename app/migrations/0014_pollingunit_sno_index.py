@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_allocationrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pollingunit',
+            index=models.Index(fields=['sno', 'id'], name='pollingunit_sno_id_idx'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+from django.db import migrations
+
+# SQLite: an FTS5 index over the polling unit table, kept in step by triggers.
+# MySQL: a FULLTEXT index on the same columns, which InnoDB maintains itself.
+SQLITE_CREATE = [
+    """CREATE VIRTUAL TABLE app_pollingunit_search USING fts5(
+        state, lga, delim, content='app_pollingunit', content_rowid='id', prefix='2 3'
+    )""",
+    """CREATE TRIGGER app_pollingunit_search_insert AFTER INSERT ON app_pollingunit BEGIN
+        INSERT INTO app_pollingunit_search(rowid, state, lga, delim) VALUES (new.id, new.state, new.lga, new.delim);
+    END""",
+    """CREATE TRIGGER app_pollingunit_search_delete AFTER DELETE ON app_pollingunit BEGIN
+        INSERT INTO app_pollingunit_search(app_pollingunit_search, rowid, state, lga, delim)
+        VALUES ('delete', old.id, old.state, old.lga, old.delim);
+    END""",
+    """CREATE TRIGGER app_pollingunit_search_update AFTER UPDATE OF state, lga, delim ON app_pollingunit BEGIN
+        INSERT INTO app_pollingunit_search(app_pollingunit_search, rowid, state, lga, delim)
+        VALUES ('delete', old.id, old.state, old.lga, old.delim);
+        INSERT INTO app_pollingunit_search(rowid, state, lga, delim) VALUES (new.id, new.state, new.lga, new.delim);
+    END""",
+    "INSERT INTO app_pollingunit_search(app_pollingunit_search) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS app_pollingunit_search_insert",
+    "DROP TRIGGER IF EXISTS app_pollingunit_search_delete",
+    "DROP TRIGGER IF EXISTS app_pollingunit_search_update",
+    "DROP TABLE IF EXISTS app_pollingunit_search",
+]
+MYSQL_CREATE = ["CREATE FULLTEXT INDEX pollingunit_search ON app_pollingunit (state, lga, delim)"]
+MYSQL_DROP = ["DROP INDEX pollingunit_search ON app_pollingunit"]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_pollingunit_sno_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_CREATE, 'mysql': MYSQL_CREATE}),
+            run({'sqlite': SQLITE_DROP, 'mysql': MYSQL_DROP}),
+        ),
+    ]
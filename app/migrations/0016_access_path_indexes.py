@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-17 19:34
+
+from django.db import migrations, models
+
+
+def analyze(apps, schema_editor):
+    # Existing databases get planner statistics now rather than after the next import
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("ANALYZE app_pollingunit")
+        schema_editor.execute("ANALYZE app_allocatedresult")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_pollingunit_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='allocatedresult',
+            index=models.Index(condition=models.Q(('needs_recompute', True)), fields=['vote_allocation'], name='allocatedresult_stale_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pollingunit',
+            index=models.Index(fields=['state', 'lga', 'ra'], name='pollingunit_geo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pollingunit',
+            index=models.Index(fields=['pvc_45_percent'], name='pollingunit_base_idx'),
+        ),
+        migrations.RunPython(analyze, migrations.RunPython.noop),
+    ]
@@ -46,6 +46,14 @@ class PollingUnit(models.Model):
 
     class Meta:
         ordering = ['sno']
+        indexes = [
+            # Keyset pagination seeks on (sno, id)
+            models.Index(fields=['sno', 'id'], name='pollingunit_sno_id_idx'),
+            # Admin state/LGA filters and the geography rollups
+            models.Index(fields=['state', 'lga', 'ra'], name='pollingunit_geo_idx'),
+            # Covers the dashboard's national base total
+            models.Index(fields=['pvc_45_percent'], name='pollingunit_base_idx'),
+        ]
 
     def __str__(self):
         return f"{self.state} - {self.lga} - {self.delim}"
@@ -53,8 +61,24 @@ class PollingUnit(models.Model):
 
 
 class VoteAllocation(models.Model):
+    METHOD_TRUNCATE = 'truncate'
+    METHOD_LARGEST_REMAINDER = 'largest_remainder'
+    METHOD_REALISTIC = 'realistic'
+
+    METHOD_CHOICES = [
+        (METHOD_TRUNCATE, 'Truncate each share'),
+        (METHOD_LARGEST_REMAINDER, 'Largest remainder (exact totals)'),
+        (METHOD_REALISTIC, 'Realistic variation (seeded)'),
+    ]
+
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
+    method = models.CharField(max_length=20, choices=METHOD_CHOICES, default=METHOD_TRUNCATE,
+                              help_text="How party shares are turned into whole votes")
+    virtual = models.BooleanField(default=False,
+                                  help_text="Compute results from polling units on read instead of storing them")
+    seed = models.PositiveIntegerField(null=True, blank=True,
+                                       help_text="Random seed used by the realistic variation method")
 
     # Party allocation percentages (total should be 100)
     aa_percentage = models.FloatField(default=0, help_text="Percentage for AA party")
@@ -148,19 +172,266 @@ class AllocatedResult(models.Model):
     bp_votes = models.FloatField(default=0)
     total_votes = models.FloatField(default=0)
 
+    # Set when the polling unit changed after these votes were calculated
+    needs_recompute = models.BooleanField(default=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ['polling_unit', 'vote_allocation']
+        indexes = [
+            # Only the few results flagged for recompute, for the stale count and recompute_results
+            models.Index(fields=['vote_allocation'], condition=models.Q(needs_recompute=True),
+                         name='allocatedresult_stale_idx'),
+        ]
 
     def __str__(self):
         return f"{self.polling_unit.delim} - {self.vote_allocation.name}"
 
+class AllocationSummary(models.Model):
+    """Party totals of an allocation's results, kept so pages do not re-aggregate every row"""
+    vote_allocation = models.OneToOneField(VoteAllocation, on_delete=models.CASCADE, related_name='summary')
+
+    aa_votes = models.FloatField(default=0)
+    ad_votes = models.FloatField(default=0)
+    adc_votes = models.FloatField(default=0)
+    apc_votes = models.FloatField(default=0)
+    lp_votes = models.FloatField(default=0)
+    pdp_votes = models.FloatField(default=0)
+    nrm_votes = models.FloatField(default=0)
+    nnpp_votes = models.FloatField(default=0)
+    prp_votes = models.FloatField(default=0)
+    sdp_votes = models.FloatField(default=0)
+    ypp_votes = models.FloatField(default=0)
+    yp_votes = models.FloatField(default=0)
+    zlp_votes = models.FloatField(default=0)
+    a_votes = models.FloatField(default=0)
+    aac_votes = models.FloatField(default=0)
+    adp_votes = models.FloatField(default=0)
+    apm_votes = models.FloatField(default=0)
+    apga_votes = models.FloatField(default=0)
+    app_votes = models.FloatField(default=0)
+    bp_votes = models.FloatField(default=0)
+    total_votes = models.FloatField(default=0)
+
+    # Base votes of the units with results, and how many of them went to no party
+    base_votes = models.FloatField(default=0)
+    invalid_votes = models.FloatField(default=0)
+    unit_count = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.vote_allocation.name} - {self.unit_count} units"
+
+    def totals(self):
+        """Totals keyed like the views' Sum() aggregates (total_<code>, grand_total) plus the unit KPIs"""
+        totals = {}
+        for field in AllocatedResult._meta.fields:
+            if field.name.endswith('_votes') and field.name != 'total_votes':
+                totals[f'total_{field.name[:-len("_votes")]}'] = getattr(self, field.name)
+        totals.update(grand_total=self.total_votes, base_total=self.base_votes,
+                      invalid_votes=self.invalid_votes, unit_count=self.unit_count)
+        return totals
+
+    @classmethod
+    def invalidate(cls, virtual_only=False):
+        """Drop summaries and rollups after polling units change; they are rebuilt on the next read"""
+        summaries = cls.objects.all()
+        rollups = AllocationRollup.objects.all()
+        if virtual_only:
+            summaries = summaries.filter(vote_allocation__virtual=True)
+            rollups = rollups.filter(vote_allocation__virtual=True)
+        summaries.delete()
+        rollups.delete()
+
+class AllocationRollup(models.Model):
+    """Party votes of an allocation summed at one level of the national > state > LGA > RA hierarchy"""
+    LEVEL_NATIONAL = 'national'
+    LEVEL_STATE = 'state'
+    LEVEL_LGA = 'lga'
+    LEVEL_RA = 'ra'
+
+    LEVEL_CHOICES = [
+        (LEVEL_NATIONAL, 'National'),
+        (LEVEL_STATE, 'State'),
+        (LEVEL_LGA, 'LGA'),
+        (LEVEL_RA, 'RA'),
+    ]
+
+    vote_allocation = models.ForeignKey(VoteAllocation, on_delete=models.CASCADE, related_name='rollups')
+    level = models.CharField(max_length=10, choices=LEVEL_CHOICES)
+    # Blank below the row's own level, e.g. a state row has no lga or ra
+    state = models.CharField(max_length=100, blank=True)
+    lga = models.CharField(max_length=100, blank=True)
+    ra = models.CharField(max_length=100, blank=True)
+
+    aa_votes = models.FloatField(default=0)
+    ad_votes = models.FloatField(default=0)
+    adc_votes = models.FloatField(default=0)
+    apc_votes = models.FloatField(default=0)
+    lp_votes = models.FloatField(default=0)
+    pdp_votes = models.FloatField(default=0)
+    nrm_votes = models.FloatField(default=0)
+    nnpp_votes = models.FloatField(default=0)
+    prp_votes = models.FloatField(default=0)
+    sdp_votes = models.FloatField(default=0)
+    ypp_votes = models.FloatField(default=0)
+    yp_votes = models.FloatField(default=0)
+    zlp_votes = models.FloatField(default=0)
+    a_votes = models.FloatField(default=0)
+    aac_votes = models.FloatField(default=0)
+    adp_votes = models.FloatField(default=0)
+    apm_votes = models.FloatField(default=0)
+    apga_votes = models.FloatField(default=0)
+    app_votes = models.FloatField(default=0)
+    bp_votes = models.FloatField(default=0)
+    total_votes = models.FloatField(default=0)
+    base_votes = models.FloatField(default=0)
+    unit_count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['vote_allocation', 'level', 'state', 'lga', 'ra']
+        ordering = ['state', 'lga', 'ra']
+
+    def __str__(self):
+        return f"{self.vote_allocation.name} - {self.name}"
+
+    @property
+    def name(self):
+        return {self.LEVEL_STATE: self.state, self.LEVEL_LGA: self.lga, self.LEVEL_RA: self.ra}.get(self.level, 'National')
+
 class UploadSession(models.Model):
     """Store information about uploaded data sessions"""
-    vote_count_field_name = models.CharField(max_length=100, help_text="The field name used for vote counts")
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_NEEDS_FIELD = 'needs_field'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_NEEDS_FIELD, 'Waiting for vote field'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = [STATUS_QUEUED, STATUS_RUNNING]
+
+    vote_count_field_name = models.CharField(max_length=100, blank=True, help_text="The field name used for vote counts")
     total_records = models.IntegerField(default=0)
+
+    # Background import job state
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    phase = models.CharField(max_length=20, blank=True)
+    import_mode = models.CharField(max_length=20, default='replace')
+    upload_digest = models.CharField(max_length=64, blank=True, help_text="Content hash of the staged upload")
+    rows_processed = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    phase_timings = models.JSONField(default=dict, blank=True, help_text="Seconds spent in each import phase")
+    message = models.TextField(blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
     
     def __str__(self):
-        return f"Upload {self.id} - {self.vote_count_field_name} ({self.total_records} records)"
\ No newline at end of file
+        return f"Upload {self.id} - {self.vote_count_field_name} ({self.total_records} records)"
+
+    @classmethod
+    def latest_completed(cls):
+        return cls.objects.filter(status=cls.STATUS_COMPLETED).order_by('-created_at').first()
+
+
+class JobLock(models.Model):
+    """A named lock shared by every worker process, held by one owner at a time"""
+    name = models.CharField(max_length=50, unique=True)
+    owner = models.CharField(max_length=100, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.owner or 'free'})"
+
+
+class AllocationJob(models.Model):
+    """Progress of a background allocation computed in shards of polling units"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    ACTIVE_STATUSES = [STATUS_QUEUED, STATUS_RUNNING]
+
+    SHARD_BY_CHOICES = [
+        ('state', 'State'),
+        ('lga', 'LGA'),
+    ]
+
+    vote_allocation = models.ForeignKey(VoteAllocation, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    phase = models.CharField(max_length=20, blank=True)
+    shard_by = models.CharField(max_length=10, choices=SHARD_BY_CHOICES, default='state')
+    workers = models.PositiveIntegerField(default=1)
+
+    # [{"key": "ANAMBRA", "units": 4800, "status": "written", "compute": 0.12, "write": 0.8}, ...]
+    shards = models.JSONField(default=list, blank=True)
+    rows_written = models.IntegerField(default=0)
+    elapsed = models.FloatField(default=0)
+    message = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.vote_allocation.name} - {self.get_status_display()}"
+
+
+class AllocationSimulation(models.Model):
+    """Percentile bands from a Monte Carlo run of realistic variation over an allocation"""
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    vote_allocation = models.ForeignKey(VoteAllocation, on_delete=models.CASCADE, related_name='simulations')
+    runs = models.PositiveIntegerField(default=1000)
+    seed = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+
+    # {"percentiles": [5, 50, 95], "parties": [...], "national": {party: [p5, p50, p95]},
+    #  "states": {state: {party: [...]}}, "lgas": {state: {lga: {party: [...]}}}}
+    summary = models.JSONField(default=dict, blank=True)
+    elapsed = models.FloatField(default=0)
+    message = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.vote_allocation.name} - {self.runs} runs ({self.status})"
+
+    def band_rows(self, bands):
+        """[(party label, p5, p50, p95)] for one {party: [p5, p50, p95]} mapping"""
+        parties = self.summary.get('parties', []) + ['total']
+        return [(party.upper(), *bands[party]) for party in parties if party in bands]
+
+    def national_rows(self):
+        return self.band_rows(self.summary.get('national', {}))
+
+    def state_rows(self):
+        """[(state, [(party label, p5, p50, p95), ...])] sorted by state"""
+        states = self.summary.get('states', {})
+        return [(state, self.band_rows(states[state])) for state in sorted(states)]
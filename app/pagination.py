@@ -0,0 +1,141 @@
+# pagination.py - Keyset (seek) pagination with cached approximate counts
+import hashlib
+import math
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.db.models import Q
+
+DEFAULT_COUNT_CACHE_TIMEOUT = 60  # seconds a listing's row count may lag behind
+MIN_SORT_VALUE = -2 ** 31  # lowest IntegerField value, an open lower bound for the first page
+
+
+def cached_count(queryset, key, timeout=DEFAULT_COUNT_CACHE_TIMEOUT):
+    """
+    Row count of a queryset, shared through the cache for a short while so
+    listings do not run COUNT(*) on every request
+    """
+    digest = hashlib.md5(key.encode()).hexdigest()
+    return cache.get_or_set(f'listing-count-{digest}', queryset.count, timeout)
+
+
+def parse_cursor(value):
+    """(sort value, id) from an "after"/"before" parameter such as "120:4521", or None"""
+    try:
+        sort_value, row_id = value.split(':')
+        return int(sort_value), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the last (sort value, id) shown
+    instead of using OFFSET, so every page costs the same as the first.
+    keys names the sort field and its unique tie-breaker, e.g. ('sno', 'id').
+    count is the (approximate) total used only for display.
+    """
+
+    def __init__(self, queryset, per_page, keys, count):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.sort_key, self.id_key = keys
+        self.count = count
+
+    @property
+    def num_pages(self):
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def _after(self, cursor):
+        sort_value, row_id = cursor
+        # The leading >= keeps the seek on the sort index; the OR only breaks ties
+        return Q(**{f'{self.sort_key}__gte': sort_value}) & (
+            Q(**{f'{self.sort_key}__gt': sort_value}) | Q(**{f'{self.id_key}__gt': row_id})
+        )
+
+    def _before(self, cursor):
+        sort_value, row_id = cursor
+        return Q(**{f'{self.sort_key}__lte': sort_value}) & (
+            Q(**{f'{self.sort_key}__lt': sort_value}) | Q(**{f'{self.id_key}__lt': row_id})
+        )
+
+    def get_page(self, params):
+        """The page for request.GET-style params: after=<cursor> or before=<cursor>, plus page=<number>"""
+        after, before = parse_cursor(params.get('after')), parse_cursor(params.get('before'))
+        try:
+            number = max(1, int(params.get('page', 1)))
+        except (TypeError, ValueError):
+            number = 1
+        ordering = [self.sort_key, self.id_key]
+
+        if before:
+            rows = list(self.queryset.filter(self._before(before)).order_by(*[f'-{key}' for key in ordering])[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next = True
+        else:
+            if after:
+                queryset = self.queryset.filter(self._after(after))
+            else:
+                # A range on the sort key lets the planner walk its index on a joined table too
+                queryset = self.queryset.filter(**{f'{self.sort_key}__gte': MIN_SORT_VALUE})
+            rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = after is not None
+        if not has_previous:
+            number = 1
+        return KeysetPage(self, rows, number, has_previous, has_next, params)
+
+
+class KeysetPage:
+    """One page of rows with the Previous/Next links a Paginator page template needs"""
+
+    def __init__(self, paginator, object_list, number, has_previous, has_next, params):
+        self.paginator = paginator
+        self.object_list = object_list
+        self.number = number
+        self._has_previous = has_previous
+        self._has_next = has_next
+        # Keep the other query parameters (such as search) on the links
+        self._params = {key: value for key, value in params.items() if key not in ('after', 'before', 'page')}
+        self._first = self._cursor(object_list[0]) if object_list else None
+        self._last = self._cursor(object_list[-1]) if object_list else None
+
+    def _cursor(self, row):
+        values = []
+        for key in (self.paginator.sort_key, self.paginator.id_key):
+            value = row
+            for part in key.split('__'):
+                value = getattr(value, part)
+            values.append(str(value))
+        return ':'.join(values)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and self._first is not None
+
+    def has_next(self):
+        return self._has_next and self._last is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def previous_query(self):
+        return urlencode({**self._params, 'before': self._first, 'page': self.number - 1})
+
+    def next_query(self):
+        return urlencode({**self._params, 'after': self._last, 'page': self.number + 1})
+
+    def start_index(self):
+        if not self.object_list:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        return (self.number - 1) * self.paginator.per_page + len(self.object_list)
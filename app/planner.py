@@ -0,0 +1,21 @@
+# planner.py - Keep the database's table statistics current after bulk writes
+from django.db import connection
+
+from .models import PollingUnit, AllocatedResult
+
+# The large tables whose row counts the planner needs to choose between their indexes
+ANALYZED_MODELS = [PollingUnit, AllocatedResult]
+
+
+def update_planner_stats():
+    """
+    Refresh planner statistics for the polling unit and result tables.
+    Without them SQLite assumes an allocation's results are a small slice and
+    sorts every one of them for a results page, instead of walking units in
+    sno order and probing each result. InnoDB keeps its own statistics.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for model in ANALYZED_MODELS:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
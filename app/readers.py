@@ -0,0 +1,155 @@
+# readers.py - Format detection and parsing for uploaded polling unit data
+import os
+
+import openpyxl
+import pandas as pd
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from django.conf import settings
+
+FORMAT_XLSX = 'xlsx'
+FORMAT_XLS = 'xls'
+FORMAT_CSV = 'csv'
+FORMAT_PARQUET = 'parquet'
+FORMAT_FEATHER = 'feather'
+
+SUPPORTED_EXTENSIONS = {
+    '.xlsx': FORMAT_XLSX,
+    '.xls': FORMAT_XLS,
+    '.csv': FORMAT_CSV,
+    '.txt': FORMAT_CSV,
+    '.parquet': FORMAT_PARQUET,
+    '.pq': FORMAT_PARQUET,
+    '.feather': FORMAT_FEATHER,
+    '.arrow': FORMAT_FEATHER,
+}
+
+# Leading bytes identifying binary formats
+MAGIC_BYTES = [
+    (b'PK\x03\x04', FORMAT_XLSX),
+    (b'\xd0\xcf\x11\xe0', FORMAT_XLS),
+    (b'PAR1', FORMAT_PARQUET),
+    (b'ARROW1', FORMAT_FEATHER),
+]
+
+DEFAULT_CSV_CHUNK_SIZE = 50000
+DEFAULT_PROBE_SAMPLE_ROWS = 200
+
+# CSV columns read as text in every chunk, so a value like '1' stays text
+# even when the chunk it falls in holds nothing else
+CSV_TEXT_COLUMNS = ['STATE', 'LGA', 'RA', 'DELIM', 'REGISTER VOTER AS AT 2023']
+
+
+def get_csv_chunk_size():
+    return getattr(settings, 'CSV_CHUNK_SIZE', DEFAULT_CSV_CHUNK_SIZE)
+
+
+def get_probe_sample_rows():
+    return getattr(settings, 'PROBE_SAMPLE_ROWS', DEFAULT_PROBE_SAMPLE_ROWS)
+
+
+def detect_format(header, filename=None):
+    """
+    Detect the file format from its first bytes, falling back to the file
+    extension. Plain text without a known extension is treated as CSV.
+    Returns None if the format is not supported.
+    """
+    for magic, file_format in MAGIC_BYTES:
+        if header.startswith(magic):
+            return file_format
+
+    if filename:
+        extension = os.path.splitext(filename)[1].lower()
+        if extension in SUPPORTED_EXTENSIONS:
+            return SUPPORTED_EXTENSIONS[extension]
+
+    try:
+        header.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    return FORMAT_CSV
+
+
+def detect_file_format(path, filename=None):
+    with open(path, 'rb') as source:
+        header = source.read(8)
+    return detect_format(header, filename or path)
+
+
+def read_csv_chunked(path, chunk_size=None):
+    """
+    Read a CSV in fixed-size chunks to bound the parser's working memory.
+    Text columns get an explicit str dtype rather than one inferred per
+    chunk; numeric columns that turn to text partway down come back mixed,
+    which normalize_upload coerces and flags row by row.
+    """
+    dtype = {column: str for column in CSV_TEXT_COLUMNS}
+    try:
+        frames = list(pd.read_csv(path, chunksize=chunk_size or get_csv_chunk_size(), dtype=dtype))
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame()
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_tabular(path, filename=None, csv_chunk_size=None):
+    """Parse an Excel, CSV, Parquet or Feather file into a DataFrame"""
+    file_format = detect_file_format(path, filename)
+    if file_format in (FORMAT_XLSX, FORMAT_XLS):
+        return pd.read_excel(path)
+    if file_format == FORMAT_CSV:
+        return read_csv_chunked(path, csv_chunk_size)
+    if file_format == FORMAT_PARQUET:
+        return pd.read_parquet(path)
+    if file_format == FORMAT_FEATHER:
+        return pd.read_feather(path)
+    raise ValueError("Unsupported file format. Please upload an Excel, CSV, Parquet or Feather file.")
+
+
+def _probe_xlsx(path, sample_rows):
+    """Read the header and first rows with openpyxl's streaming read-only reader"""
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(max_row=sample_rows + 1, values_only=True)
+        header = next(rows, ())
+        columns = [str(name) if name is not None else f'Unnamed: {i}' for i, name in enumerate(header)]
+        data = [row[:len(columns)] for row in rows if any(value is not None for value in row)]
+    finally:
+        workbook.close()
+    return pd.DataFrame(data, columns=columns)
+
+
+def _probe_parquet(path, sample_rows):
+    parquet_file = pq.ParquetFile(path)
+    batch = next(parquet_file.iter_batches(batch_size=sample_rows), None)
+    if batch is None:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    return batch.to_pandas()
+
+
+def _probe_feather(path, sample_rows):
+    with ipc.open_file(path) as reader:
+        if reader.num_record_batches == 0:
+            return reader.schema.empty_table().to_pandas()
+        return reader.get_batch(0).slice(0, sample_rows).to_pandas()
+
+
+def probe_tabular(path, filename=None, sample_rows=None):
+    """
+    Read only the header row and a bounded sample of a file, without parsing
+    the whole thing. Used to detect the vote count column before a full parse.
+    """
+    sample_rows = sample_rows or get_probe_sample_rows()
+    file_format = detect_file_format(path, filename)
+    if file_format == FORMAT_XLSX:
+        return _probe_xlsx(path, sample_rows)
+    if file_format == FORMAT_XLS:
+        return pd.read_excel(path, nrows=sample_rows)
+    if file_format == FORMAT_CSV:
+        return pd.read_csv(path, nrows=sample_rows)
+    if file_format == FORMAT_PARQUET:
+        return _probe_parquet(path, sample_rows)
+    if file_format == FORMAT_FEATHER:
+        return _probe_feather(path, sample_rows)
+    raise ValueError("Unsupported file format. Please upload an Excel, CSV, Parquet or Feather file.")
@@ -0,0 +1,200 @@
+# scenarios.py - Create many vote allocations from one batch of percentage vectors
+import json
+import math
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .allocation import (
+    PARTY_CODES, ResultWriter, load_base_votes, base_field, percentage_vector, result_rows, iter_results,
+    vote_function, new_seed, parse_seed, SEED_LIMIT, refresh_summary,
+)
+from .models import VoteAllocation
+
+SCENARIO_EXTENSIONS = ['.json', '.csv', '.xlsx', '.xls']
+
+# Optional scenario columns besides the party percentages
+SCENARIO_FIELDS = ['name', 'description', 'method', 'virtual', 'seed']
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+
+
+def read_scenarios(source, filename):
+    """
+    Read scenario records from a JSON, CSV or Excel file (path or file
+    object). JSON may be a list of objects or {"scenarios": [...]}.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.json':
+        if hasattr(source, 'read'):
+            return records_from_json(json.load(source))
+        with open(source, 'rb') as handle:
+            return records_from_json(json.load(handle))
+    if extension == '.csv':
+        return pd.read_csv(source).to_dict('records')
+    if extension in ('.xlsx', '.xls'):
+        return pd.read_excel(source, sheet_name=0).to_dict('records')
+    raise ValueError(f"Unsupported scenario file: {filename}. Use one of {', '.join(SCENARIO_EXTENSIONS)}")
+
+
+def records_from_json(data):
+    if isinstance(data, dict):
+        data = data.get('scenarios')
+    if not isinstance(data, list) or not all(isinstance(record, dict) for record in data):
+        raise ValueError('Expected a list of scenario objects')
+    return data
+
+
+def _is_blank(value):
+    return value is None or (isinstance(value, float) and math.isnan(value)) or str(value).strip() == ''
+
+
+def _party_code(key):
+    """Party code for a column named 'apc', 'APC' or 'apc_percentage'"""
+    key = key.strip().lower()
+    if key.endswith('_percentage'):
+        key = key[:-len('_percentage')]
+    return key if key in PARTY_CODES else None
+
+
+def build_scenarios(records):
+    """
+    Turn scenario records into unsaved VoteAllocation objects, applying the
+    same rules as the create form. Returns (allocations, errors).
+    """
+    allocations, errors = [], []
+    methods = dict(VoteAllocation.METHOD_CHOICES)
+    for position, record in enumerate(records, start=1):
+        label = f'Scenario {position}'
+        values = {}
+        record_errors = []
+        for key, value in record.items():
+            field = str(key).strip().lower()
+            code = _party_code(field)
+            if code:
+                try:
+                    percentage = 0.0 if _is_blank(value) else float(value)
+                except (TypeError, ValueError):
+                    record_errors.append(f'{label}: invalid percentage for {code.upper()}: {value}')
+                    continue
+                if not 0 <= percentage <= 100:
+                    record_errors.append(f'{label}: percentage for {code.upper()} must be between 0 and 100')
+                values[f'{code}_percentage'] = percentage
+            elif field in SCENARIO_FIELDS:
+                values[field] = None if _is_blank(value) else value
+            else:
+                record_errors.append(f'{label}: unknown column "{key}"')
+
+        name = str(values.pop('name', None) or '').strip()
+        if not name:
+            record_errors.append(f'{label}: a name is required')
+        else:
+            label = f'Scenario "{name}"'
+        method = values.pop('method', None) or VoteAllocation.METHOD_TRUNCATE
+        if method not in methods:
+            record_errors.append(f'{label}: unknown method "{method}"')
+        virtual = str(values.pop('virtual', None) or '').strip().lower() in TRUE_VALUES
+        if virtual and method != VoteAllocation.METHOD_TRUNCATE:
+            record_errors.append(f'{label}: only the truncate method can be virtual')
+        seed = values.pop('seed', None)
+        if seed is not None:
+            try:
+                seed = parse_seed(int(float(seed)))
+            except (TypeError, ValueError):
+                record_errors.append(f'{label}: seed must be a whole number between 0 and {SEED_LIMIT - 1}')
+        elif method == VoteAllocation.METHOD_REALISTIC:
+            seed = new_seed()
+
+        allocation = VoteAllocation(
+            name=name[:200], description=str(values.pop('description', None) or ''),
+            method=method, virtual=virtual, seed=seed, **values
+        )
+        if not record_errors and not allocation.is_valid_allocation():
+            record_errors.append(f'{label}: total percentage is {allocation.total_percentage():.2f}%. Should be 100%.')
+
+        errors.extend(record_errors)
+        allocations.append(allocation)
+    if not records:
+        errors.append('No scenarios found')
+    return allocations, errors
+
+
+def compute_batch_votes(base_votes, percentages):
+    """
+    Units x scenarios x parties truncated votes from one broadcast product of
+    the base-vote vector and the scenarios' percentage matrix. The
+    multiplication matches compute_truncated_votes, so each scenario's slice
+    is identical to allocating it on its own.
+    """
+    shares = np.asarray(percentages, dtype=np.float64) / 100
+    return np.trunc(np.asarray(base_votes, dtype=np.float64)[:, None, None] * shares[None, :, :])
+
+
+def create_scenarios(allocations, batch_size=None):
+    """
+    Save validated scenarios and all of their results in one transaction,
+    loading the polling units once. Truncated scenarios are computed
+    together a chunk of units at a time; other methods run their own engine
+    over the same base votes. Returns a report with per-scenario timings.
+    """
+    started = time.perf_counter()
+    writers = {}
+    with transaction.atomic():
+        for allocation in allocations:
+            allocation.save()
+            if not allocation.virtual:
+                writers[allocation.id] = ResultWriter(batch_size)
+
+        stored = [allocation for allocation in allocations if not allocation.virtual]
+        truncated = [allocation for allocation in stored if allocation.method == VoteAllocation.METHOD_TRUNCATE]
+        others = [allocation for allocation in stored if allocation.method != VoteAllocation.METHOD_TRUNCATE]
+        compute_seconds = 0.0
+
+        bases = {}
+        for allocation in stored:
+            field = base_field(allocation)
+            if field not in bases:
+                bases[field] = load_base_votes(field)
+
+        if truncated:
+            unit_ids, base_votes = bases['pvc_45_percent']
+            matrix = np.array([percentage_vector(allocation) for allocation in truncated])
+            chunk_size = writers[truncated[0].id].batch_size
+            for offset in range(0, len(unit_ids), chunk_size):
+                chunk_ids = unit_ids[offset:offset + chunk_size]
+                compute_started = time.perf_counter()
+                block = compute_batch_votes(base_votes[offset:offset + chunk_size], matrix)
+                compute_seconds += time.perf_counter() - compute_started
+                for index, allocation in enumerate(truncated):
+                    writers[allocation.id].write(result_rows(allocation, chunk_ids, block[:, index, :]))
+
+        for allocation in others:
+            unit_ids, base_votes = bases[base_field(allocation)]
+            writer = writers[allocation.id]
+            writer.write(iter_results(allocation, unit_ids, base_votes, vote_function(allocation), writer.batch_size))
+
+        for allocation in stored:
+            refresh_summary(allocation)
+
+    scenarios = []
+    for allocation in allocations:
+        writer = writers.get(allocation.id)
+        scenarios.append({
+            'id': allocation.id,
+            'name': allocation.name,
+            'method': allocation.method,
+            'virtual': allocation.virtual,
+            'seed': allocation.seed,
+            'results': writer.rows_written if writer else 0,
+            'seconds': round(writer.elapsed, 4) if writer else 0.0,
+            'rows_per_second': round(writer.rows_per_second) if writer else 0,
+        })
+    return {
+        'created': len(allocations),
+        'compute_seconds': round(compute_seconds, 4),
+        'elapsed': round(time.perf_counter() - started, 4),
+        'scenarios': scenarios,
+    }
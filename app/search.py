@@ -0,0 +1,72 @@
+# search.py - Prefix search over polling unit state, LGA and name through a full-text index
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import PollingUnit
+
+SEARCH_TABLE = 'app_pollingunit_search'  # FTS5 table on SQLite, see migration 0015
+SEARCH_COLUMNS = ('state', 'lga', 'delim')
+
+
+def search_terms(text):
+    """The words of a search box entry, each matched as a prefix"""
+    return re.findall(r'\w+', text or '')
+
+
+def match_query(terms, vendor):
+    """Full-text query requiring every term as a prefix in any searched column"""
+    if vendor == 'mysql':
+        return ' '.join(f'+{term}*' for term in terms)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _matching_ids_sql(terms, vendor, ranked=False):
+    """SQL selecting the ids of matching units (best match first when ranked) and its params"""
+    query = match_query(terms, vendor)
+    if vendor == 'sqlite':
+        sql = f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+        return (f"{sql} ORDER BY rank" if ranked else sql), [query]
+    match = f"MATCH ({', '.join(SEARCH_COLUMNS)}) AGAINST (%s IN BOOLEAN MODE)"
+    sql = f"SELECT id FROM {PollingUnit._meta.db_table} WHERE {match}"
+    if ranked:
+        return f"{sql} ORDER BY {match} DESC", [query, query]
+    return sql, [query]
+
+
+def search_filter(text, unit_path=''):
+    """
+    A Q matching units (or, with unit_path='polling_unit__', their results)
+    whose state, LGA or name contain every word of text as a prefix. It reads
+    the full-text index on SQLite and MySQL and falls back to icontains on
+    other backends.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return Q(pk__in=[])
+    vendor = connection.vendor
+    if vendor not in ('sqlite', 'mysql'):
+        condition = Q()
+        for term in terms:
+            condition &= Q(*[(f'{unit_path}{column}__icontains', term) for column in SEARCH_COLUMNS], _connector=Q.OR)
+        return condition
+    sql, params = _matching_ids_sql(terms, vendor)
+    return Q(**{f'{unit_path}id__in': RawSQL(sql, params)})
+
+
+def ranked_units(text, limit=10):
+    """The best matching polling units for text, most relevant first"""
+    terms = search_terms(text)
+    if not terms:
+        return []
+    vendor = connection.vendor
+    if vendor not in ('sqlite', 'mysql'):
+        return list(PollingUnit.objects.filter(search_filter(text))[:limit])
+    sql, params = _matching_ids_sql(terms, vendor, ranked=True)
+    with connection.cursor() as cursor:
+        cursor.execute(f"{sql} LIMIT %s", params + [limit])
+        ids = [row[0] for row in cursor.fetchall()]
+    units = PollingUnit.objects.in_bulk(ids)
+    return [units[unit_id] for unit_id in ids if unit_id in units]
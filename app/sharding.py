@@ -0,0 +1,257 @@
+# sharding.py - Compute allocation votes in geographic shards across worker processes
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .allocation import (
+    PARTY_CODES, ResultWriter, base_field, ensure_seed, insert_truncated_results, make_vote_function,
+    percentage_vector, refresh_summary, result_rows,
+)
+from .locks import DATA_LOCK, hold_lock, refresh_lock
+from .models import AllocatedResult, AllocationJob, AllocationSummary, PollingUnit, VoteAllocation
+from .planner import update_planner_stats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARALLEL_MIN_UNITS = 20000  # below this a process pool costs more than it saves
+
+SHARD_FIELDS = {
+    'state': ['state'],
+    'lga': ['state', 'lga'],
+}
+
+
+def get_allocation_workers():
+    """Processes used for sharded allocations, configurable via ALLOCATION_WORKERS"""
+    return getattr(settings, 'ALLOCATION_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_parallel_min_units():
+    return getattr(settings, 'ALLOCATION_PARALLEL_MIN_UNITS', DEFAULT_PARALLEL_MIN_UNITS)
+
+
+def load_shards(field, shard_by):
+    """
+    Ids and base votes of every unit with votes, grouped by state (or state
+    and LGA) with ids ascending inside each group, plus the shards as
+    [(key, start, stop)] slices of those arrays.
+    """
+    group_fields = SHARD_FIELDS[shard_by]
+    rows = PollingUnit.objects.filter(**{f'{field}__gt': 0}).order_by(*group_fields, 'id').values_list(
+        'id', field, *group_fields
+    )
+    unit_ids, base_votes, shards = [], [], []
+    for position, (unit_id, base, *group) in enumerate(rows.iterator(chunk_size=10000)):
+        key = ' / '.join(group)
+        if not shards or shards[-1][0] != key:
+            if shards:
+                shards[-1][2] = position
+            shards.append([key, position, None])
+        unit_ids.append(unit_id)
+        base_votes.append(base)
+    if shards:
+        shards[-1][2] = len(unit_ids)
+    return np.array(unit_ids, dtype=np.int64), np.array(base_votes, dtype=np.float64), [tuple(shard) for shard in shards]
+
+
+class SharedArrays:
+    """
+    Unit ids, base votes and the output vote matrix in shared memory, so
+    worker processes read and write them in place instead of receiving
+    pickled copies. Use as a context manager; the blocks are freed on exit.
+    """
+
+    def __init__(self, unit_ids, base_votes, parties):
+        self.count = len(unit_ids)
+        self.parties = parties
+        self._blocks = []
+        self.unit_ids = self._share(unit_ids.astype(np.int64), (self.count,))
+        self.base_votes = self._share(base_votes.astype(np.float64), (self.count,))
+        self.votes = self._share(None, (self.count, parties))
+
+    def _share(self, values, shape):
+        dtype = values.dtype if values is not None else np.dtype(np.float64)
+        block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+        self._blocks.append(block)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        if values is not None:
+            array[:] = values
+        return array
+
+    @property
+    def names(self):
+        """Picklable handle workers use to attach to the same blocks"""
+        return self.count, self.parties, [block.name for block in self._blocks]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unit_ids = self.base_votes = self.votes = None
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+
+
+def compute_shard(names, method, percentages, seed, start, stop):
+    """Worker: compute one shard's votes straight into the shared output matrix"""
+    started = time.perf_counter()
+    count, parties, block_names = names
+    blocks = [shared_memory.SharedMemory(name=name) for name in block_names]
+    try:
+        unit_ids = np.ndarray((count,), dtype=np.int64, buffer=blocks[0].buf)
+        base_votes = np.ndarray((count,), dtype=np.float64, buffer=blocks[1].buf)
+        votes = np.ndarray((count, parties), dtype=np.float64, buffer=blocks[2].buf)
+        compute_votes = make_vote_function(method, percentages, seed)
+        votes[start:stop] = compute_votes(unit_ids[start:stop], base_votes[start:stop])
+        del unit_ids, base_votes, votes
+    finally:
+        for block in blocks:
+            block.close()
+    return time.perf_counter() - started
+
+
+def compute_sharded(method, percentages, seed, unit_ids, base_votes, shards, workers, on_shard_done=None):
+    """
+    Units x parties vote matrix computed shard by shard. With more than one
+    worker and enough units the shards run in a process pool over shared
+    memory; otherwise they run inline. on_shard_done(index, seconds) is
+    called in this process as each shard finishes.
+    """
+    percentages = np.asarray(percentages, dtype=np.float64).tolist()
+    if workers <= 1 or len(unit_ids) < get_parallel_min_units():
+        compute_votes = make_vote_function(method, percentages, seed)
+        votes = np.empty((len(unit_ids), len(PARTY_CODES)))
+        for index, (_, start, stop) in enumerate(shards):
+            started = time.perf_counter()
+            votes[start:stop] = compute_votes(unit_ids[start:stop], base_votes[start:stop])
+            if on_shard_done:
+                on_shard_done(index, time.perf_counter() - started)
+        return votes
+
+    with SharedArrays(unit_ids, base_votes, len(PARTY_CODES)) as shared:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(compute_shard, shared.names, method, percentages, seed, start, stop): index
+                for index, (_, start, stop) in enumerate(shards)
+            }
+            for future in as_completed(futures):
+                seconds = future.result()
+                if on_shard_done:
+                    on_shard_done(futures[future], seconds)
+        return shared.votes.copy()
+
+
+def allocation_lock_owner(job):
+    return f'allocation-{job.id}'
+
+
+def _save_job(job, *fields):
+    refresh_lock(DATA_LOCK, allocation_lock_owner(job))
+    job.save(update_fields=[*fields, 'updated_at'])
+
+
+def run_allocation(job, workers=None):
+    """
+    Compute and store an allocation's results shard by shard. Worker
+    processes only compute into shared memory; this process is the single
+    database writer and commits each shard on its own so progress shows up
+    while the job runs. Truncated allocations skip the shards and are
+    written in the database. A failed job leaves no partial results behind.
+    The job stays queued while an import or recompute holds the data lock.
+    """
+    with hold_lock(DATA_LOCK, allocation_lock_owner(job)):
+        started = time.perf_counter()
+        allocation = job.vote_allocation
+        job.status = AllocationJob.STATUS_RUNNING
+        job.phase = 'load'
+        _save_job(job, 'status', 'phase')
+        try:
+            if allocation.method == VoteAllocation.METHOD_TRUNCATE:
+                _run_in_database(job, allocation)
+            else:
+                _run_shards(job, allocation, workers)
+            update_planner_stats()
+            job.status = AllocationJob.STATUS_COMPLETED
+            job.phase = 'done'
+        except Exception as e:
+            logger.exception('Allocation job %s failed', job.id)
+            AllocatedResult.objects.filter(vote_allocation=allocation).delete()
+            AllocationSummary.objects.filter(vote_allocation=allocation).delete()
+            job.status = AllocationJob.STATUS_FAILED
+            job.rows_written = 0
+            job.message = f'Error computing allocation: {str(e)}'
+        job.elapsed = round(time.perf_counter() - started, 3)
+        job.finished_at = timezone.now()
+        job.save()
+    return job
+
+
+def _run_in_database(job, allocation):
+    """Truncation is a single INSERT ... SELECT, so there is nothing to shard"""
+    job.phase = 'write'
+    job.shards = [{'key': 'All units (in database)', 'units': 0, 'status': 'queued', 'compute': None, 'write': None}]
+    _save_job(job, 'phase', 'shards')
+    started = time.perf_counter()
+    with transaction.atomic():
+        job.rows_written = insert_truncated_results(allocation)
+        refresh_summary(allocation)
+    job.shards[0].update(units=job.rows_written, status='written', write=round(time.perf_counter() - started, 3))
+    job.message = f'{job.rows_written} results with one INSERT ... SELECT'
+
+
+def _run_shards(job, allocation, workers):
+    """Compute the allocation's shards in the pool, then write them one transaction each"""
+    ensure_seed(allocation)
+    unit_ids, base_votes, shards = load_shards(base_field(allocation), job.shard_by)
+    job.workers = max(1, min(workers or get_allocation_workers(), len(shards) or 1))
+    job.shards = [
+        {'key': key, 'units': stop - start, 'status': 'queued', 'compute': None, 'write': None}
+        for key, start, stop in shards
+    ]
+    job.phase = 'compute'
+    _save_job(job, 'workers', 'shards', 'phase')
+
+    def computed(index, seconds):
+        job.shards[index].update(status='computed', compute=round(seconds, 3))
+        _save_job(job, 'shards')
+
+    votes = compute_sharded(allocation.method, percentage_vector(allocation), allocation.seed,
+                            unit_ids, base_votes, shards, job.workers, computed)
+
+    job.phase = 'write'
+    _save_job(job, 'phase')
+    for index, (_, start, stop) in enumerate(shards):
+        writer = ResultWriter()
+        writer.write(result_rows(allocation, unit_ids[start:stop], votes[start:stop]))
+        job.shards[index].update(status='written', write=round(writer.elapsed, 3))
+        job.rows_written += writer.rows_written
+        _save_job(job, 'shards', 'rows_written')
+
+    # Shards commit separately for progress, so the summary follows the last one
+    refresh_summary(allocation)
+    job.message = (f'{job.rows_written} results in {len(shards)} {job.get_shard_by_display()} shards '
+                   f'using {job.workers} processes')
+
+
+def job_progress(job):
+    """Progress snapshot for the allocation job status endpoint"""
+    return {
+        'id': job.id,
+        'status': job.status,
+        'phase': job.phase,
+        'workers': job.workers,
+        'shards': job.shards,
+        'shards_done': sum(1 for shard in job.shards if shard['status'] == 'written'),
+        'rows_written': job.rows_written,
+        'total_rows': sum(shard['units'] for shard in job.shards),
+        'elapsed': job.elapsed,
+        'message': job.message,
+    }
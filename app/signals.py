@@ -0,0 +1,48 @@
+# signals.py - Keep allocation results in step with polling unit edits
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import PollingUnit, AllocatedResult, AllocationSummary
+
+# Fields the allocation rollups group by
+GEOGRAPHY_FIELDS = ('state', 'lga', 'ra')
+
+
+@receiver(pre_save, sender=PollingUnit)
+def remember_base_votes(sender, instance, raw=False, **kwargs):
+    """Keep the stored vote bases and geography so post_save can tell whether they changed"""
+    if raw or instance.pk is None:
+        return
+    previous = PollingUnit.objects.filter(pk=instance.pk).values_list(
+        'pvc_45_percent', 'pvc_collected', *GEOGRAPHY_FIELDS
+    ).first()
+    if previous:
+        instance._previous_bases, instance._previous_geography = previous[:2], previous[2:]
+
+
+@receiver(post_save, sender=PollingUnit)
+def mark_results_dirty(sender, instance, created, raw=False, **kwargs):
+    """
+    Flag every allocation result of an edited polling unit for recompute
+    when the votes it is based on changed. New units have no results yet;
+    recompute_results picks them up as missing rows.
+    """
+    if raw:
+        return
+    if created:
+        AllocationSummary.invalidate(virtual_only=True)
+        return
+    previous_geography = getattr(instance, '_previous_geography', None)
+    if previous_geography is not None and previous_geography != tuple(getattr(instance, field) for field in GEOGRAPHY_FIELDS):
+        # Moving a unit changes every allocation's rollups, and no result is flagged to repair them
+        AllocationSummary.invalidate()
+    if getattr(instance, '_previous_bases', None) != (instance.pvc_45_percent, instance.pvc_collected):
+        AllocatedResult.objects.filter(polling_unit=instance).update(needs_recompute=True)
+        # Virtual allocations read the new bases straight away
+        AllocationSummary.invalidate(virtual_only=True)
+
+
+@receiver(post_delete, sender=PollingUnit)
+def drop_summaries(sender, instance, **kwargs):
+    """A deleted unit takes its results with it, so every allocation's totals change"""
+    AllocationSummary.invalidate()
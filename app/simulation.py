@@ -0,0 +1,151 @@
+# simulation.py - Monte Carlo simulation of realistic allocation outcomes
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .allocation import PARTY_CODES, new_seed, percentage_vector, variation_draws, compute_realistic_votes
+from .models import PollingUnit, AllocationSimulation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIMULATION_RUNS = 1000
+# Every draw keeps an LGAs x parties block of float32 totals until the
+# percentiles are taken: about 60 KB for 774 LGAs and all 20 parties, so
+# 5000 runs stay near 300 MB
+DEFAULT_MAX_SIMULATION_RUNS = 5000
+PERCENTILES = [5, 50, 95]
+
+
+def get_simulation_workers():
+    """Processes used for a simulation, configurable via SIMULATION_WORKERS"""
+    return getattr(settings, 'SIMULATION_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_max_simulation_runs():
+    return getattr(settings, 'SIMULATION_MAX_RUNS', DEFAULT_MAX_SIMULATION_RUNS)
+
+
+def load_simulation_inputs():
+    """
+    Unit ids and PVCs collected in id order, plus the permutation that groups
+    units by (state, LGA), the start of each LGA group in that order and the
+    (state, LGA) key of every group.
+    """
+    rows = list(PollingUnit.objects.filter(pvc_collected__gt=0).order_by('id').values_list(
+        'id', 'pvc_collected', 'state', 'lga'
+    ))
+    unit_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    base_votes = np.array([row[1] for row in rows], dtype=np.float64)
+    keys = [(row[2], row[3]) for row in rows]
+    order = np.array(sorted(range(len(keys)), key=keys.__getitem__), dtype=np.int64)
+    starts, lga_keys = [], []
+    for position, index in enumerate(order.tolist()):
+        if not lga_keys or keys[index] != lga_keys[-1]:
+            starts.append(position)
+            lga_keys.append(keys[index])
+    return unit_ids, base_votes, order, np.array(starts, dtype=np.int64), lga_keys
+
+
+def simulate_lga_totals(seed, draws, unit_ids, base_votes, percentages, order, starts, party_indexes):
+    """
+    LGA x party vote totals of the parties at party_indexes for each draw
+    number in `draws`. Runs in a worker process and only returns the totals,
+    never the per-unit votes.
+    """
+    totals = np.empty((len(draws), len(starts), len(party_indexes)), dtype=np.float32)
+    for index, draw in enumerate(draws):
+        turnout, variation = variation_draws((seed, draw), unit_ids, len(percentages))
+        votes = compute_realistic_votes(base_votes, percentages, turnout, variation)
+        totals[index] = np.add.reduceat(votes[order][:, party_indexes], starts, axis=0)
+    return totals
+
+
+def _bands(totals, parties):
+    """{party: [p5, p50, p95], 'total': [...]} from a draws x parties array"""
+    with_total = np.column_stack([totals, totals.sum(axis=1)])
+    values = np.rint(np.percentile(with_total, PERCENTILES, axis=0)).astype(int).T.tolist()
+    return dict(zip(parties + ['total'], values))
+
+
+def summarize(lga_totals, lga_keys, parties):
+    """
+    Percentile bands at national, state and LGA level from a
+    draws x LGAs x parties float32 array of totals. National and state sums
+    are taken in float64; the LGA array is never copied whole.
+    """
+    summary = {'percentiles': PERCENTILES, 'parties': parties, 'states': {}, 'lgas': {}}
+    summary['national'] = _bands(lga_totals.sum(axis=1, dtype=np.float64), parties)
+
+    # LGA groups are sorted by state, so each state is a contiguous run
+    states = [state for state, _ in lga_keys]
+    state_starts = [index for index, state in enumerate(states) if index == 0 or state != states[index - 1]]
+    if lga_keys:
+        state_totals = np.add.reduceat(lga_totals, state_starts, axis=1, dtype=np.float64)
+    for position, start in enumerate(state_starts):
+        summary['states'][states[start]] = _bands(state_totals[:, position, :], parties)
+    for position, (state, lga) in enumerate(lga_keys):
+        summary['lgas'].setdefault(state, {})[lga] = _bands(lga_totals[:, position, :].astype(np.float64), parties)
+    return summary
+
+
+def run_simulation(simulation, workers=None):
+    """
+    Run simulation.runs draws of realistic variation for the simulation's
+    allocation, split across a process pool, and store the percentile
+    summary on the simulation.
+    """
+    started = time.perf_counter()
+    simulation.status = AllocationSimulation.STATUS_RUNNING
+    simulation.save(update_fields=['status'])
+    try:
+        percentages = percentage_vector(simulation.vote_allocation)
+        unit_ids, base_votes, order, starts, lga_keys = load_simulation_inputs()
+        if not len(unit_ids):
+            raise ValueError('No polling units with collected PVCs to simulate')
+
+        # Only parties with a share are totalled, and each worker's draws are
+        # copied straight into one preallocated array
+        party_indexes = [index for index, percentage in enumerate(percentages.tolist()) if percentage > 0]
+        lga_totals = np.empty((simulation.runs, len(starts), len(party_indexes)), dtype=np.float32)
+        workers = max(1, min(workers or get_simulation_workers(), simulation.runs))
+        draw_chunks = [chunk.tolist() for chunk in np.array_split(np.arange(simulation.runs), workers)]
+        args = (unit_ids, base_votes, percentages, order, starts, party_indexes)
+        if workers == 1:
+            lga_totals[:] = simulate_lga_totals(simulation.seed, draw_chunks[0], *args)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(simulate_lga_totals, simulation.seed, draws, *args) for draws in draw_chunks]
+                for draws, future in zip(draw_chunks, futures):
+                    lga_totals[draws[0]:draws[-1] + 1] = future.result()
+
+        simulation.summary = summarize(lga_totals, lga_keys, [PARTY_CODES[index] for index in party_indexes])
+        simulation.status = AllocationSimulation.STATUS_COMPLETED
+        simulation.message = f'{simulation.runs} runs over {len(unit_ids)} polling units using {workers} processes'
+    except Exception as e:
+        logger.exception('Simulation %s failed', simulation.id)
+        simulation.status = AllocationSimulation.STATUS_FAILED
+        simulation.message = f'Error running simulation: {str(e)}'
+    simulation.elapsed = round(time.perf_counter() - started, 3)
+    simulation.finished_at = timezone.now()
+    simulation.save()
+    return simulation
+
+
+def create_simulation(allocation, runs=None, seed=None):
+    """
+    A queued simulation for an allocation, reusing its seed when it has one.
+    Raises ValueError when runs is above SIMULATION_MAX_RUNS.
+    """
+    runs = runs or DEFAULT_SIMULATION_RUNS
+    if not 1 <= runs <= get_max_simulation_runs():
+        raise ValueError(f'Runs must be between 1 and {get_max_simulation_runs()}')
+    if seed is None:
+        seed = allocation.seed if allocation.seed is not None else new_seed()
+    return AllocationSimulation.objects.create(
+        vote_allocation=allocation, runs=runs, seed=seed,
+    )
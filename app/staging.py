@@ -0,0 +1,179 @@
+# staging.py - Server-side staging of parsed uploads
+import hashlib
+import os
+import time
+
+import pandas as pd
+from django.conf import settings
+
+from .readers import detect_format, read_tabular, probe_tabular
+
+DEFAULT_STAGING_TTL = 60 * 60  # 1 hour
+
+
+def get_staging_dir():
+    """Directory holding staged uploads, configurable via UPLOAD_STAGING_DIR"""
+    staging_dir = getattr(settings, 'UPLOAD_STAGING_DIR',
+                          os.path.join(settings.MEDIA_ROOT, 'upload_staging'))
+    os.makedirs(staging_dir, exist_ok=True)
+    return staging_dir
+
+
+def get_staging_ttl():
+    return getattr(settings, 'UPLOAD_STAGING_TTL', DEFAULT_STAGING_TTL)
+
+
+def hash_upload(uploaded_file):
+    """Return the SHA-256 hex digest of an uploaded file's content"""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def staged_path(digest):
+    return os.path.join(get_staging_dir(), f"{digest}.parquet")
+
+
+def _to_columnar(df):
+    """Make a parsed workbook safe to store as Parquet"""
+    df = df.copy()
+    df.columns = [str(col) for col in df.columns]
+    for col in df.columns:
+        if df[col].dtype == object:
+            # Mixed-type cells (numbers typed as text etc.) are kept as text;
+            # normalize_upload coerces them later anyway
+            df[col] = df[col].map(lambda value: value if pd.isna(value) else str(value))
+    return df
+
+
+def _is_fresh(path):
+    """Whether a staged file exists and is younger than the TTL; an expired one is removed"""
+    try:
+        if time.time() - os.path.getmtime(path) <= get_staging_ttl():
+            return True
+        os.remove(path)
+    except OSError:
+        pass
+    return False
+
+
+def load_staged(digest):
+    """Return the staged DataFrame for digest, or None if missing or expired"""
+    if not digest:
+        return None
+    path = staged_path(digest)
+    try:
+        if time.time() - os.path.getmtime(path) > get_staging_ttl():
+            os.remove(path)
+            return None
+        df = pd.read_parquet(path)
+        os.utime(path)  # Reuse keeps the staged copy alive
+        return df
+    except (OSError, ValueError):
+        return None
+
+
+def stage_dataframe(digest, df):
+    """Write a parsed upload to the staging area and return the stored frame"""
+    cleanup_staged_uploads()
+    df = _to_columnar(df)
+    path = staged_path(digest)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return df
+
+
+def cleanup_staged_uploads():
+    """Delete staged uploads older than the TTL; returns the number removed"""
+    staging_dir = get_staging_dir()
+    cutoff = time.time() - get_staging_ttl()
+    removed = 0
+    for name in os.listdir(staging_dir):
+        path = os.path.join(staging_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+def raw_path(digest, file_format=None):
+    """
+    Path of the unparsed upload. Raw files keep their format as extension
+    because some readers (openpyxl) refuse unknown extensions. Without a
+    format, returns the existing raw file for digest or None.
+    """
+    if file_format:
+        return os.path.join(get_staging_dir(), f"{digest}.{file_format}")
+    for name in os.listdir(get_staging_dir()):
+        if name.startswith(f"{digest}.") and not name.endswith(('.parquet', '.tmp')):
+            return os.path.join(get_staging_dir(), name)
+    return None
+
+
+def save_raw_upload(uploaded_file):
+    """
+    Store an uploaded file's bytes for later parsing and return its digest.
+    Nothing is written when the same content is already staged.
+    """
+    header = next(uploaded_file.chunks(), b'')[:8]
+    uploaded_file.seek(0)
+    file_format = detect_format(header, uploaded_file.name)
+    if file_format is None:
+        raise ValueError("Unsupported file format. Please upload an Excel, CSV, Parquet or Feather file.")
+
+    digest = hash_upload(uploaded_file)
+    for path in (staged_path(digest), raw_path(digest)):
+        # An expired copy counts as missing, or load_or_parse would drop it and find nothing
+        if path and _is_fresh(path):
+            os.utime(path)
+            return digest
+
+    path = raw_path(digest, file_format)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as destination:
+        for chunk in uploaded_file.chunks():
+            destination.write(chunk)
+    uploaded_file.seek(0)
+    os.replace(tmp_path, path)
+    return digest
+
+
+def load_or_parse(digest):
+    """
+    Return (df, from_cache) for a saved upload, parsing and staging the raw
+    file on first use.
+    """
+    df = load_staged(digest)
+    if df is not None:
+        return df, True
+
+    path = raw_path(digest)
+    if path is None:
+        raise FileNotFoundError("Uploaded file has expired. Please upload it again.")
+    df = stage_dataframe(digest, read_tabular(path))
+    os.remove(path)
+    return df, False
+
+
+def probe_upload(digest, sample_rows=None):
+    """Header and sample rows of a saved upload, read without a full parse"""
+    for path in (staged_path(digest), raw_path(digest)):
+        if path and os.path.exists(path):
+            return probe_tabular(path, sample_rows=sample_rows)
+    raise FileNotFoundError("Uploaded file has expired. Please upload it again.")
+
+
+def read_upload(uploaded_file):
+    """
+    Parse an uploaded file, reusing the staged copy when the same content
+    was uploaded before. Returns (digest, df, from_cache).
+    """
+    digest = save_raw_upload(uploaded_file)
+    df, from_cache = load_or_parse(digest)
+    return digest, df, from_cache
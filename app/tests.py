@@ -1,11 +1,20 @@
 from django.test import TestCase
 
 # Create your tests here.
-from django.test import TestCase
+from unittest import skipUnless
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.urls import reverse
-from .models import PollingUnit, VoteAllocation, AllocatedResult
+from django.http import QueryDict
+from django.db.models import Count, Sum
+from .models import PollingUnit, VoteAllocation, AllocatedResult, UploadSession
+from .utils import detect_vote_count_field, normalize_upload
+import json
+import os
 import tempfile
+import time
 import pandas as pd
+from io import BytesIO
 
 class VoteAllocationTestCase(TestCase):
     def setUp(self):
@@ -62,3 +71,941 @@ class VoteAllocationTestCase(TestCase):
         }
         response = self.client.post(reverse('create_allocation'), data)
         self.assertEqual(response.status_code, 302)  # Redirect after successful creation
+
+
+def make_upload_dataframe(rows=5):
+    """Build a workbook-shaped DataFrame with the required columns"""
+    return pd.DataFrame({
+        'S/NO': list(range(1, rows + 1)),
+        'STATE': ['ANAMBRA'] * rows,
+        'LGA': ['AGUATA'] * rows,
+        'RA': ['ACHINA I'] * rows,
+        'DELIM': [f'UNIT {i}' for i in range(1, rows + 1)],
+        'REGISTER VOTER AS AT 2023': [f'04-01-01-{i:03d}' for i in range(1, rows + 1)],
+        'REGISTERED VOTER AS AT 2024': ['1,000'] * rows,
+        'NO OF PVC COLLECTED ': [900] * rows,
+        'BALANCE OF UNCOLECTED PVCs': [100] * rows,
+        '45% PVC COLLECTION': [405.4] * rows,
+    })
+
+
+class ExcelImportTestCase(TestCase):
+    def make_dataframe(self, rows=5):
+        return make_upload_dataframe(rows)
+
+    def test_bulk_import_in_batches(self):
+        """Test batched import replaces existing units and reports throughput"""
+        from .importer import bulk_import_polling_units
+        from .utils import normalize_upload
+        from django.db import connection
+        old_unit = PollingUnit.objects.create(
+            sno=99, state="OLD", lga="OLD", ra="OLD", delim="OLD",
+            register_voter_2023="X", registered_voter_2024=1,
+            pvc_collected=1, balance_uncollected=0, pvc_45_percent=1.0
+        )
+        allocation = VoteAllocation.objects.create(name="Old", apc_percentage=100.0)
+        AllocatedResult.objects.create(polling_unit=old_unit, vote_allocation=allocation)
+        df = self.make_dataframe(7)
+        df.loc[3, 'REGISTERED VOTER AS AT 2024'] = 'n/a'
+
+        with self.assertLogs('app.importer', level='DEBUG') as logs:
+            stats = bulk_import_polling_units(normalize_upload(df, '45% PVC COLLECTION'), batch_size=2)
+
+        self.assertEqual(stats.created_count, 6)
+        self.assertEqual(len(stats.errors), 1)
+        self.assertIn('row 5', stats.errors[0])
+        # Batches log at debug and the import once at info; row errors stay in stats
+        self.assertEqual([record.levelname for record in logs.records], ['DEBUG'] * 3 + ['INFO'])
+        self.assertFalse(any('row 5' in line for line in logs.output))
+        self.assertEqual(PollingUnit.objects.count(), 6)
+        self.assertFalse(PollingUnit.objects.filter(state="OLD").exists())
+        unit = PollingUnit.objects.get(sno=1)
+        self.assertEqual(unit.registered_voter_2024, 1000)
+        self.assertEqual(unit.pvc_45_percent, 405)
+        self.assertGreaterEqual(stats.rows_per_second, 0)
+        self.assertFalse(AllocatedResult.objects.exists())
+        self.assertIn('swap', stats.timings)
+        self.assertNotIn('app_pollingunit_staging', connection.introspection.table_names())
+
+    def test_normalize_upload_coerces_once(self):
+        """Test vectorized normalization dtypes and per-row error mask"""
+        from .utils import normalize_upload, validate_vote_count_field
+        df = self.make_dataframe(4)
+        df['45% PVC COLLECTION'] = df['45% PVC COLLECTION'].astype(object)
+        df.loc[1, '45% PVC COLLECTION'] = 'bad'
+        df.loc[2, 'S/NO'] = None
+
+        normalized = normalize_upload(df, '45% PVC COLLECTION')
+
+        self.assertEqual(normalized.error_mask.tolist(), [False, True, False, False])
+        self.assertEqual(normalized.skip_mask.tolist(), [False, False, True, False])
+        self.assertEqual(len(normalized), 2)
+        self.assertEqual(str(normalized.frame['state'].dtype), 'category')
+        self.assertEqual(str(normalized.frame['sno'].dtype), 'int8')
+        self.assertEqual(normalized.frame['registered_voter_2024'].tolist(), [1000, 1000])
+        is_valid, _ = validate_vote_count_field(df, '45% PVC COLLECTION', normalized.vote_data)
+        self.assertTrue(is_valid)
+
+    def test_staged_upload_reused(self):
+        """Test identical uploads are served from the staging area"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.test import override_settings
+        from unittest import mock
+        from .staging import read_upload, load_staged
+
+        buffer = BytesIO()
+        self.make_dataframe(3).to_excel(buffer, index=False)
+        content = buffer.getvalue()
+
+        with tempfile.TemporaryDirectory() as staging_dir, override_settings(UPLOAD_STAGING_DIR=staging_dir):
+            digest, df, from_cache = read_upload(SimpleUploadedFile('units.xlsx', content))
+            self.assertFalse(from_cache)
+            self.assertEqual(len(df), 3)
+
+            with mock.patch('app.readers.pd.read_excel') as read_excel:
+                digest_again, df_again, from_cache = read_upload(SimpleUploadedFile('copy.xlsx', content))
+                read_excel.assert_not_called()
+            self.assertTrue(from_cache)
+            self.assertEqual(digest, digest_again)
+            self.assertEqual(df_again['DELIM'].tolist(), df['DELIM'].tolist())
+
+            with override_settings(UPLOAD_STAGING_TTL=-1):
+                self.assertIsNone(load_staged(digest))
+
+    def test_expired_staged_upload_is_parsed_again(self):
+        """Test re-uploading a file after its staged copy expired parses it again"""
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from django.test import override_settings
+        from .staging import read_upload, staged_path
+
+        buffer = BytesIO()
+        self.make_dataframe(3).to_excel(buffer, index=False)
+        content = buffer.getvalue()
+
+        with tempfile.TemporaryDirectory() as staging_dir, override_settings(UPLOAD_STAGING_DIR=staging_dir,
+                                                                             UPLOAD_STAGING_TTL=60):
+            digest, _, _ = read_upload(SimpleUploadedFile('units.xlsx', content))
+            expired = time.time() - 120
+            os.utime(staged_path(digest), (expired, expired))
+
+            digest_again, df, from_cache = read_upload(SimpleUploadedFile('units.xlsx', content))
+            self.assertEqual(digest_again, digest)
+            self.assertFalse(from_cache)
+            self.assertEqual(len(df), 3)
+
+    def test_upsert_import_applies_delta(self):
+        """Test upsert mode only touches changed rows and flags their results"""
+        from .importer import bulk_import_polling_units, upsert_polling_units
+        from .utils import normalize_upload
+        bulk_import_polling_units(normalize_upload(self.make_dataframe(4), '45% PVC COLLECTION'))
+        allocation = VoteAllocation.objects.create(name="Delta", apc_percentage=100.0)
+        for unit in PollingUnit.objects.all():
+            AllocatedResult.objects.create(polling_unit=unit, vote_allocation=allocation, apc_votes=405, total_votes=405)
+        untouched_id = PollingUnit.objects.get(sno=1).id
+
+        df = self.make_dataframe(5).drop(index=3)  # S/NO 4 removed, S/NO 5 added
+        df.loc[1, '45% PVC COLLECTION'] = 500
+        stats = upsert_polling_units(normalize_upload(df, '45% PVC COLLECTION'))
+
+        self.assertEqual((stats.unchanged_count, stats.changed_count, stats.created_count, stats.removed_count),
+                         (2, 1, 1, 1))
+        self.assertEqual(PollingUnit.objects.get(sno=1).id, untouched_id)
+        self.assertEqual(PollingUnit.objects.get(sno=2).pvc_45_percent, 500)
+        self.assertTrue(PollingUnit.objects.filter(sno=5).exists())
+        self.assertFalse(PollingUnit.objects.filter(sno=4).exists())
+        self.assertEqual(list(AllocatedResult.objects.filter(needs_recompute=True)
+                              .values_list('polling_unit__sno', flat=True)), [2])
+        self.assertEqual(AllocatedResult.objects.count(), 3)
+
+    def test_csv_and_parquet_uploads(self):
+        """Test non-Excel formats are detected and parsed like workbooks"""
+        import os
+        from .readers import detect_format, read_tabular, FORMAT_CSV, FORMAT_PARQUET, FORMAT_XLSX
+        self.assertEqual(detect_format(b'PK\x03\x04rest'), FORMAT_XLSX)
+        self.assertEqual(detect_format(b'PAR1\x15\x04', 'units.bin'), FORMAT_PARQUET)
+        self.assertEqual(detect_format(b'S/NO,STA'), FORMAT_CSV)
+        self.assertIsNone(detect_format(b'\x89PNG\r\n\x1a\n', 'logo.png'))
+
+        df = self.make_dataframe(5)
+        with tempfile.TemporaryDirectory() as workdir:
+            csv_path = os.path.join(workdir, 'units.csv')
+            parquet_path = os.path.join(workdir, 'units.parquet')
+            df.to_csv(csv_path, index=False)
+            df.to_parquet(parquet_path, index=False)
+            for path in (csv_path, parquet_path):
+                parsed = read_tabular(path)
+                self.assertEqual(detect_vote_count_field(parsed.columns.tolist()), '45% PVC COLLECTION')
+                self.assertEqual(len(normalize_upload(parsed, '45% PVC COLLECTION')), 5)
+
+            # Columns that turn to text in a later chunk keep one type across chunks
+            mixed = self.make_dataframe(5)
+            mixed = pd.concat([mixed] * 20000, ignore_index=True)
+            mixed['DELIM'] = ['1'] * 99999 + ['PU 1']
+            mixed['45% PVC COLLECTION'] = ['100'] * 99999 + ['n/a']
+            mixed.to_csv(csv_path, index=False)
+            parsed = read_tabular(csv_path, csv_chunk_size=30000)
+            self.assertEqual(len(parsed), 100000)
+            self.assertEqual({type(value) for value in parsed['DELIM']}, {str})
+            normalized = normalize_upload(parsed, '45% PVC COLLECTION')
+            self.assertEqual(normalized.row_errors, ['Error in row 100001: invalid value in 45% PVC COLLECTION'])
+
+    def test_import_command_loads_directory(self):
+        """Test the import_excel command bulk-loads every file in a directory"""
+        import os
+        from django.core.management import call_command
+        from io import StringIO
+        with tempfile.TemporaryDirectory() as workdir:
+            self.make_dataframe(3).to_csv(os.path.join(workdir, 'a.csv'), index=False)
+            second = self.make_dataframe(5).iloc[3:]
+            second.to_parquet(os.path.join(workdir, 'b.parquet'), index=False)
+
+            out = StringIO()
+            call_command('import_excel', workdir, '--dry-run', '--workers', '1', stdout=out)
+            self.assertIn('Dry run: 5 valid rows', out.getvalue())
+            self.assertEqual(PollingUnit.objects.count(), 0)
+
+            call_command('import_excel', workdir, '--batch-size', '2', '--workers', '1', stdout=out)
+        self.assertIn('insert', out.getvalue())
+        self.assertEqual(sorted(PollingUnit.objects.values_list('sno', flat=True)), [1, 2, 3, 4, 5])
+        self.assertEqual(UploadSession.latest_completed().total_records, 5)
+
+    def test_import_command_stops_while_jobs_hold_the_locks(self):
+        """Test the import_excel command refuses while an upload or allocation job holds its lock"""
+        import os
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from io import StringIO
+        from .locks import DATA_LOCK, acquire_lock, lock_owner, release_lock
+        with tempfile.TemporaryDirectory() as workdir:
+            self.make_dataframe(3).to_csv(os.path.join(workdir, 'a.csv'), index=False)
+            for name, owner, message in [('import', 'upload-1', 'Another import'),
+                                         (DATA_LOCK, 'allocation-1', 'allocation job or recompute')]:
+                self.assertTrue(acquire_lock(name, owner))
+                with self.assertRaisesMessage(CommandError, message):
+                    call_command('import_excel', workdir, '--workers', '1', stdout=StringIO())
+                release_lock(name, owner)
+        self.assertFalse(PollingUnit.objects.exists())
+        self.assertIsNone(lock_owner('import'))
+        self.assertIsNone(lock_owner(DATA_LOCK))
+
+    def test_probe_detects_vote_field_from_sample(self):
+        """Test the probe reads only a sample and scores columns by content"""
+        import os
+        from .readers import probe_tabular
+        from .utils import rank_vote_count_fields
+        df = self.make_dataframe(50).rename(columns={'45% PVC COLLECTION': 'TOTAL'})
+        df['VOTES NOTE'] = 'see annex'
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'units.xlsx')
+            df.to_excel(path, index=False)
+            sample = probe_tabular(path, sample_rows=10)
+
+        self.assertEqual(len(sample), 10)
+        self.assertEqual(sample.columns.tolist(), df.columns.tolist())
+        # The text-only keyword column is ruled out by its sample values
+        self.assertEqual([col for col, _ in rank_vote_count_fields(sample.columns.tolist(), sample)], ['TOTAL'])
+        self.assertEqual(detect_vote_count_field(sample.columns.tolist(), sample), 'TOTAL')
+        self.assertEqual(detect_vote_count_field(sample.columns.tolist()), 'VOTES NOTE')
+
+        # Skip words only rule out whole words, and never a name that says votes
+        self.assertEqual(detect_vote_count_field(['S/NO', 'STATE', 'GRAND TOTAL VOTES']), 'GRAND TOTAL VOTES')
+        self.assertEqual(detect_vote_count_field(['DELIM', 'PVC VOTES']), 'PVC VOTES')
+        self.assertEqual(detect_vote_count_field(['REGISTERED VOTER AS AT 2024', 'GRAND TOTAL']), 'GRAND TOTAL')
+        self.assertIsNone(detect_vote_count_field(['PVC TOTAL', 'BALANCE UNCOLLECTED']))
+
+
+class BackgroundImportTestCase(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from django.test import override_settings
+        self.user = User.objects.create_user('admin', password='secret', is_staff=True)
+        self.client.login(username='admin', password='secret')
+        self.staging_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(UPLOAD_STAGING_DIR=self.staging_dir.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.staging_dir.cleanup()
+
+    def make_upload(self, rows=3):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        buffer = BytesIO()
+        make_upload_dataframe(rows).to_excel(buffer, index=False)
+        return SimpleUploadedFile('units.xlsx', buffer.getvalue())
+
+    def test_upload_queues_job_and_reports_progress(self):
+        """Test the upload returns at once and the job records its progress"""
+        from unittest import mock
+        from .jobs import run_import_job
+
+        with mock.patch('app.jobs.get_executor') as get_executor, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('upload_data'), {'excel_file': self.make_upload(4)})
+        upload_session = UploadSession.objects.get()
+        self.assertRedirects(response, f"{reverse('upload_data')}?job={upload_session.id}")
+        self.assertEqual(upload_session.status, UploadSession.STATUS_QUEUED)
+        get_executor.assert_called_once_with()
+        get_executor.return_value.submit.assert_called_once_with(run_import_job, upload_session.id)
+
+        # A second upload is refused while the first is queued
+        response = self.client.post(reverse('upload_data'), {'excel_file': self.make_upload(2)})
+        self.assertEqual(UploadSession.objects.count(), 1)
+        self.assertContains(response, 'still being imported')
+
+        with mock.patch('app.jobs.close_old_connections'):
+            run_import_job(upload_session.id)
+
+        progress = self.client.get(reverse('upload_status', args=[upload_session.id])).json()
+        self.assertEqual(progress['status'], UploadSession.STATUS_COMPLETED)
+        self.assertEqual(progress['rows_processed'], 4)
+        self.assertEqual(progress['error_count'], 0)
+        self.assertEqual(set(progress['phase_timings']), {'probe', 'parse', 'validate', 'import', 'load', 'swap'})
+        self.assertEqual(PollingUnit.objects.count(), 4)
+
+    def test_import_lock_is_claimed_once_and_expires_with_its_holder(self):
+        """Test only one upload can hold the import lock, a queued one stays active, and a dead holder is taken over"""
+        from datetime import timedelta
+        from unittest import mock
+        from django.utils import timezone
+        from .jobs import ImportAlreadyRunning, active_import, start_import
+        from .locks import acquire_lock
+        from .models import JobLock
+
+        first, second = UploadSession.objects.create(), UploadSession.objects.create()
+        with mock.patch('app.jobs.get_executor'):
+            start_import(first)
+            self.assertFalse(acquire_lock('import', f'upload-{second.id}'))
+            with self.assertRaises(ImportAlreadyRunning):
+                start_import(second)
+
+            # Waiting in the queue does not make an upload stale; only its lock does
+            UploadSession.objects.filter(id=first.id).update(updated_at=timezone.now() - timedelta(days=1))
+            self.assertEqual(active_import(), first)
+            JobLock.objects.filter(name='import').update(refreshed_at=timezone.now() - timedelta(days=1))
+            self.assertIsNone(active_import())
+            start_import(second)
+        self.assertEqual(active_import(), second)
+
+
+class AllocationEngineTestCase(TestCase):
+    def setUp(self):
+        for sno, base in enumerate([225.0, 0.0, 333.0, 1.0, 999.0], start=1):
+            PollingUnit.objects.create(
+                sno=sno, state="ANAMBRA", lga="AGUATA", ra="ACHINA I", delim=f"UNIT {sno}",
+                register_voter_2023=f"04-01-01-{sno:03d}", registered_voter_2024=1000,
+                pvc_collected=900, balance_uncollected=100, pvc_45_percent=base
+            )
+        self.allocation = VoteAllocation.objects.create(
+            name="Engine", apc_percentage=33.33, lp_percentage=33.33, pdp_percentage=28.34,
+            aa_percentage=2.5, bp_percentage=2.5
+        )
+
+    def test_vectorized_allocation_matches_truncation_rule(self):
+        """Test the NumPy engine reproduces int(base * (pct / 100)) exactly"""
+        from .allocation import allocate_votes, PARTY_CODES
+        writer = allocate_votes(self.allocation, batch_size=2, in_database=False)
+
+        self.assertEqual(writer.rows_written, 4)  # Units without votes are skipped
+        self.assertEqual(writer.batches, 2)
+        for result in AllocatedResult.objects.filter(vote_allocation=self.allocation).select_related('polling_unit'):
+            base = result.polling_unit.pvc_45_percent
+            expected = [int(base * (getattr(self.allocation, f'{code}_percentage') / 100)) for code in PARTY_CODES]
+            self.assertEqual([getattr(result, f'{code}_votes') for code in PARTY_CODES], expected)
+            self.assertEqual(result.total_votes, sum(expected))
+
+    def test_insert_select_matches_numpy_engine(self):
+        """Test the in-database INSERT ... SELECT path stores the same truncated results"""
+        from .allocation import allocate_votes, VOTE_FIELDS
+        allocate_votes(self.allocation, in_database=False)
+        copy = VoteAllocation.objects.get(id=self.allocation.id)
+        copy.id = None
+        copy.save()
+        writer = allocate_votes(copy)
+
+        self.assertEqual((writer.rows_written, writer.batches), (4, 1))
+        fields = ['polling_unit__sno'] + VOTE_FIELDS + ['total_votes', 'needs_recompute']
+        self.assertEqual(
+            list(AllocatedResult.objects.filter(vote_allocation=self.allocation).order_by('polling_unit__sno').values_list(*fields)),
+            list(AllocatedResult.objects.filter(vote_allocation=copy).order_by('polling_unit__sno').values_list(*fields)),
+        )
+        self.assertFalse(AllocatedResult.objects.filter(vote_allocation=copy, created_at__isnull=True).exists())
+
+    def test_largest_remainder_totals_match_base(self):
+        """Test largest-remainder apportionment gives every unit its exact base"""
+        from .allocation import allocate_votes, compute_largest_remainder_votes, PARTY_CODES
+        self.allocation.method = VoteAllocation.METHOD_LARGEST_REMAINDER
+        self.allocation.save()
+        writer = allocate_votes(self.allocation)
+
+        self.assertEqual(writer.rows_written, 4)
+        for result in AllocatedResult.objects.filter(vote_allocation=self.allocation).select_related('polling_unit'):
+            votes = [getattr(result, f'{code}_votes') for code in PARTY_CODES]
+            self.assertEqual(sum(votes), result.polling_unit.pvc_45_percent)
+            self.assertEqual(result.total_votes, result.polling_unit.pvc_45_percent)
+
+        # 10 votes split 3 ways: floors 3/3/3, the leftover goes to the first of the tied parties
+        votes = compute_largest_remainder_votes([10.0], [100 / 3, 100 / 3, 100 / 3, 0])
+        self.assertEqual(votes.tolist(), [[4.0, 3.0, 3.0, 0.0]])
+
+    def test_result_writer_streams_batches(self):
+        """Test ResultWriter consumes a generator in fixed batches and reports stats"""
+        from .allocation import ResultWriter, allocate_votes
+        units = list(PollingUnit.objects.order_by('sno'))
+        writer = ResultWriter(batch_size=2, trace_memory=True)
+        writer.write(AllocatedResult(polling_unit=unit, vote_allocation=self.allocation) for unit in units)
+
+        self.assertEqual(writer.rows_written, 5)
+        self.assertEqual(writer.batches, 3)
+        self.assertGreater(writer.peak_memory, 0)
+        self.assertGreater(writer.rows_per_second, 0)
+
+        # The realistic method writes through the same path
+        AllocatedResult.objects.all().delete()
+        self.allocation.method = VoteAllocation.METHOD_REALISTIC
+        writer = allocate_votes(self.allocation)
+        self.assertEqual(writer.rows_written, 5)
+
+    def test_virtual_allocation_matches_stored_results(self):
+        """Test compute-on-read results and totals equal the materialized ones"""
+        from .allocation import allocate_votes, allocation_results, as_results, VOTE_FIELDS
+        allocate_votes(self.allocation)
+        virtual = VoteAllocation.objects.create(
+            name="Virtual", virtual=True, apc_percentage=33.33, lp_percentage=33.33, pdp_percentage=28.34,
+            aa_percentage=2.5, bp_percentage=2.5
+        )
+        self.assertFalse(AllocatedResult.objects.filter(vote_allocation=virtual).exists())
+
+        stored = allocation_results(self.allocation).order_by('polling_unit__sno')
+        computed = list(as_results(virtual, allocation_results(virtual)))
+        self.assertEqual(len(computed), 4)
+        for expected, actual in zip(stored, computed):
+            self.assertEqual(expected.polling_unit_id, actual.polling_unit.id)
+            for field in VOTE_FIELDS + ['total_votes']:
+                self.assertEqual(getattr(expected, field), getattr(actual, field))
+
+        sums = {f'sum_{field}': Sum(field) for field in VOTE_FIELDS + ['total_votes']}
+        self.assertEqual(allocation_results(virtual).aggregate(**sums), allocation_results(self.allocation).aggregate(**sums))
+
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_user('viewer', password='x'))
+        for name in ['view_allocation_results', 'view_allocation_full_data', 'download_allocation_excel', 'download_allocation_pdf']:
+            response = self.client.get(reverse(name, args=[virtual.id]), {'search': 'ANAMBRA'})
+            self.assertEqual(response.status_code, 200, name)
+
+    def test_batch_scenarios_match_single_allocations(self):
+        """Test the batch endpoint validates, saves and computes scenarios in one go"""
+        from django.contrib.auth.models import User
+        from .allocation import allocate_votes, VOTE_FIELDS
+        from .locks import DATA_LOCK, acquire_lock
+        allocate_votes(self.allocation)
+        self.client.force_login(User.objects.create_user('analyst', password='x'))
+        url = reverse('create_allocation_batch')
+
+        response = self.client.post(url, data='[{"name": "Short", "apc": 90}]', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Should be 100%', response.json()['errors'][0])
+
+        scenarios = [
+            {'name': 'Same', 'APC': 33.33, 'lp': 33.33, 'pdp_percentage': 28.34, 'aa': 2.5, 'bp': 2.5},
+            {'name': 'Exact', 'method': 'largest_remainder', 'apc': 50, 'lp': 50},
+            {'name': 'Lazy', 'virtual': 'yes', 'apc': 100},
+        ]
+        response = self.client.post(url, data=json.dumps({'scenarios': scenarios}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        report = response.json()
+        self.assertEqual([s['results'] for s in report['scenarios']], [4, 4, 0])
+
+        same = VoteAllocation.objects.get(name='Same')
+        fields = VOTE_FIELDS + ['total_votes']
+        expected = list(AllocatedResult.objects.filter(vote_allocation=self.allocation).order_by('polling_unit__sno').values_list(*fields))
+        actual = list(AllocatedResult.objects.filter(vote_allocation=same).order_by('polling_unit__sno').values_list(*fields))
+        self.assertEqual(actual, expected)
+        self.assertTrue(VoteAllocation.objects.get(name='Lazy').virtual)
+
+        csv_file = BytesIO(b'name,apc,lp\nFrom CSV,60,40\n')
+        csv_file.name = 'scenarios.csv'
+        response = self.client.post(url, {'file': csv_file})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['scenarios'][0]['results'], 4)
+
+        # No results are written while an import holds the data lock
+        self.assertTrue(acquire_lock(DATA_LOCK, 'upload-1'))
+        response = self.client.post(url, data=json.dumps([{'name': 'Blocked', 'apc': 100}]),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(VoteAllocation.objects.filter(name='Blocked').exists())
+
+    def test_realistic_method_is_reproducible_from_seed(self):
+        """Test seeded realistic variation regenerates identical results"""
+        from .allocation import allocate_votes, variation_draws, VOTE_FIELDS
+        self.allocation.method = VoteAllocation.METHOD_REALISTIC
+        self.allocation.save()
+        allocate_votes(self.allocation)
+        self.assertIsNotNone(self.allocation.seed)
+
+        copy = VoteAllocation.objects.get(id=self.allocation.id)
+        copy.id = None
+        copy.save()
+        allocate_votes(copy)
+
+        fields = ['polling_unit__sno'] + VOTE_FIELDS + ['total_votes']
+        first = list(AllocatedResult.objects.filter(vote_allocation=self.allocation).order_by('polling_unit__sno').values_list(*fields))
+        second = list(AllocatedResult.objects.filter(vote_allocation=copy).order_by('polling_unit__sno').values_list(*fields))
+        self.assertEqual(first, second)
+        for row in first:
+            unit = PollingUnit.objects.get(sno=row[0])
+            # Every unit's votes add up to its simulated turnout of the 900 PVCs collected
+            self.assertEqual(row[-1], sum(row[1:-1]))
+            self.assertTrue(900 * 0.75 - 1 <= row[-1] <= 900 * 0.95, row)
+
+        # Draws depend only on the seed and unit id, not on how units are chunked
+        ids = [3, 5, 2048, 2049]
+        turnout, variation = variation_draws(7, ids, 20)
+        turnout_tail, variation_tail = variation_draws(7, ids[2:], 20)
+        self.assertTrue((turnout[2:] == turnout_tail).all() and (variation[2:] == variation_tail).all())
+
+    def test_simulation_percentile_bands(self):
+        """Test Monte Carlo bands are ordered, reproducible and rolled up by geography"""
+        from .simulation import create_simulation, run_simulation
+        PollingUnit.objects.filter(sno=5).update(state="LAGOS", lga="IKEJA")
+        simulation = run_simulation(create_simulation(self.allocation, runs=40, seed=11), workers=1)
+
+        self.assertEqual(simulation.status, 'completed', simulation.message)
+        summary = simulation.summary
+        self.assertEqual(summary['parties'], ['aa', 'apc', 'lp', 'pdp', 'bp'])
+        self.assertEqual(sorted(summary['states']), ['ANAMBRA', 'LAGOS'])
+        self.assertEqual(summary['lgas']['LAGOS']['IKEJA'], summary['states']['LAGOS'])
+        for p5, p50, p95 in summary['national'].values():
+            self.assertTrue(p5 <= p50 <= p95)
+        # Five units with 900 PVCs collected at 75-95% turnout
+        self.assertTrue(5 * 900 * 0.75 - 5 <= summary['national']['total'][0])
+        self.assertTrue(summary['national']['total'][2] <= 5 * 900 * 0.95)
+
+        again = run_simulation(create_simulation(self.allocation, runs=40, seed=11), workers=2)
+        self.assertEqual(again.summary, summary)
+        self.assertEqual(simulation.national_rows()[-1][0], 'TOTAL')
+
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_user('planner', password='x'))
+        response = self.client.get(reverse('view_allocation_results', args=[self.allocation.id]))
+        self.assertContains(response, 'Simulated Outcome Ranges')
+        self.assertContains(response, 'LAGOS')
+
+        # Runs are capped to what the in-memory totals can hold
+        self.assertContains(response, 'name="runs" value="1000" min="1" max="5000"')
+        with self.assertRaisesMessage(ValueError, 'between 1 and 5000'):
+            create_simulation(self.allocation, runs=100000)
+
+    def test_edits_mark_results_dirty_and_recompute_refreshes_them(self):
+        """Test unit edits flag results and recompute refreshes only what changed"""
+        from django.contrib.auth.models import User
+        from .allocation import allocate_votes, recompute_results, VOTE_FIELDS
+        exact = VoteAllocation.objects.create(name="Exact", method=VoteAllocation.METHOD_LARGEST_REMAINDER,
+                                              apc_percentage=60, lp_percentage=40)
+        realistic = VoteAllocation.objects.create(name="Real", method=VoteAllocation.METHOD_REALISTIC, seed=3,
+                                                  apc_percentage=60, lp_percentage=40)
+        for allocation in [self.allocation, exact, realistic]:
+            allocate_votes(allocation)
+
+        unit = PollingUnit.objects.get(sno=3)
+        unit.delim = "RENAMED"
+        unit.save()
+        self.assertFalse(AllocatedResult.objects.filter(needs_recompute=True).exists())
+
+        unit.pvc_45_percent = 500.0
+        unit.save()
+        emptied = PollingUnit.objects.get(sno=4)
+        emptied.pvc_45_percent = 0  # No longer has votes
+        emptied.save()
+        PollingUnit.objects.create(sno=6, state="ANAMBRA", lga="AGUATA", ra="ACHINA I", delim="NEW",
+                                   register_voter_2023="04-01-01-006", registered_voter_2024=1000,
+                                   pvc_collected=800, balance_uncollected=200, pvc_45_percent=360.0)
+        self.assertEqual(AllocatedResult.objects.filter(needs_recompute=True).count(), 6)
+
+        self.client.force_login(User.objects.create_user('editor', password='x'))
+        response = self.client.get(reverse('view_allocation_results', args=[self.allocation.id]))
+        self.assertContains(response, '2 results in this allocation are out of date')
+
+        stats = recompute_results()
+        # Unit 3 in every allocation, unit 4 only for the realistic one (900 PVCs collected)
+        self.assertEqual(stats['refreshed'], 4)
+        self.assertEqual(stats['removed'], 2)
+        self.assertEqual(stats['created'], 3)
+        self.assertFalse(AllocatedResult.objects.filter(needs_recompute=True).exists())
+
+        # The refreshed rows equal a full rebuild of each allocation
+        fields = ['polling_unit__sno'] + VOTE_FIELDS + ['total_votes']
+        for allocation in [self.allocation, exact, realistic]:
+            rebuilt = VoteAllocation.objects.get(id=allocation.id)
+            rebuilt.id = None
+            rebuilt.save()
+            allocate_votes(rebuilt)
+            self.assertEqual(
+                list(AllocatedResult.objects.filter(vote_allocation=allocation).order_by('polling_unit__sno').values_list(*fields)),
+                list(AllocatedResult.objects.filter(vote_allocation=rebuilt).order_by('polling_unit__sno').values_list(*fields)),
+            )
+
+    def test_sharded_allocation_job_matches_single_pass(self):
+        """Test a background job computed in state shards over worker processes stores the same results"""
+        from unittest import mock
+        from django.contrib.auth.models import User
+        from django.test import override_settings
+        from .allocation import allocate_votes, VOTE_FIELDS
+        from .jobs import run_allocation_job
+        from .locks import DATA_LOCK, LockBusy, acquire_lock, hold_lock, release_lock
+        from .models import AllocationJob, AllocationSummary
+        from .sharding import allocation_lock_owner
+        PollingUnit.objects.filter(sno__in=[4, 5]).update(state="LAGOS", lga="IKEJA")
+        self.client.force_login(User.objects.create_user('planner', password='x'))
+
+        with mock.patch('app.jobs.get_executor') as get_executor, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('create_allocation'), {
+                'name': 'Sharded', 'method': VoteAllocation.METHOD_REALISTIC, 'seed': '11',
+                'apc_percentage': 33.33, 'lp_percentage': 33.33, 'pdp_percentage': 28.34,
+                'aa_percentage': 2.5, 'bp_percentage': 2.5,
+            })
+        allocation = VoteAllocation.objects.get(name='Sharded')
+        self.assertRedirects(response, reverse('view_allocation_results', args=[allocation.id]))
+        job = allocation.jobs.get()
+        self.assertEqual(job.status, AllocationJob.STATUS_QUEUED)
+        get_executor.assert_called_once_with('allocation')
+        get_executor.return_value.submit.assert_called_once_with(run_allocation_job, job.id)
+        self.assertFalse(AllocatedResult.objects.filter(vote_allocation=allocation).exists())
+
+        # Reads while the job is pending sum the results but leave the summary to the job
+        response = self.client.get(reverse('view_allocation_results', args=[allocation.id]))
+        self.assertEqual(response.context['totals']['unit_count'], 0)
+        response = self.client.get(reverse('allocation_rollup', args=[allocation.id]))
+        self.assertRedirects(response, reverse('view_allocation_results', args=[allocation.id]))
+        self.assertFalse(AllocationSummary.objects.filter(vote_allocation=allocation).exists())
+
+        # Writers take turns: a recompute is refused while an import holds the data lock
+        self.assertTrue(acquire_lock(DATA_LOCK, 'upload-1'))
+        with self.assertRaises(LockBusy):
+            with hold_lock(DATA_LOCK, allocation_lock_owner(job), timeout=0):
+                pass
+        response = self.client.post(reverse('recompute_allocation', args=[allocation.id]), follow=True)
+        self.assertContains(response, 'An import or allocation job is writing results')
+        release_lock(DATA_LOCK, 'upload-1')
+
+        with override_settings(ALLOCATION_PARALLEL_MIN_UNITS=0), mock.patch('app.jobs.close_old_connections'):
+            run_allocation_job(job.id, workers=2)
+
+        progress = self.client.get(reverse('allocation_job_status', args=[allocation.id])).json()
+        self.assertEqual(progress['status'], AllocationJob.STATUS_COMPLETED, progress['message'])
+        self.assertEqual(progress['workers'], 2)
+        self.assertEqual([(shard['key'], shard['units'], shard['status']) for shard in progress['shards']],
+                         [('ANAMBRA', 3, 'written'), ('LAGOS', 2, 'written')])
+        self.assertEqual(progress['rows_written'], 5)
+
+        copy = VoteAllocation.objects.get(id=allocation.id)
+        copy.id = None
+        copy.save()
+        allocate_votes(copy)
+        fields = ['polling_unit__sno'] + VOTE_FIELDS + ['total_votes']
+        self.assertEqual(
+            list(AllocatedResult.objects.filter(vote_allocation=allocation).order_by('polling_unit__sno').values_list(*fields)),
+            list(AllocatedResult.objects.filter(vote_allocation=copy).order_by('polling_unit__sno').values_list(*fields)),
+        )
+
+    def test_projected_totals_match_stored_results(self):
+        """Test the validate preview projects the totals allocating would store, using a cached base"""
+        from unittest import mock
+        from django.contrib.auth.models import User
+        from .allocation import allocate_votes, percentage_vector, VOTE_FIELDS
+        from . import projection
+        PollingUnit.objects.filter(sno=5).update(state="LAGOS", lga="IKEJA")
+        projection.clear_projection_cache()
+
+        for method, seed in [(VoteAllocation.METHOD_TRUNCATE, None), (VoteAllocation.METHOD_LARGEST_REMAINDER, None),
+                             (VoteAllocation.METHOD_REALISTIC, 5)]:
+            self.allocation.method, self.allocation.seed = method, seed
+            self.allocation.save()
+            AllocatedResult.objects.filter(vote_allocation=self.allocation).delete()
+            allocate_votes(self.allocation)
+            stored = AllocatedResult.objects.filter(vote_allocation=self.allocation)
+            preview = projection.project_totals(percentage_vector(self.allocation), method, seed)
+            national = stored.aggregate(**{f'sum_{field}': Sum(field) for field in VOTE_FIELDS})
+            self.assertEqual(preview['national'], {code: national[f'sum_{code}_votes'] for code in ['aa', 'apc', 'lp', 'pdp', 'bp']})
+            lagos = stored.filter(polling_unit__state="LAGOS").aggregate(sum_apc=Sum('apc_votes'))
+            self.assertEqual([group['name'] for group in preview['groups']], ['ANAMBRA', 'LAGOS'])
+            self.assertEqual(preview['groups'][1]['votes']['apc'], lagos['sum_apc'])
+
+        # The base is loaded once and reloaded only after a new upload
+        with mock.patch('app.projection.ProjectionBase', wraps=projection.ProjectionBase) as loader:
+            projection.project_totals(percentage_vector(self.allocation))
+            self.assertEqual(loader.call_count, 0)
+            UploadSession.objects.create(vote_count_field_name='45% PVC COLLECTION', total_records=5)
+            projection.project_totals(percentage_vector(self.allocation))
+            self.assertEqual(loader.call_count, 1)
+
+        self.client.force_login(User.objects.create_user('typist', password='x'))
+        response = self.client.post(reverse('validate_allocation'), json.dumps({'apc_percentage': '60', 'lp_percentage': 40, 'level': 'lga'}),
+                                    content_type='application/json').json()
+        self.assertTrue(response['is_valid'])
+        self.assertEqual(response['projection']['national'], {'apc': 135 + 199 + 0 + 599, 'lp': 90 + 133 + 0 + 399})
+        self.assertEqual([group['name'] for group in response['projection']['groups']], ['ANAMBRA / AGUATA', 'LAGOS / IKEJA'])
+        for seed in (-1, 2 ** 31, 'abc'):
+            response = self.client.post(reverse('validate_allocation'),
+                                        json.dumps({'apc_percentage': 100, 'method': 'realistic', 'seed': seed}),
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.json())
+        response = self.client.post(reverse('create_allocation'), {'name': 'Bad seed', 'method': 'realistic',
+                                                                   'seed': '-5', 'apc_percentage': 100})
+        self.assertFalse(VoteAllocation.objects.filter(name='Bad seed').exists())
+
+    def test_summary_totals_follow_results(self):
+        """Test allocation summaries are written with results, refreshed on recompute and read by the pages"""
+        from django.contrib.auth.models import User
+        from .allocation import aggregate_totals, allocate_votes, allocation_results, recompute_results
+        from .models import AllocationSummary
+        virtual = VoteAllocation.objects.create(name="Virtual", virtual=True, apc_percentage=60, lp_percentage=40)
+        allocate_votes(self.allocation)
+
+        summary = AllocationSummary.objects.get(vote_allocation=self.allocation)
+        expected = aggregate_totals(self.allocation, allocation_results(self.allocation))
+        self.assertEqual(summary.totals(), {**expected, 'invalid_votes': expected['base_total'] - expected['grand_total']})
+        self.assertEqual((summary.unit_count, summary.base_votes), (4, 225 + 333 + 1 + 999))
+
+        self.client.force_login(User.objects.create_user('viewer', password='x'))
+        self.client.get(reverse('view_allocation_results', args=[virtual.id]))
+        self.assertEqual(AllocationSummary.objects.get(vote_allocation=virtual).apc_votes, 135 + 199 + 0 + 599)
+
+        # An edit drops the virtual summary at once; the stored one follows the recompute
+        unit = PollingUnit.objects.get(sno=1)
+        unit.pvc_45_percent = 1000.0
+        unit.save()
+        self.assertFalse(AllocationSummary.objects.filter(vote_allocation=virtual).exists())
+        recompute_results()
+        self.assertEqual(AllocationSummary.objects.get(vote_allocation=self.allocation).totals()['grand_total'],
+                         aggregate_totals(self.allocation, allocation_results(self.allocation))['grand_total'])
+
+        with self.assertNumQueries(3):  # session, user, then allocations joined to their summaries
+            response = self.client.get(reverse('allocations_list'))
+        self.assertContains(response, '<td class="text-end">4</td>', html=True)
+
+    def test_summary_is_stored_by_one_reader_at_a_time(self):
+        """Test a first read while another request builds the summary sums the results without storing them"""
+        from .allocation import SUMMARY_LOCK, allocation_totals
+        from .locks import acquire_lock, release_lock
+        from .models import AllocationRollup, AllocationSummary
+        virtual = VoteAllocation.objects.create(name="Virtual", virtual=True, apc_percentage=60, lp_percentage=40)
+
+        self.assertTrue(acquire_lock(SUMMARY_LOCK, 'summary-1'))
+        self.assertEqual(allocation_totals(virtual)['total_apc'], 135 + 199 + 0 + 599)
+        self.assertFalse(AllocationSummary.objects.filter(vote_allocation=virtual).exists())
+        self.assertFalse(AllocationRollup.objects.filter(vote_allocation=virtual).exists())
+
+        release_lock(SUMMARY_LOCK, 'summary-1')
+        self.assertEqual(allocation_totals(VoteAllocation.objects.get(pk=virtual.pk))['total_apc'], 135 + 199 + 0 + 599)
+        self.assertEqual(AllocationSummary.objects.get(vote_allocation=virtual).apc_votes, 135 + 199 + 0 + 599)
+        self.assertTrue(acquire_lock(SUMMARY_LOCK, 'summary-2'))
+
+    def test_excel_export_totals_match_summary(self):
+        """Test the export counts invalid votes against the same base as the summary, for every method"""
+        import openpyxl
+        from django.contrib.auth.models import User
+        from .allocation import allocate_votes
+        self.client.force_login(User.objects.create_user('exporter', password='x'))
+
+        for method, seed in [(VoteAllocation.METHOD_TRUNCATE, None), (VoteAllocation.METHOD_REALISTIC, 7)]:
+            self.allocation.method, self.allocation.seed = method, seed
+            self.allocation.save()
+            AllocatedResult.objects.filter(vote_allocation=self.allocation).delete()
+            allocate_votes(self.allocation)
+            summary = VoteAllocation.objects.get(id=self.allocation.id).summary
+
+            response = self.client.get(reverse('download_allocation_excel', args=[self.allocation.id]))
+            sheet = openpyxl.load_workbook(BytesIO(response.content)).active
+            units = list(sheet.iter_rows(min_row=2, max_row=sheet.max_row - 1, values_only=True))
+            totals = [cell.value for cell in sheet[sheet.max_row]]
+            self.assertEqual(len(units), summary.unit_count)
+            self.assertEqual(totals[29], summary.invalid_votes, method)
+            self.assertEqual(sum(row[29] for row in units), summary.invalid_votes, method)
+            self.assertEqual(totals[30], summary.total_votes, method)
+
+    def test_rollup_drill_down(self):
+        """Test the state/LGA/RA rollup is built with the results and drills down by lookup"""
+        from django.contrib.auth.models import User
+        from .allocation import allocate_votes, rollup_rows
+        PollingUnit.objects.filter(sno=5).update(state="LAGOS", lga="IKEJA", ra="ALAUSA")
+        PollingUnit.objects.filter(sno=3).update(ra="ACHINA II")
+        allocate_votes(self.allocation)
+
+        levels = {level: count for level, count in self.allocation.rollups.values_list('level').annotate(count=Count('id'))}
+        self.assertEqual(levels, {'national': 1, 'state': 2, 'lga': 2, 'ra': 3})
+        national, states = rollup_rows(self.allocation)
+        self.assertEqual(national.total_votes, self.allocation.summary.total_votes)
+        self.assertEqual(sum(state.apc_votes for state in states), national.apc_votes)
+        anambra, lgas = rollup_rows(self.allocation, 'ANAMBRA')
+        self.assertEqual((anambra.unit_count, [lga.name for lga in lgas]), (3, ['AGUATA']))
+        aguata, ras = rollup_rows(self.allocation, 'ANAMBRA', 'AGUATA')
+        self.assertEqual([(ra.name, ra.apc_votes) for ra in ras], [('ACHINA I', 74 + 0), ('ACHINA II', 110)])
+
+        self.client.force_login(User.objects.create_user('analyst', password='x'))
+        response = self.client.get(reverse('allocation_rollup', args=[self.allocation.id]), {'state': 'LAGOS'})
+        self.assertContains(response, 'IKEJA')
+        data = self.client.get(reverse('allocation_rollup_json', args=[self.allocation.id]),
+                               {'state': 'LAGOS', 'lga': 'IKEJA'}).json()
+        self.assertEqual(data['parent']['votes']['apc'], 332)
+        self.assertEqual([child['name'] for child in data['children']], ['ALAUSA'])
+        missing = self.client.get(reverse('allocation_rollup_json', args=[self.allocation.id]), {'state': 'KANO'})
+        self.assertEqual(missing.status_code, 404)
+
+    def test_moving_a_unit_rebuilds_rollups(self):
+        """Test editing a unit's state drops stale rollups of stored and virtual allocations"""
+        from .allocation import allocate_votes, rollup_rows
+        virtual = VoteAllocation.objects.create(name="Virtual", virtual=True, apc_percentage=100)
+        allocate_votes(self.allocation)
+        for allocation in (self.allocation, virtual):
+            rollup_rows(allocation)
+
+        unit = PollingUnit.objects.get(sno=5)
+        unit.state = "LAGOS"
+        unit.save()
+        for allocation in VoteAllocation.objects.filter(pk__in=[self.allocation.pk, virtual.pk]):
+            _, states = rollup_rows(allocation)
+            self.assertEqual([(state.name, state.unit_count) for state in states],
+                             [('ANAMBRA', 3), ('LAGOS', 1)])
+
+    def test_keyset_pagination_walks_results_by_sno(self):
+        """Test seek pages cover every unit once in sno order, forwards and back, keeping the search"""
+        from django.contrib.auth.models import User
+        from .allocation import allocate_votes, allocation_results, result_sort_keys
+        from .pagination import KeysetPaginator
+        PollingUnit.objects.filter(sno=4).update(sno=3)  # ties on sno fall back to id
+        allocate_votes(self.allocation)
+        results = allocation_results(self.allocation)
+        expected = list(results.order_by('polling_unit__sno', 'polling_unit_id').values_list('polling_unit_id', flat=True))
+
+        paginator = KeysetPaginator(results, 2, result_sort_keys(self.allocation), len(expected))
+        pages, params = [], {}
+        while True:
+            page = paginator.get_page(params)
+            pages.append([result.polling_unit_id for result in page])
+            if not page.has_next():
+                break
+            params = QueryDict(page.next_query())
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual((page.number, paginator.num_pages, page.end_index()), (len(pages), len(pages), len(expected)))
+        previous = paginator.get_page(QueryDict(page.previous_query()))
+        self.assertEqual(([result.polling_unit_id for result in previous], previous.number), (pages[-2], len(pages) - 1))
+
+        self.client.force_login(User.objects.create_user('reader', password='x'))
+        url = reverse('view_allocation_full_data', args=[self.allocation.id])
+        response = self.client.get(url, {'search': 'ANAMBRA'})
+        next_query = response.context['page_obj'].next_query()
+        self.assertIn('search=ANAMBRA', next_query)
+        response = self.client.get(f'{url}?{next_query}')
+        self.assertEqual(response.context['page_obj'].number, 2)
+
+    def test_search_index_prefix_matches_and_follows_edits(self):
+        """Test the full-text index matches word prefixes in any column, ranks matches and tracks unit edits"""
+        from django.contrib.auth.models import User
+        from .allocation import aggregate_totals, allocate_votes, allocation_results
+        from .search import ranked_units, search_filter
+        PollingUnit.objects.filter(sno=5).update(state="LAGOS", lga="IKEJA", delim="IKEJA TOWN HALL")
+        self.assertEqual(set(PollingUnit.objects.filter(search_filter('anam agu')).values_list('sno', flat=True)),
+                         {1, 2, 3, 4})
+        self.assertEqual(list(PollingUnit.objects.filter(search_filter('ikej')).values_list('sno', flat=True)), [5])
+        self.assertFalse(PollingUnit.objects.filter(search_filter('chi')).exists())  # prefixes, not substrings
+        self.assertEqual(ranked_units('unit')[0].sno, 1)
+
+        unit = PollingUnit.objects.get(sno=3)
+        unit.delim = "IKEJA ANNEX"
+        unit.save()
+        self.assertEqual([unit.sno for unit in ranked_units('ikeja')], [5, 3])  # the matching state and LGA rank sno 5 first
+        PollingUnit.objects.filter(sno=5).delete()
+        self.assertEqual([unit.sno for unit in ranked_units('ikeja')], [3])
+
+        allocate_votes(self.allocation)
+        self.client.force_login(User.objects.create_user('searcher', password='x'))
+        response = self.client.get(reverse('view_allocation_full_data', args=[self.allocation.id]), {'search': 'ikeja'})
+        self.assertEqual([result.polling_unit.sno for result in response.context['page_obj']], [3])
+        self.assertEqual(response.context['totals']['grand_total'],
+                         aggregate_totals(self.allocation, allocation_results(self.allocation).filter(polling_unit__sno=3))['grand_total'])
+        suggestions = self.client.get(reverse('polling_unit_suggestions'), {'q': 'ikej'}).json()
+        self.assertEqual([unit['name'] for unit in suggestions['results']], ['IKEJA ANNEX'])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTestCase(TestCase):
+    """
+    Each view's queries must reach polling units and results through an index.
+    Filtered and paged queries must SEARCH them; only unfiltered aggregates
+    and requests that read every row may scan, and then only an index.
+    """
+    LARGE_TABLES = ('app_pollingunit', 'app_allocatedresult')
+    TABLE_SCAN = r'^SCAN (app_pollingunit|app_allocatedresult)$'
+    ANY_SCAN = r'^SCAN (app_pollingunit|app_allocatedresult)\b'
+
+    def setUp(self):
+        from django.contrib.auth.models import User
+        from .allocation import allocate_votes, allocation_totals
+        from .planner import update_planner_stats
+        PollingUnit.objects.bulk_create([
+            PollingUnit(sno=sno, state=f"STATE {sno % 30}", lga=f"LGA {sno % 60}", ra=f"RA {sno % 120}", delim=f"UNIT {sno}",
+                        register_voter_2023=f"04-01-01-{sno:03d}", registered_voter_2024=1000,
+                        pvc_collected=900, balance_uncollected=100, pvc_45_percent=100.0 + sno)
+            # Enough units, spread over enough states, that SQLite plans as it does on the full register
+            for sno in range(1, 601)
+        ])
+        self.allocation = VoteAllocation.objects.create(name="Stored", apc_percentage=60, pdp_percentage=40)
+        allocate_votes(self.allocation)
+        allocate_votes(VoteAllocation.objects.create(name="Other", apc_percentage=50, lp_percentage=50))
+        self.virtual = VoteAllocation.objects.create(name="Virtual", virtual=True, apc_percentage=70, lp_percentage=30)
+        update_planner_stats()
+        # The virtual summary rolls up every unit; it is built on first read and checked on its own
+        allocation_totals(self.virtual)
+        self.client.force_login(User.objects.create_superuser('planner', password='x'))
+
+    def query_plans(self, url, params=None):
+        """EXPLAIN QUERY PLAN steps of each SELECT a request runs against the large tables"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, url)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if sql.startswith('SELECT') and any(f'"{table}"' in sql for table in self.LARGE_TABLES):
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                    plans.append((sql, [row[3] for row in cursor.fetchall()]))
+        return plans
+
+    def assertIndexedPlans(self, url, params=None, paged=False, reads_all=False):
+        for sql, plan in self.query_plans(url, params):
+            filtered = not reads_all and (' WHERE ' in sql or ' LIMIT ' in sql)
+            for step in plan:
+                self.assertNotRegex(step, self.ANY_SCAN if filtered else self.TABLE_SCAN, f'{url}: {sql}')
+            if paged and ' LIMIT ' in sql:
+                self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan, f'{url} sorts every row for one page: {sql}')
+
+    def test_listings_seek_by_sno(self):
+        """Test unit and result pages walk the (sno, id) index instead of sorting the table"""
+        unit = PollingUnit.objects.get(sno=30)
+        deep = {'after': f'{unit.sno}:{unit.id}', 'page': 3}
+        self.assertIndexedPlans(reverse('polling_units_list'), paged=True)
+        self.assertIndexedPlans(reverse('polling_units_list'), deep, paged=True)
+        for allocation in (self.allocation, self.virtual):
+            for name in ('view_allocation_results', 'view_allocation_full_data'):
+                self.assertIndexedPlans(reverse(name, args=[allocation.id]), paged=True)
+                self.assertIndexedPlans(reverse(name, args=[allocation.id]), deep, paged=True)
+
+    def test_search_and_summary_views_use_indexes(self):
+        """Test searches, totals, rollups, exports and the admin filters avoid full table scans"""
+        from .models import AllocationSummary
+        self.assertIndexedPlans(reverse('dashboard'))
+        self.assertIndexedPlans(reverse('allocations_list'))
+        self.assertIndexedPlans(reverse('polling_units_list'), {'search': 'state 1'})
+        self.assertIndexedPlans(reverse('polling_unit_suggestions'), {'q': 'unit 4'})
+        for allocation in (self.allocation, self.virtual):
+            self.assertIndexedPlans(reverse('view_allocation_full_data', args=[allocation.id]), {'search': 'lga 2'})
+            self.assertIndexedPlans(reverse('allocation_rollup', args=[allocation.id]), {'state': 'STATE 1'})
+            self.assertIndexedPlans(reverse('allocation_rollup_json', args=[allocation.id]))
+            self.assertIndexedPlans(reverse('download_allocation_excel', args=[allocation.id]), reads_all=True)
+        AllocationSummary.invalidate(virtual_only=True)
+        self.assertIndexedPlans(reverse('allocation_rollup_json', args=[self.virtual.id]), reads_all=True)
+        self.assertIndexedPlans('/admin/app/pollingunit/', {'state': 'STATE 1'})
+        self.assertIndexedPlans('/admin/app/allocatedresult/', {'polling_unit__state': 'STATE 1'})
@@ -27,10 +27,19 @@ urlpatterns = [
     path('logout/', LogoutView.as_view(next_page='login'), name='logout'),
     path('', views.dashboard, name='dashboard'),
     path('upload/', views.upload_data, name='upload_data'),
+    path('upload/<int:upload_id>/status/', views.upload_status, name='upload_status'),
+    path('upload/<int:upload_id>/select-field/', views.upload_field_selection, name='upload_field_selection'),
     path('polling-units/', views.polling_units_list, name='polling_units_list'),
+    path('polling-units/suggest/', views.polling_unit_suggestions, name='polling_unit_suggestions'),
     path('create-allocation/', views.create_allocation, name='create_allocation'),
+    path('create-allocation/batch/', views.create_allocation_batch, name='create_allocation_batch'),
     path('allocations/', views.allocations_list, name='allocations_list'),
     path('allocation-results/<int:allocation_id>/', views.view_allocation_results, name='view_allocation_results'),
+    path('allocation-results/<int:allocation_id>/recompute/', views.recompute_allocation, name='recompute_allocation'),
+    path('allocation-results/<int:allocation_id>/simulate/', views.simulate_allocation, name='simulate_allocation'),
+    path('allocation-results/<int:allocation_id>/job/', views.allocation_job_status, name='allocation_job_status'),
+    path('allocation-results/<int:allocation_id>/rollup/', views.allocation_rollup, name='allocation_rollup'),
+    path('allocation-results/<int:allocation_id>/rollup.json', views.allocation_rollup_json, name='allocation_rollup_json'),
     path('allocation-full-data/<int:allocation_id>/', views.view_allocation_full_data, name='view_allocation_full_data'),
     path('download-excel/<int:allocation_id>/', views.download_allocation_excel, name='download_allocation_excel'),
     path('download-pdf/<int:allocation_id>/', views.download_allocation_pdf, name='download_allocation_pdf'),
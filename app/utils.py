@@ -1,4 +1,5 @@
 # utils.py - Helper functions
+import numpy as np
 import pandas as pd
 from io import BytesIO
 from django.http import HttpResponse
@@ -26,7 +27,91 @@ VOTE_COUNT_FIELD_MAPPING = [
     "TOTAL ACCREDITATION"
 ]
 
-def detect_vote_count_field(df_columns):
+# Name-based scores for vote count candidates
+EXACT_MATCH_SCORE = 100
+KEYWORD_MATCH_SCORE = 60
+COUNT_TERM_SCORE = 30
+
+VOTE_KEYWORDS = ['VOTE', 'ACCREDITATION', 'CAST', 'BALLOT', 'TURN', 'ACCREDITED']
+COUNT_TERMS = ['NUMBER', 'COUNT', 'TOTAL', 'NO', 'NUM']
+# Known non-vote columns, matched as whole words of the header
+SKIP_TERMS = ['S/NO', 'STATE', 'LGA', 'RA', 'DELIM', 'REGISTER', 'REGISTERED']
+# Non-vote words that only rule out count-like names, so "PVC VOTES" still counts
+NON_VOTE_TERMS = ['PVC', 'BALANCE']
+
+
+def _name_score(col):
+    """Score a column name: exact mapping > vote keyword > count-like name"""
+    col_upper = str(col).upper().strip()
+    mapping = [field_name.upper() for field_name in VOTE_COUNT_FIELD_MAPPING]
+    if col_upper in mapping:
+        # Earlier entries in the mapping win
+        return EXACT_MATCH_SCORE + len(mapping) - mapping.index(col_upper)
+    words = set(re.findall(r'[A-Z0-9/]+', col_upper))
+    if words & set(SKIP_TERMS):
+        return 0
+    if any(keyword in col_upper for keyword in VOTE_KEYWORDS):
+        return KEYWORD_MATCH_SCORE
+    if words & set(NON_VOTE_TERMS):
+        return 0
+    if any(term in col_upper for term in COUNT_TERMS):
+        return COUNT_TERM_SCORE
+    return 0
+
+
+def _sample_score(values, registered=None):
+    """
+    Score a sample column by its numeric profile. Returns None when the
+    sample rules the column out (mostly non-numeric or negative).
+    """
+    values = values[values.notna()]
+    if len(values) == 0:
+        return 0
+    numeric = coerce_numeric_column(values)
+    valid = numeric.dropna()
+    valid_ratio = len(valid) / len(values)
+    if valid_ratio < 0.5 or (len(valid) and valid.min() < 0):
+        return None
+
+    score = 20 * valid_ratio
+    if len(valid) and (valid == valid.round()).all():
+        score += 5  # Vote counts are whole numbers
+    if registered is not None and len(valid):
+        # Votes cannot exceed the number of registered voters
+        if (valid <= registered.reindex(valid.index).fillna(float('inf'))).all():
+            score += 10
+    return score
+
+
+def rank_vote_count_fields(df_columns, sample=None):
+    """
+    Rank candidate vote count columns, best first, as (column, score) pairs.
+    Names are scored against VOTE_COUNT_FIELD_MAPPING and keywords; when a
+    sample DataFrame is given, each candidate's numeric profile adjusts its
+    score and non-numeric columns are dropped.
+    """
+    registered = None
+    if sample is not None and 'REGISTERED VOTER AS AT 2024' in sample.columns:
+        registered = coerce_numeric_column(sample['REGISTERED VOTER AS AT 2024'])
+
+    candidates = []
+    for position, col in enumerate(df_columns):
+        score = _name_score(col)
+        if score == 0:
+            continue
+        if sample is not None and col in sample.columns:
+            sample_score = _sample_score(sample[col], registered)
+            if sample_score is None:
+                continue
+            score += sample_score
+        candidates.append((position, col, score))
+
+    # Highest score first; ties keep column order
+    candidates.sort(key=lambda candidate: (-candidate[2], candidate[0]))
+    return [(col, score) for _, col, score in candidates]
+
+
+def detect_vote_count_field(df_columns, sample=None):
     """
     Detect the vote count field from Excel columns using multiple strategies
     Returns the field name if found, None if not found
@@ -34,51 +119,152 @@ def detect_vote_count_field(df_columns):
     if not df_columns:
         return None
     
-    # Convert all column names to uppercase for case-insensitive matching
-    columns_upper = [col.upper().strip() for col in df_columns]
-    
-    # Strategy 1: Look for exact matches first
-    for field_name in VOTE_COUNT_FIELD_MAPPING:
-        if field_name.upper() in columns_upper:
-            # Find the original case version
-            for col in df_columns:
-                if col.upper().strip() == field_name.upper():
-                    return col
-    
-    # Strategy 2: Look for partial matches (contains keywords)
-    vote_keywords = ['VOTE', 'ACCREDITATION', 'CAST', 'BALLOT', 'TURN', 'ACCREDITED']
-    for col in df_columns:
-        col_upper = col.upper().strip()
-        if any(keyword in col_upper for keyword in vote_keywords):
-            return col
-    
-    # Strategy 3: Look for numeric columns that might contain vote counts
-    numeric_candidates = []
-    for col in df_columns:
-        col_upper = col.upper().strip()
-        # Skip known non-vote columns
-        skip_terms = ['S/NO', 'STATE', 'LGA', 'RA', 'DELIM', 'REGISTER', 'PVC', 'BALANCE']
-        if not any(term in col_upper for term in skip_terms):
-            # Check if column name suggests it's a count
-            if any(term in col_upper for term in ['NUMBER', 'COUNT', 'TOTAL', 'NO', 'NUM']):
-                numeric_candidates.append(col)
-    
-    if numeric_candidates:
-        return numeric_candidates[0]  # Return first candidate
-    
-    return None
+    ranked = rank_vote_count_fields(df_columns, sample)
+    return ranked[0][0] if ranked else None
+
+# Text columns copied onto PollingUnit (workbook column -> model field)
+TEXT_IMPORT_COLUMNS = {
+    'STATE': 'state',
+    'LGA': 'lga',
+    'RA': 'ra',
+    'DELIM': 'delim',
+    'REGISTER VOTER AS AT 2023': 'register_voter_2023',
+}
+
+# Integer columns copied onto PollingUnit (workbook column -> model field)
+INTEGER_IMPORT_COLUMNS = {
+    'S/NO': 'sno',
+    'REGISTERED VOTER AS AT 2024': 'registered_voter_2024',
+    'NO OF PVC COLLECTED ': 'pvc_collected',
+    'BALANCE OF UNCOLECTED PVCs': 'balance_uncollected',
+}
+
+CATEGORICAL_FIELDS = ['state', 'lga', 'ra']
+
+
+def coerce_numeric_column(series):
+    """
+    Convert a column to floats in one vectorized pass, stripping thousands
+    separators and spaces. Unparseable cells become NaN.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64')
+    cleaned = series.astype(str).str.replace(',', '', regex=False).str.replace(' ', '', regex=False)
+    return pd.to_numeric(cleaned, errors='coerce')
+
+
+class NormalizedUpload:
+    """
+    Result of coercing an uploaded workbook once for both validation and import.
+
+    frame       - model-ready columns for rows that parsed cleanly
+    error_mask  - True for rows with an unparseable required value
+    skip_mask   - True for rows without an S/NO (silently ignored)
+    vote_data   - the coerced vote count column for every row
+    """
+
+    def __init__(self, frame, error_mask, skip_mask, vote_data, vote_count_field, row_errors):
+        self.frame = frame
+        self.error_mask = error_mask
+        self.skip_mask = skip_mask
+        self.vote_data = vote_data
+        self.vote_count_field = vote_count_field
+        self.row_errors = row_errors
+
+    def __len__(self):
+        return len(self.frame)
+
+
+def normalize_upload(df, vote_count_field):
+    """
+    Coerce all required columns of an uploaded workbook in one vectorized stage.
+    Missing optional columns default to 0 / empty text; present cells that fail
+    to parse flag their row in error_mask.
+    """
+    total = len(df)
+    index = df.index
+
+    sno_raw = df['S/NO'] if 'S/NO' in df.columns else pd.Series([None] * total, index=index)
+    skip_mask = sno_raw.isna() | (sno_raw.astype(str).str.strip() == '')
+
+    numeric = {}
+    bad_columns = {}
+    for column, field in INTEGER_IMPORT_COLUMNS.items():
+        if column in df.columns:
+            values = coerce_numeric_column(df[column])
+            bad_columns[column] = values.isna()
+            # int(float(...)) truncates toward zero
+            numeric[field] = np.trunc(values.fillna(0))
+        else:
+            numeric[field] = pd.Series(0.0, index=index)
+
+    if vote_count_field in df.columns:
+        vote_data = coerce_numeric_column(df[vote_count_field])
+        bad_columns[vote_count_field] = vote_data.isna()
+    else:
+        vote_data = pd.Series(float('nan'), index=index)
+        bad_columns[vote_count_field] = vote_data.isna()
+    numeric['pvc_45_percent'] = vote_data.fillna(0).round()
+
+    error_mask = pd.Series(False, index=index)
+    for column_mask in bad_columns.values():
+        error_mask |= column_mask
+    error_mask &= ~skip_mask
+
+    row_errors = []
+    for row_index in index[error_mask]:
+        failed = [column for column, column_mask in bad_columns.items() if column_mask[row_index]]
+        row_errors.append(f"Error in row {row_index + 2}: invalid value in {', '.join(failed)}")
+
+    keep = ~(skip_mask | error_mask)
+    frame = pd.DataFrame(index=index[keep])
+    for field, values in numeric.items():
+        if field == 'pvc_45_percent':
+            frame[field] = values[keep]
+        else:
+            frame[field] = pd.to_numeric(values[keep].astype('int64'), downcast='integer')
+    for column, field in TEXT_IMPORT_COLUMNS.items():
+        if column in df.columns:
+            values = df[column][keep].fillna('').astype(str).str.strip()
+        else:
+            values = pd.Series('', index=frame.index)
+        frame[field] = values.astype('category') if field in CATEGORICAL_FIELDS else values
+
+    return NormalizedUpload(frame, error_mask, skip_mask, vote_data, vote_count_field, row_errors)
+
+
+def concat_normalized(uploads, labels=None):
+    """Merge several NormalizedUpload results (e.g. one per file) into one"""
+    labels = labels or [None] * len(uploads)
+    frame = pd.concat([upload.frame for upload in uploads], ignore_index=True)
+    for field in CATEGORICAL_FIELDS:
+        frame[field] = frame[field].astype('category')
+    row_errors = []
+    for upload, label in zip(uploads, labels):
+        row_errors.extend(f"{label}: {error}" if label else error for error in upload.row_errors)
+    return NormalizedUpload(
+        frame,
+        pd.concat([upload.error_mask for upload in uploads], ignore_index=True),
+        pd.concat([upload.skip_mask for upload in uploads], ignore_index=True),
+        pd.concat([upload.vote_data for upload in uploads], ignore_index=True),
+        ', '.join(dict.fromkeys(upload.vote_count_field for upload in uploads)),
+        row_errors,
+    )
+
 
-def validate_vote_count_field(df, field_name):
+def validate_vote_count_field(df, field_name, vote_data=None):
     """
-    Validate that the selected field contains valid numeric vote count data
+    Validate that the selected field contains valid numeric vote count data.
+    Pass vote_data (e.g. NormalizedUpload.vote_data) to reuse an already
+    coerced column instead of parsing it again.
     """
     if not field_name or field_name not in df.columns:
         return False, "Field not found in Excel file"
     
     try:
         # Convert to numeric, handling commas and other formatting
-        vote_data = df[field_name].astype(str).str.replace(',', '').str.replace(' ', '')
-        vote_data = pd.to_numeric(vote_data, errors='coerce')
+        if vote_data is None:
+            vote_data = coerce_numeric_column(df[field_name])
         
         # Check if we have valid numeric data
         valid_count = vote_data.notna().sum()
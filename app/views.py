@@ -1,15 +1,15 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.core.paginator import Paginator
-from django.db.models import Sum, Q
+from django.db.models import Sum
 import pandas as pd
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment
 from io import BytesIO
 import json
-import random
+import logging
 import math
 
 # PDF imports
@@ -19,11 +19,27 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 
-from .models import PollingUnit, VoteAllocation, AllocatedResult, UploadSession
-from .utils import detect_vote_count_field, validate_vote_count_field
+from .models import PollingUnit, VoteAllocation, AllocatedResult, UploadSession, AllocationJob, AllocationSimulation
+from .importer import IMPORT_MODE_REPLACE, IMPORT_MODES
+from .allocation import (
+    PARTY_CODES, base_field, new_seed, parse_seed, recompute_results, allocation_results, unit_lookup, as_results,
+    aggregate_totals, allocation_totals, allocation_job_active, rollup_rows, result_sort_keys,
+)
+from .pagination import KeysetPaginator, cached_count
+from .search import search_filter, ranked_units
+from .scenarios import read_scenarios, records_from_json, build_scenarios, create_scenarios
+from .locks import DATA_LOCK, LockBusy, hold_lock, new_lock_owner
+from .jobs import active_import, start_import, get_progress, ImportAlreadyRunning, start_allocation, start_simulation
+from .sharding import job_progress
+from .simulation import create_simulation, get_max_simulation_runs
+from .projection import PROJECTION_LEVELS, project_totals
+from .staging import save_raw_upload, probe_upload
+from .utils import rank_vote_count_fields
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.decorators import login_required
 
+logger = logging.getLogger(__name__)
+
 def signin_view(request):
     if request.method == 'POST':
         username = request.POST.get('username')
@@ -53,7 +69,7 @@ def dashboard(request):
     recent_allocations = VoteAllocation.objects.order_by('-created_at')[:5]
     
     # Get the most recent upload session info
-    latest_upload = UploadSession.objects.order_by('-created_at').first()
+    latest_upload = UploadSession.latest_completed()
     current_vote_field = latest_upload.vote_count_field_name if latest_upload else "45% PVC COLLECTION"
 
     context = {
@@ -147,151 +163,87 @@ def dashboard(request):
 
 @login_required
 def upload_data(request):
-    """Handle Excel file upload with dynamic field detection"""
+    """Handle Excel file upload; the import itself runs as a background job"""
     if request.method == 'POST' and request.FILES.get('excel_file'):
         excel_file = request.FILES['excel_file']
         
         try:
-            df = pd.read_excel(excel_file)
-            
-            # Detect vote count field
-            detected_field = detect_vote_count_field(df.columns.tolist())
-            
-            if detected_field:
-                # Validate the detected field
-                is_valid, validation_msg = validate_vote_count_field(df, detected_field)
-                
-                if is_valid:
-                    # Proceed with import using detected field
-                    return process_excel_import(request, df, detected_field)
-                else:
-                    # Field detected but invalid, show selection interface
-                    return show_field_selection(request, df, validation_msg)
-            else:
-                # No field detected, show selection interface
-                return show_field_selection(request, df, "No vote count field automatically detected")
+            running = active_import()
+            if running:
+                messages.error(request, f'Upload {running.id} is still being imported. Please wait for it to finish.')
+                return render(request, 'vote_allocation/upload.html',
+                              {'import_modes': IMPORT_MODES, 'upload_session': running})
+
+            # Stage the file server-side; parsing happens in the worker
+            upload_session = UploadSession(
+                upload_digest=save_raw_upload(excel_file),
+                import_mode=request.POST.get('import_mode', IMPORT_MODE_REPLACE),
+            )
+            start_import(upload_session)
+            return redirect(f"{reverse('upload_data')}?job={upload_session.id}")
             
+        except ImportAlreadyRunning as e:
+            messages.error(request, str(e))
         except Exception as e:
             error_msg = f'Error reading Excel file: {str(e)}'
-            print(error_msg)
+            logger.exception('Upload could not be queued')
             messages.error(request, error_msg)
     
-    elif request.method == 'POST' and request.POST.get('vote_count_field'):
-        # User selected a field manually
-        excel_file = request.FILES.get('excel_file')
-        if excel_file:
-            try:
-                df = pd.read_excel(excel_file)
-                selected_field = request.POST.get('vote_count_field')
-                
-                # Validate selected field
-                is_valid, validation_msg = validate_vote_count_field(df, selected_field)
-                
-                if is_valid:
-                    return process_excel_import(request, df, selected_field)
-                else:
-                    messages.error(request, f'Selected field is invalid: {validation_msg}')
-                    return show_field_selection(request, df, validation_msg)
-            except Exception as e:
-                messages.error(request, f'Error processing file: {str(e)}')
-    
     elif request.method == 'POST':
         messages.error(request, 'No file was selected. Please choose an Excel file.')
 
-    return render(request, 'vote_allocation/upload.html')
+    context = {'import_modes': IMPORT_MODES}
+    job_id = request.GET.get('job')
+    if job_id and job_id.isdigit():
+        context['upload_session'] = UploadSession.objects.filter(id=job_id).first()
+    return render(request, 'vote_allocation/upload.html', context)
+
+@login_required
+def upload_status(request, upload_id):
+    """JSON progress of a background import, polled by the upload page"""
+    upload_session = get_object_or_404(UploadSession, id=upload_id)
+    progress = get_progress(upload_session)
+    if upload_session.status == UploadSession.STATUS_NEEDS_FIELD:
+        progress['field_selection_url'] = reverse('upload_field_selection', args=[upload_session.id])
+    return JsonResponse(progress)
+
+@login_required
+def upload_field_selection(request, upload_id):
+    """Let the user pick the vote count field for a staged upload"""
+    upload_session = get_object_or_404(UploadSession, id=upload_id)
+    try:
+        # Only the header and a sample are needed to pick the column
+        sample = probe_upload(upload_session.upload_digest)
+    except FileNotFoundError as e:
+        messages.error(request, str(e))
+        return redirect('upload_data')
+
+    if request.method == 'POST' and request.POST.get('vote_count_field'):
+        selected_field = request.POST.get('vote_count_field')
+        if selected_field not in sample.columns:
+            return show_field_selection(request, sample, "Field not found in Excel file")
+        upload_session.vote_count_field_name = selected_field
+        try:
+            start_import(upload_session)
+        except ImportAlreadyRunning as e:
+            messages.error(request, str(e))
+            return show_field_selection(request, sample, str(e))
+        return redirect(f"{reverse('upload_data')}?job={upload_session.id}")
+
+    return show_field_selection(request, sample, upload_session.message)
 
 def show_field_selection(request, df, error_msg=None):
     """Show field selection interface when automatic detection fails"""
+    columns = df.columns.tolist()
+    ranked = rank_vote_count_fields(columns, df)
     context = {
-        'columns': df.columns.tolist(),
+        'columns': columns,
         'error_msg': error_msg,
-        'sample_data': df.head(3).to_dict('records') if len(df) > 0 else []
+        'sample_data': df.head(3).astype(object).where(df.head(3).notna(), None).values.tolist(),
+        'suggested_field': ranked[0][0] if ranked else None,
     }
     return render(request, 'vote_allocation/field_selection.html', context)
 
-def process_excel_import(request, df, vote_count_field):
-    """Process Excel import with the specified vote count field"""
-    try:
-        # Clear existing data
-        PollingUnit.objects.all().delete()
-        AllocatedResult.objects.all().delete()
-        
-        created_count = 0
-        errors = []
-        
-        for index, row in df.iterrows():
-            try:
-                if pd.isna(row.get('S/NO')) or row.get('S/NO') == '':
-                    continue
-                
-                # Get vote count from the specified field
-                vote_count_raw = float(str(row.get(vote_count_field, 0)).replace(',', ''))
-                vote_count_rounded = round(vote_count_raw)
-                
-                polling_unit = PollingUnit.objects.create(
-                    sno=int(float(str(row.get('S/NO', 0)).replace(',', ''))),
-                    state=str(row.get('STATE', '')).strip(),
-                    lga=str(row.get('LGA', '')).strip(),
-                    ra=str(row.get('RA', '')).strip(),
-                    delim=str(row.get('DELIM', '')).strip(),
-                    register_voter_2023=str(row.get('REGISTER VOTER AS AT 2023', '')).strip(),
-                    registered_voter_2024=int(float(str(row.get('REGISTERED VOTER AS AT 2024', 0)).replace(',', ''))),
-                    pvc_collected=int(float(str(row.get('NO OF PVC COLLECTED ', 0)).replace(',', ''))),
-                    balance_uncollected=int(float(str(row.get('BALANCE OF UNCOLECTED PVCs', 0)).replace(',', ''))),
-                    pvc_45_percent=vote_count_rounded,  # Store the vote count in pvc_45_percent field
-                    aa_original=0,
-                    ad_original=0,
-                    adc_original=0,
-                    apc_original=0,
-                    lp_original=0,
-                    pdp_original=0,
-                    nrm_original=0,
-                    nnpp_original=0,
-                    prp_original=0,
-                    sdp_original=0,
-                    ypp_original=0,
-                    yp_original=0,
-                    zlp_original=0,
-                    a_original=0,
-                    aac_original=0,
-                    adp_original=0,
-                    apm_original=0,
-                    apga_original=0,
-                    app_original=0,
-                    bp_original=0,
-                )
-                created_count += 1
-                
-                if created_count % 100 == 0:
-                    print(f"Imported {created_count} records...")
-                    
-            except Exception as row_error:
-                error_msg = f"Error in row {index + 2}: {str(row_error)}"
-                print(error_msg)
-                errors.append(error_msg)
-                continue
-        
-        # Store upload session info
-        UploadSession.objects.create(
-            vote_count_field_name=vote_count_field,
-            total_records=created_count
-        )
-        
-        if created_count > 0:
-            messages.success(request, f'Successfully imported {created_count} polling units using field "{vote_count_field}".')
-            if errors:
-                messages.warning(request, f'Encountered {len(errors)} errors during import.')
-        else:
-            messages.error(request, 'No valid data was imported. Please check your Excel file format.')
-        
-        return redirect('dashboard')
-        
-    except Exception as e:
-        error_msg = f'Error importing data: {str(e)}'
-        print(error_msg)
-        messages.error(request, error_msg)
-        return redirect('upload_data')
-
 @login_required
 def polling_units_list(request):
     """List all polling units with pagination"""
@@ -300,15 +252,12 @@ def polling_units_list(request):
     # Search functionality
     search = request.GET.get('search')
     if search:
-        units = units.filter(
-            Q(state__icontains=search) |
-            Q(lga__icontains=search) |
-            Q(delim__icontains=search)
-        )
+        # Prefix match through the full-text index rather than scanning with LIKE
+        units = units.filter(search_filter(search))
 
-    paginator = Paginator(units, 25)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Seek on (sno, id) so deep pages cost the same as the first
+    paginator = KeysetPaginator(units, 25, ('sno', 'id'), cached_count(units, f'polling-units-{search or ""}'))
+    page_obj = paginator.get_page(request.GET)
 
     context = {
         'page_obj': page_obj,
@@ -420,9 +369,24 @@ def create_allocation(request):
                 messages.error(request, 'No polling units found. Please upload data first.')
                 return redirect('upload_data')
             
+            method = request.POST.get('method', VoteAllocation.METHOD_TRUNCATE)
+            if method not in dict(VoteAllocation.METHOD_CHOICES):
+                method = VoteAllocation.METHOD_TRUNCATE
+            # Only truncation can be computed in SQL, other methods are always stored
+            virtual = bool(request.POST.get('virtual')) and method == VoteAllocation.METHOD_TRUNCATE
+            seed = None
+            if method == VoteAllocation.METHOD_REALISTIC:
+                # A recorded seed lets the same random results be regenerated exactly
+                seed = parse_seed(request.POST.get('seed', '').strip())
+                if seed is None:
+                    seed = new_seed()
+            
             allocation = VoteAllocation.objects.create(
                 name=request.POST['name'],
                 description=request.POST.get('description', ''),
+                method=method,
+                virtual=virtual,
+                seed=seed,
                 aa_percentage=float(request.POST.get('aa_percentage', 0)),
                 ad_percentage=float(request.POST.get('ad_percentage', 0)),
                 adc_percentage=float(request.POST.get('adc_percentage', 0)),
@@ -449,216 +413,123 @@ def create_allocation(request):
                 messages.warning(request, 
                     f'Total percentage is {allocation.total_percentage():.1f}%. Should be 100%.')
             
-            # Use 45% PVC instead of PVC collected
-            polling_units = PollingUnit.objects.all()
-            results = []
+            if allocation.virtual:
+                messages.success(request, 'Vote allocation created successfully! Results are computed when viewed.')
+                return redirect('view_allocation_results', allocation_id=allocation.id)
             
-            for unit in polling_units:
-                if unit.pvc_45_percent > 0:  # Use 45% PVC instead of pvc_collected
-                    base_votes = unit.pvc_45_percent  # Changed from pvc_collected
-                    
-                    aa_votes = int(base_votes * (allocation.aa_percentage / 100))
-                    ad_votes = int(base_votes * (allocation.ad_percentage / 100))
-                    adc_votes = int(base_votes * (allocation.adc_percentage / 100))
-                    apc_votes = int(base_votes * (allocation.apc_percentage / 100))
-                    lp_votes = int(base_votes * (allocation.lp_percentage / 100))
-                    pdp_votes = int(base_votes * (allocation.pdp_percentage / 100))
-                    nrm_votes = int(base_votes * (allocation.nrm_percentage / 100))
-                    nnpp_votes = int(base_votes * (allocation.nnpp_percentage / 100))
-                    prp_votes = int(base_votes * (allocation.prp_percentage / 100))
-                    sdp_votes = int(base_votes * (allocation.sdp_percentage / 100))
-                    ypp_votes = int(base_votes * (allocation.ypp_percentage / 100))
-                    yp_votes = int(base_votes * (allocation.yp_percentage / 100))
-                    zlp_votes = int(base_votes * (allocation.zlp_percentage / 100))
-                    a_votes = int(base_votes * (allocation.a_percentage / 100))
-                    aac_votes = int(base_votes * (allocation.aac_percentage / 100))
-                    adp_votes = int(base_votes * (allocation.adp_percentage / 100))
-                    apm_votes = int(base_votes * (allocation.apm_percentage / 100))
-                    apga_votes = int(base_votes * (allocation.apga_percentage / 100))
-                    app_votes = int(base_votes * (allocation.app_percentage / 100))
-                    bp_votes = int(base_votes * (allocation.bp_percentage / 100))
-                    total_votes = (aa_votes + ad_votes + adc_votes + apc_votes + lp_votes + pdp_votes +
-                                 nrm_votes + nnpp_votes + prp_votes + sdp_votes + ypp_votes + yp_votes +
-                                 zlp_votes + a_votes + aac_votes + adp_votes + apm_votes + apga_votes + app_votes + bp_votes)
-                    
-                    results.append(AllocatedResult(
-                        polling_unit=unit,
-                        vote_allocation=allocation,
-                        aa_votes=aa_votes,
-                        ad_votes=ad_votes,
-                        adc_votes=adc_votes,
-                        apc_votes=apc_votes,
-                        lp_votes=lp_votes,
-                        pdp_votes=pdp_votes,
-                        nrm_votes=nrm_votes,
-                        nnpp_votes=nnpp_votes,
-                        prp_votes=prp_votes,
-                        sdp_votes=sdp_votes,
-                        ypp_votes=ypp_votes,
-                        yp_votes=yp_votes,
-                        zlp_votes=zlp_votes,
-                        a_votes=a_votes,
-                        aac_votes=aac_votes,
-                        adp_votes=adp_votes,
-                        apm_votes=apm_votes,
-                        apga_votes=apga_votes,
-                        app_votes=app_votes,
-                        bp_votes=bp_votes,
-                        total_votes=total_votes,
-                    ))
+            # Results are computed by state (or LGA) shards in the background
+            shard_by = request.POST.get('shard_by', 'state')
+            if shard_by not in dict(AllocationJob.SHARD_BY_CHOICES):
+                shard_by = 'state'
+            start_allocation(allocation, shard_by)
             
-            AllocatedResult.objects.bulk_create(results)
-            
-            messages.success(request, f'Vote allocation created successfully! Generated {len(results)} results.')
+            messages.success(request, 'Vote allocation created successfully! Results are being computed.')
             return redirect('view_allocation_results', allocation_id=allocation.id)
             
         except Exception as e:
             messages.error(request, f'Error creating allocation: {str(e)}')
 
-    return render(request, 'vote_allocation/create_allocation.html')
+    return render(request, 'vote_allocation/create_allocation.html', {
+        'method_choices': VoteAllocation.METHOD_CHOICES,
+    })
+
+
+@login_required
+def create_allocation_batch(request):
+    """
+    Create many allocations at once from a JSON body or an uploaded JSON,
+    CSV or Excel file of percentage vectors. Responds with per-scenario timings.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST a JSON list of scenarios or a scenario file'}, status=405)
+    if PollingUnit.objects.count() == 0:
+        return JsonResponse({'error': 'No polling units found. Please upload data first.'}, status=400)
+
+    try:
+        if 'file' in request.FILES:
+            uploaded_file = request.FILES['file']
+            records = read_scenarios(uploaded_file, uploaded_file.name)
+        else:
+            records = records_from_json(json.loads(request.body))
+    except Exception as e:
+        return JsonResponse({'error': f'Could not read scenarios: {str(e)}'}, status=400)
+
+    allocations, errors = build_scenarios(records)
+    if errors:
+        return JsonResponse({'errors': errors}, status=400)
+
+    try:
+        # Results are written against the current units, so not while an import swaps them
+        with hold_lock(DATA_LOCK, new_lock_owner('scenarios'), timeout=0):
+            report = create_scenarios(allocations)
+    except LockBusy:
+        return JsonResponse({'error': 'An import or allocation job is writing results. '
+                                      'Please try again once it has finished.'}, status=409)
+    logger.info("Created %d allocations in %.2fs", report['created'], report['elapsed'])
+    return JsonResponse(report, status=201)
 
 
 @login_required
 def allocations_list(request):
     """List all vote allocations"""
-    allocations = VoteAllocation.objects.order_by('-created_at')
+    # Unit and vote KPIs come from each allocation's summary in the same query
+    allocations = VoteAllocation.objects.select_related('summary').order_by('-created_at')
 
     context = {
         'allocations': allocations,
     }
     return render(request, 'vote_allocation/allocations_list.html', context)
 
-def calculate_allocated_results(allocation):
-    """Calculate and save realistic allocated results for all polling units"""
-    # Clear existing results for this allocation
-    AllocatedResult.objects.filter(vote_allocation=allocation).delete()
-    
-    # Get all polling units
-    polling_units = PollingUnit.objects.all()
-    
-    # Calculate for each unit
-    results = []
-    for unit in polling_units:
-        # Use the actual PVC collected as the base for vote distribution
-        base_votes = unit.pvc_collected
-        
-        # Add some realism - not everyone votes, typically 70-95% turnout
-        turnout_rate = random.uniform(0.75, 0.95)
-        actual_votes = int(base_votes * turnout_rate)
-        
-        # Calculate target votes for each party based on allocation percentages
-        target_aa = (allocation.aa_percentage / 100) * actual_votes
-        target_ad = (allocation.ad_percentage / 100) * actual_votes
-        target_adc = (allocation.adc_percentage / 100) * actual_votes
-        target_apc = (allocation.apc_percentage / 100) * actual_votes
-        target_lp = (allocation.lp_percentage / 100) * actual_votes
-        target_pdp = (allocation.pdp_percentage / 100) * actual_votes
-        
-        # Add realistic variation (±5-15% from target to simulate real voting patterns)
-        def add_realistic_variation(target_votes, variation_range=0.10):
-            if target_votes == 0:
-                return 0
-            variation = random.uniform(-variation_range, variation_range)
-            result = target_votes * (1 + variation)
-            return max(0, int(round(result)))
-        
-        # Calculate actual votes with variation
-        aa_votes = add_realistic_variation(target_aa)
-        ad_votes = add_realistic_variation(target_ad)
-        adc_votes = add_realistic_variation(target_adc)
-        apc_votes = add_realistic_variation(target_apc)
-        lp_votes = add_realistic_variation(target_lp)
-        pdp_votes = add_realistic_variation(target_pdp)
-        
-        # Calculate total and adjust if necessary to match actual votes
-        calculated_total = aa_votes + ad_votes + adc_votes + apc_votes + lp_votes + pdp_votes
-        
-        # Adjust the largest party's votes to match the actual vote count
-        if calculated_total != actual_votes:
-            difference = actual_votes - calculated_total
-            # Find the party with the highest allocation to adjust
-            party_votes = [
-                ('aa', aa_votes), ('ad', ad_votes), ('adc', adc_votes),
-                ('apc', apc_votes), ('lp', lp_votes), ('pdp', pdp_votes)
-            ]
-            party_votes.sort(key=lambda x: x[1], reverse=True)
-            
-            # Adjust the largest party
-            if party_votes[0][0] == 'aa':
-                aa_votes += difference
-            elif party_votes[0][0] == 'ad':
-                ad_votes += difference
-            elif party_votes[0][0] == 'adc':
-                adc_votes += difference
-            elif party_votes[0][0] == 'apc':
-                apc_votes += difference
-            elif party_votes[0][0] == 'lp':
-                lp_votes += difference
-            elif party_votes[0][0] == 'pdp':
-                pdp_votes += difference
-        
-        # Ensure no negative votes
-        aa_votes = max(0, aa_votes)
-        ad_votes = max(0, ad_votes)
-        adc_votes = max(0, adc_votes)
-        apc_votes = max(0, apc_votes)
-        lp_votes = max(0, lp_votes)
-        pdp_votes = max(0, pdp_votes)
-        
-        total_votes = aa_votes + ad_votes + adc_votes + apc_votes + lp_votes + pdp_votes
-        
-        results.append(AllocatedResult(
-            polling_unit=unit,
-            vote_allocation=allocation,
-            aa_votes=aa_votes,
-            ad_votes=ad_votes,
-            adc_votes=adc_votes,
-            apc_votes=apc_votes,
-            lp_votes=lp_votes,
-            pdp_votes=pdp_votes,
-            total_votes=total_votes,
-        ))
-    
-    # Bulk create results
-    AllocatedResult.objects.bulk_create(results)
-    print(f"Created realistic allocation results for {len(results)} polling units")
+def stale_result_count(allocation):
+    """Stored results flagged for recompute since their polling unit changed"""
+    if allocation.virtual:
+        return 0
+    return AllocatedResult.objects.filter(vote_allocation=allocation, needs_recompute=True).count()
+
+
+@login_required
+def recompute_allocation(request, allocation_id):
+    """Refresh only the out-of-date results of an allocation"""
+    allocation = get_object_or_404(VoteAllocation, id=allocation_id)
+    if request.method == 'POST':
+        try:
+            with hold_lock(DATA_LOCK, new_lock_owner('recompute'), timeout=0):
+                stats = recompute_results([allocation])
+            messages.success(request, f"Recomputed {stats['refreshed'] + stats['created']} results "
+                                      f"({stats['removed']} removed) in {stats['elapsed']:.2f}s.")
+        except LockBusy:
+            messages.error(request, 'An import or allocation job is writing results. '
+                                    'Please recompute once it has finished.')
+        except Exception as e:
+            messages.error(request, f'Error recomputing results: {str(e)}')
+    return redirect('view_allocation_results', allocation_id=allocation.id)
+
+
+@login_required
+def polling_unit_suggestions(request):
+    """The best matching polling units for a partly typed search, as JSON"""
+    units = ranked_units(request.GET.get('q', ''))
+    return JsonResponse({'results': [
+        {'id': unit.id, 'sno': unit.sno, 'state': unit.state, 'lga': unit.lga, 'name': unit.delim}
+        for unit in units
+    ]})
+
 
 # FIXED - Single view_allocation_results function
 @login_required
 def view_allocation_results(request, allocation_id):
     """View allocation details and results with party percentages displayed"""
     allocation = get_object_or_404(VoteAllocation, id=allocation_id)
-    results = AllocatedResult.objects.filter(vote_allocation=allocation).select_related('polling_unit')
+    results = allocation_results(allocation)
     
-    # Pagination for results
-    paginator = Paginator(results, 50)  # Show more results per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
     # Calculate totals and verify percentages
-    totals = results.aggregate(
-        total_aa=Sum('aa_votes'),
-        total_ad=Sum('ad_votes'),
-        total_adc=Sum('adc_votes'),
-        total_apc=Sum('apc_votes'),
-        total_lp=Sum('lp_votes'),
-        total_pdp=Sum('pdp_votes'),
-        total_nrm=Sum('nrm_votes'),
-        total_nnpp=Sum('nnpp_votes'),
-        total_prp=Sum('prp_votes'),
-        total_sdp=Sum('sdp_votes'),
-        total_ypp=Sum('ypp_votes'),
-        total_yp=Sum('yp_votes'),
-        total_zlp=Sum('zlp_votes'),
-        total_a=Sum('a_votes'),
-        total_aac=Sum('aac_votes'),
-        total_adp=Sum('adp_votes'),
-        total_apm=Sum('apm_votes'),
-        total_apga=Sum('apga_votes'),
-        total_app=Sum('app_votes'),
-        total_bp=Sum('bp_votes'),
-        grand_total=Sum('total_votes'),
-    )
+    # Read from the allocation's summary row instead of summing every result
+    totals = allocation_totals(allocation)
+
+    # Seek on (allocation, sno); the page count comes from the summary's unit count
+    paginator = KeysetPaginator(results, 50, result_sort_keys(allocation), totals['unit_count'])
+    page_obj = paginator.get_page(request.GET)
+    page_obj.object_list = list(as_results(allocation, page_obj.object_list))
     
     # Calculate actual percentages achieved
     grand_total = totals['grand_total'] or 1  # Avoid division by zero
@@ -685,64 +556,144 @@ def view_allocation_results(request, allocation_id):
         'bp': (totals['total_bp'] or 0) / grand_total * 100,
     }
 
+    simulations = allocation.simulations.order_by('-created_at')
     context = {
         'allocation': allocation,
         'page_obj': page_obj,
         'totals': totals,
         'actual_percentages': actual_percentages,
+        'stale_count': stale_result_count(allocation),
+        'simulation': simulations.filter(status=AllocationSimulation.STATUS_COMPLETED).first(),
+        'pending_simulation': simulations.filter(
+            status__in=[AllocationSimulation.STATUS_QUEUED, AllocationSimulation.STATUS_RUNNING]
+        ).first(),
+        'job': allocation.jobs.order_by('-created_at').first(),
+        'max_simulation_runs': get_max_simulation_runs(),
     }
     return render(request, 'vote_allocation/view_allocation_results.html', context)
 
+
+@login_required
+def allocation_job_status(request, allocation_id):
+    """JSON progress of the allocation's latest background job, polled by the results page"""
+    allocation = get_object_or_404(VoteAllocation, id=allocation_id)
+    job = allocation.jobs.order_by('-created_at').first()
+    if job is None:
+        return JsonResponse({'error': 'No allocation job found'}, status=404)
+    return JsonResponse(job_progress(job))
+
+
+@login_required
+def simulate_allocation(request, allocation_id):
+    """Queue a Monte Carlo simulation of the allocation in the background"""
+    allocation = get_object_or_404(VoteAllocation, id=allocation_id)
+    if request.method == 'POST':
+        try:
+            runs = int(request.POST.get('runs') or 0) or None
+            simulation = create_simulation(allocation, runs=runs)
+            start_simulation(simulation)
+            messages.success(request, f'Simulation of {simulation.runs} runs started. Refresh this page to see the results.')
+        except Exception as e:
+            messages.error(request, f'Error starting simulation: {str(e)}')
+    return redirect('view_allocation_results', allocation_id=allocation.id)
+
+
+def rollup_party_codes(allocation):
+    """Codes of the parties the allocation gives a share to, in PARTY_CODES order"""
+    return [code for code in PARTY_CODES if getattr(allocation, f'{code}_percentage') > 0]
+
+
+def rollup_dict(row, party_codes):
+    return {
+        'level': row.level,
+        'name': row.name,
+        'state': row.state,
+        'lga': row.lga,
+        'ra': row.ra,
+        'votes': {code: getattr(row, f'{code}_votes') for code in party_codes},
+        'total_votes': row.total_votes,
+        'base_votes': row.base_votes,
+        'unit_count': row.unit_count,
+    }
+
+
+@login_required
+def allocation_rollup(request, allocation_id):
+    """Drill down an allocation's totals: states, then a state's LGAs, then an LGA's RAs"""
+    allocation = get_object_or_404(VoteAllocation, id=allocation_id)
+    state = request.GET.get('state', '')
+    lga = request.GET.get('lga', '') if state else ''
+    parent, children = rollup_rows(allocation, state, lga)
+    if parent is None and allocation_job_active(allocation):
+        messages.info(request, 'The allocation is still being computed; totals appear once it finishes.')
+        return redirect('view_allocation_results', allocation_id=allocation.id)
+    if parent is None:
+        messages.error(request, f'No results found for {lga or state}.')
+        return redirect('allocation_rollup', allocation_id=allocation.id)
+
+    party_codes = rollup_party_codes(allocation)
+    rows = [
+        {'row': row, 'votes': [getattr(row, f'{code}_votes') for code in party_codes]}
+        for row in children
+    ]
+    context = {
+        'allocation': allocation,
+        'state': state,
+        'lga': lga,
+        'parent': parent,
+        'parent_votes': [getattr(parent, f'{code}_votes') for code in party_codes],
+        'party_codes': [code.upper() for code in party_codes],
+        'rows': rows,
+        'child_level': 'RA' if lga else 'LGA' if state else 'State',
+        'stale_count': stale_result_count(allocation),
+    }
+    return render(request, 'vote_allocation/allocation_rollup.html', context)
+
+
+@login_required
+def allocation_rollup_json(request, allocation_id):
+    """JSON drill-down step of an allocation's rollup, same parameters as the page"""
+    allocation = get_object_or_404(VoteAllocation, id=allocation_id)
+    state = request.GET.get('state', '')
+    lga = request.GET.get('lga', '') if state else ''
+    parent, children = rollup_rows(allocation, state, lga)
+    if parent is None and allocation_job_active(allocation):
+        return JsonResponse({'error': 'The allocation is still being computed'}, status=409)
+    if parent is None:
+        return JsonResponse({'error': f'No results found for {lga or state}'}, status=404)
+    party_codes = rollup_party_codes(allocation)
+    return JsonResponse({
+        'allocation': allocation.id,
+        'parent': rollup_dict(parent, party_codes),
+        'children': [rollup_dict(row, party_codes) for row in children],
+    })
+
+
 # NEW - Full data view like polling units but with party allocations
 @login_required
 def view_allocation_full_data(request, allocation_id):
     """View all allocated results in a table format like polling units"""
     allocation = get_object_or_404(VoteAllocation, id=allocation_id)
-    results = AllocatedResult.objects.filter(vote_allocation=allocation).select_related('polling_unit')
+    results = allocation_results(allocation)
 
     # Search functionality
     search = request.GET.get('search')
     if search:
-        results = results.filter(
-            Q(polling_unit__state__icontains=search) |
-            Q(polling_unit__lga__icontains=search) |
-            Q(polling_unit__delim__icontains=search)
-        )
-
-    paginator = Paginator(results, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    
-    # Calculate totals
-    totals = results.aggregate(
-        total_aa=Sum('aa_votes'),
-        total_ad=Sum('ad_votes'),
-        total_adc=Sum('adc_votes'),
-        total_apc=Sum('apc_votes'),
-        total_lp=Sum('lp_votes'),
-        total_pdp=Sum('pdp_votes'),
-        total_nrm=Sum('nrm_votes'),
-        total_nnpp=Sum('nnpp_votes'),
-        total_prp=Sum('prp_votes'),
-        total_sdp=Sum('sdp_votes'),
-        total_ypp=Sum('ypp_votes'),
-        total_yp=Sum('yp_votes'),
-        total_zlp=Sum('zlp_votes'),
-        total_a=Sum('a_votes'),
-        total_aac=Sum('aac_votes'),
-        total_adp=Sum('adp_votes'),
-        total_apm=Sum('apm_votes'),
-        total_apga=Sum('apga_votes'),
-        total_app=Sum('app_votes'),
-        total_bp=Sum('bp_votes'),
-        grand_total=Sum('total_votes'),
-    )
+        results = results.filter(search_filter(search, unit_lookup(allocation, '')))
+
+    # Totals of a search have to be summed; the full allocation's come from its summary
+    totals = aggregate_totals(allocation, results) if search else allocation_totals(allocation)
+
+    paginator = KeysetPaginator(results, 50, result_sort_keys(allocation), totals['unit_count'])
+    page_obj = paginator.get_page(request.GET)
+    page_obj.object_list = list(as_results(allocation, page_obj.object_list))
     
     context = {
         'allocation': allocation,
         'page_obj': page_obj,
         'search': search,
         'totals': totals,
+        'stale_count': stale_result_count(allocation),
     }
     return render(request, 'vote_allocation/allocation_full_data.html', context)
 
@@ -750,14 +701,17 @@ def view_allocation_full_data(request, allocation_id):
 def download_allocation_excel(request, allocation_id):
     """Download allocation results as Excel file with complete totals"""
     allocation = get_object_or_404(VoteAllocation, id=allocation_id)
-    results = AllocatedResult.objects.filter(vote_allocation=allocation).select_related('polling_unit').order_by('polling_unit__sno')
+    results = allocation_results(allocation).order_by(unit_lookup(allocation, 'sno'))
+    rows = list(as_results(allocation, results))
+    # Invalid votes are counted against the unit field the votes were drawn from, as in the summary
+    base = base_field(allocation)
     
     wb = openpyxl.Workbook()
     ws = wb.active
     ws.title = "Vote Allocation Results"
     
     # Get the current vote field name
-    latest_upload = UploadSession.objects.order_by('-created_at').first()
+    latest_upload = UploadSession.latest_completed()
     vote_field_name = latest_upload.vote_count_field_name if latest_upload else "45% PVC COLLECTION"
     
     headers = [
@@ -798,7 +752,7 @@ def download_allocation_excel(request, allocation_id):
         cell.alignment = Alignment(horizontal="center")
     
     # Data rows
-    for row_num, result in enumerate(results, 2):
+    for row_num, result in enumerate(rows, 2):
         unit = result.polling_unit
         ws.cell(row=row_num, column=1, value=unit.sno)
         ws.cell(row=row_num, column=2, value=unit.state)
@@ -829,42 +783,21 @@ def download_allocation_excel(request, allocation_id):
         ws.cell(row=row_num, column=27, value=result.apga_votes)
         ws.cell(row=row_num, column=28, value=result.app_votes)
         ws.cell(row=row_num, column=29, value=result.bp_votes)
-        invalid_votes = max(int(unit.pvc_45_percent) - int(result.total_votes), 0)
+        invalid_votes = max(int(getattr(unit, base)) - int(result.total_votes), 0)
         ws.cell(row=row_num, column=30, value=invalid_votes)
         ws.cell(row=row_num, column=31, value=result.total_votes)
     
     # TOTALS ROW - Calculate totals for ALL numeric columns
-    total_row = len(results) + 2
+    total_row = len(rows) + 2
     ws.cell(row=total_row, column=1, value="TOTALS")
     
     # Calculate column totals
-    total_reg_2024 = sum(unit.registered_voter_2024 for unit in PollingUnit.objects.filter(id__in=[r.polling_unit.id for r in results]))
-    total_pvc_collected = sum(unit.pvc_collected for unit in PollingUnit.objects.filter(id__in=[r.polling_unit.id for r in results]))
-    total_balance = sum(unit.balance_uncollected for unit in PollingUnit.objects.filter(id__in=[r.polling_unit.id for r in results]))
-    total_pvc_45 = sum(unit.pvc_45_percent for unit in PollingUnit.objects.filter(id__in=[r.polling_unit.id for r in results]))
+    total_reg_2024 = sum(r.polling_unit.registered_voter_2024 for r in rows)
+    total_pvc_collected = sum(r.polling_unit.pvc_collected for r in rows)
+    total_balance = sum(r.polling_unit.balance_uncollected for r in rows)
+    total_pvc_45 = sum(r.polling_unit.pvc_45_percent for r in rows)
     
-    vote_totals = results.aggregate(
-        total_aa=Sum('aa_votes'),
-        total_ad=Sum('ad_votes'),
-        total_adc=Sum('adc_votes'),
-        total_apc=Sum('apc_votes'),
-        total_lp=Sum('lp_votes'),
-        total_pdp=Sum('pdp_votes'),
-        total_nrm=Sum('nrm_votes'),
-        total_nnpp=Sum('nnpp_votes'),
-        total_prp=Sum('prp_votes'),
-        total_sdp=Sum('sdp_votes'),
-        total_ypp=Sum('ypp_votes'),
-        total_yp=Sum('yp_votes'),
-        total_zlp=Sum('zlp_votes'),
-        total_a=Sum('a_votes'),
-        total_aac=Sum('aac_votes'),
-        total_apm=Sum('apm_votes'),
-        total_apga=Sum('apga_votes'),
-        total_app=Sum('app_votes'),
-        total_bp=Sum('bp_votes'),
-        grand_total=Sum('total_votes'),
-    )
+    vote_totals = allocation_totals(allocation)
     
     # Insert totals
     ws.cell(row=total_row, column=7, value=total_reg_2024)
@@ -890,8 +823,7 @@ def download_allocation_excel(request, allocation_id):
     ws.cell(row=total_row, column=27, value=vote_totals['total_apga'])
     ws.cell(row=total_row, column=28, value=vote_totals['total_app'])
     ws.cell(row=total_row, column=29, value=vote_totals['total_bp'])
-    total_invalid = max(int(total_pvc_45) - int(vote_totals['grand_total'] or 0), 0)
-    ws.cell(row=total_row, column=30, value=total_invalid)
+    ws.cell(row=total_row, column=30, value=int(vote_totals['invalid_votes']))
     ws.cell(row=total_row, column=31, value=vote_totals['grand_total'])
     
     # Style totals row
@@ -932,7 +864,7 @@ def download_allocation_excel(request, allocation_id):
 def download_allocation_pdf(request, allocation_id):
     """Download allocation results as PDF file"""
     allocation = get_object_or_404(VoteAllocation, id=allocation_id)
-    results = AllocatedResult.objects.filter(vote_allocation=allocation).select_related('polling_unit').order_by('polling_unit__sno')[:100]  # Limit for PDF
+    results = allocation_results(allocation).order_by(unit_lookup(allocation, 'sno'))[:100]  # Limit for PDF
     
     # Create PDF
     output = BytesIO()
@@ -967,14 +899,14 @@ def download_allocation_pdf(request, allocation_id):
     
     # Table data
     # Get the current vote field name
-    latest_upload = UploadSession.objects.order_by('-created_at').first()
+    latest_upload = UploadSession.latest_completed()
     vote_field_name = latest_upload.vote_count_field_name if latest_upload else "45% PVC COLLECTION"
     
     table_data = [
         ['S/NO', 'State', 'LGA', 'Polling Unit', vote_field_name[:10], 'AA', 'AD', 'ADC', 'APC', 'LP', 'PDP', 'NRM', 'NNPP', 'PRP', 'SDP', 'YPP', 'YP', 'ZLP', 'A', 'AAC', 'APM', 'APGA', 'APP', 'BP', 'Total']
     ]
     
-    for result in results:
+    for result in as_results(allocation, results):
         unit = result.polling_unit
         table_data.append([
             str(unit.sno),
@@ -1021,28 +953,7 @@ def download_allocation_pdf(request, allocation_id):
     story.append(table)
     
     # Calculate totals
-    totals = results.aggregate(
-        total_aa=Sum('aa_votes'),
-        total_ad=Sum('ad_votes'),
-        total_adc=Sum('adc_votes'),
-        total_apc=Sum('apc_votes'),
-        total_lp=Sum('lp_votes'),
-        total_pdp=Sum('pdp_votes'),
-        total_nrm=Sum('nrm_votes'),
-        total_nnpp=Sum('nnpp_votes'),
-        total_prp=Sum('prp_votes'),
-        total_sdp=Sum('sdp_votes'),
-        total_ypp=Sum('ypp_votes'),
-        total_yp=Sum('yp_votes'),
-        total_zlp=Sum('zlp_votes'),
-        total_a=Sum('a_votes'),
-        total_aac=Sum('aac_votes'),
-        total_apm=Sum('apm_votes'),
-        total_apga=Sum('apga_votes'),
-        total_app=Sum('app_votes'),
-        total_bp=Sum('bp_votes'),
-        grand_total=Sum('total_votes'),
-    )
+    totals = allocation_totals(allocation)
     
     # Add totals
     story.append(Spacer(1, 12))
@@ -1075,36 +986,30 @@ def download_allocation_pdf(request, allocation_id):
 @csrf_exempt
 @login_required
 def validate_allocation(request):
-    """AJAX endpoint to validate allocation percentages"""
+    """
+    AJAX endpoint to validate allocation percentages and preview the
+    projected party totals, national and by state (or LGA)
+    """
     if request.method == 'POST':
-        data = json.loads(request.body)
-        
-        total = (
-            float(data.get('aa_percentage', 0)) +
-            float(data.get('ad_percentage', 0)) +
-            float(data.get('adc_percentage', 0)) +
-            float(data.get('apc_percentage', 0)) +
-            float(data.get('lp_percentage', 0)) +
-            float(data.get('pdp_percentage', 0)) +
-            float(data.get('nrm_percentage', 0)) +
-            float(data.get('nnpp_percentage', 0)) +
-            float(data.get('prp_percentage', 0)) +
-            float(data.get('sdp_percentage', 0)) +
-            float(data.get('ypp_percentage', 0)) +
-            float(data.get('yp_percentage', 0)) +
-            float(data.get('zlp_percentage', 0)) +
-            float(data.get('a_percentage', 0)) +
-            float(data.get('aac_percentage', 0)) +
-            float(data.get('adp_percentage', 0)) +
-            float(data.get('apm_percentage', 0)) +
-            float(data.get('apga_percentage', 0)) +
-            float(data.get('app_percentage', 0)) +
-            float(data.get('bp_percentage', 0))
-        )
-        
+        try:
+            data = json.loads(request.body)
+            percentages = [float(data.get(f'{code}_percentage') or 0) for code in PARTY_CODES]
+            method = data.get('method') or VoteAllocation.METHOD_TRUNCATE
+            if method not in dict(VoteAllocation.METHOD_CHOICES):
+                raise ValueError(f'Unknown method: {method}')
+            level = data.get('level') or 'state'
+            if level not in PROJECTION_LEVELS:
+                raise ValueError(f'Unknown level: {level}')
+            seed = parse_seed(data.get('seed'))
+            projection = project_totals(percentages, method, seed, level)
+        except (TypeError, ValueError) as e:
+            return JsonResponse({'error': f'Invalid request: {str(e)}'}, status=400)
+
+        total = sum(percentages)
         return JsonResponse({
             'total': round(total, 2),
-            'is_valid': abs(total - 100.0) < 0.01
+            'is_valid': abs(total - 100.0) < 0.01,
+            'projection': projection,
         })
     
     return JsonResponse({'error': 'Invalid request'})
\ No newline at end of file
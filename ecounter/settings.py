@@ -164,3 +164,55 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = 'login'
+
+# Number of rows written per bulk_create batch when importing polling units
+IMPORT_BATCH_SIZE = 2000
+
+# Parsed uploads are staged here (keyed by content hash) so the
+# vote-field selection step does not need to re-upload and re-parse
+UPLOAD_STAGING_DIR = os.path.join(MEDIA_ROOT, 'upload_staging')
+UPLOAD_STAGING_TTL = 60 * 60  # seconds
+
+# Background jobs; each kind has its own pool of worker threads
+IMPORT_WORKERS = 1
+ALLOCATION_JOB_WORKERS = 1
+SIMULATION_JOB_WORKERS = 1
+JOB_LOCK_STALE_AFTER = 30 * 60  # seconds a job lock may go unrefreshed before it is taken over
+
+# Shared across gunicorn workers so any worker can report import progress
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    }
+}
+
+# Job and import progress from the app's loggers goes to the console
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'app': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# Rows parsed per chunk when reading CSV uploads
+CSV_CHUNK_SIZE = 50000
+
+# Rows read by the header-and-sample probe used for vote field detection
+PROBE_SAMPLE_ROWS = 200
+
+# Rows written per batch when saving allocation results
+RESULT_BATCH_SIZE = 5000
+
+# Processes used by Monte Carlo allocation simulations (None = CPU count)
+SIMULATION_WORKERS = None
+SIMULATION_MAX_RUNS = 5000  # every run keeps its LGA totals in memory until the percentiles are taken
+
+# Processes used to compute allocations shard by shard (None = CPU count);
+# datasets smaller than ALLOCATION_PARALLEL_MIN_UNITS are computed in the job thread
+ALLOCATION_WORKERS = None
+ALLOCATION_PARALLEL_MIN_UNITS = 20000